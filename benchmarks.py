@@ -0,0 +1,309 @@
+'''
+This file contains a reproducible benchmark suite for building and solving the supply chain model: fixed scenarios for the
+case studies, timings of the data load, model build, model write, solve and results extraction, the peak resident memory
+and the model size, and the comparison of a run with a stored baseline to catch performance regressions.
+'''
+
+#Import the necessary packages
+import json
+import multiprocessing
+import os
+import platform
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyomo.environ as pyo
+from pyomo.core.expr.visitor import identify_variables
+from pyomo.version import version as pyomo_version
+
+from create_sc_model_full import create_supply_chain_model
+from profiling import RunProfiler, peak_rss_mb
+from solver_backends import available_solvers, get_solver, solve_model
+
+#Benchmark scenarios: Cases 1 to 4 minimize supply chain cost (Cases 1 and 2) or maximize mill profit (Cases 3 and 4), with
+#SAF investments at refineries fixed to 0 (Cases 1 and 3) or allowed (Cases 2 and 4), the unconstrained SAF premium case
+#(Case 5) and the integer cut loop of run_integer_cuts
+SCENARIOS = {
+    'Case1_blend_0': {'profit_obj': False, 'refinery_investment': False, 'blend': 0},
+    'Case1_blend_50': {'profit_obj': False, 'refinery_investment': False, 'blend': 0.5},
+    'Case2_blend_0': {'profit_obj': False, 'refinery_investment': True, 'blend': 0},
+    'Case2_blend_50': {'profit_obj': False, 'refinery_investment': True, 'blend': 0.5},
+    'Case3_blend_0': {'profit_obj': True, 'refinery_investment': False, 'blend': 0},
+    'Case3_blend_50': {'profit_obj': True, 'refinery_investment': False, 'blend': 0.5},
+    'Case4_blend_0': {'profit_obj': True, 'refinery_investment': True, 'blend': 0},
+    'Case4_blend_50': {'profit_obj': True, 'refinery_investment': True, 'blend': 0.5},
+    'unconstrained_premium': {'profit_obj': True, 'refinery_investment': False, 'blend': 0, 'saf_prem': 2000},
+    'integer_cuts': {'profit_obj': False, 'refinery_investment': False, 'blend': 0.5, 'integer_cuts': 3},
+}
+
+#Benchmark measurements, timings are in seconds and memory in MB
+TIMINGS = ['data_load_time', 'build_time', 'write_time', 'solve_time', 'extract_time']
+SIZES = ['variables', 'binaries', 'constraints', 'nonzeros']
+
+
+def benchmark_solver():
+    '''
+    This function selects the open-source solver used for the benchmarks, so they run on any machine.
+
+    Returns: name of the first available of HiGHS (appsi_highs) and CBC
+    '''
+    available = available_solvers(['appsi_highs', 'cbc'])
+    if not available:
+        raise RuntimeError('Neither HiGHS (appsi_highs) nor CBC is available to run the benchmarks')
+    return available[0]
+
+
+def model_size(m):
+    '''
+    This function counts the size of the model passed to the solver.
+
+    Inputs:
+
+            m: Pyomo model
+
+    Returns: dictionary with the number of free variables, free binary variables, active constraints and nonzeros
+    '''
+    variables = set()
+    nonzeros = 0
+    constraints = 0
+    for c in m.component_data_objects(pyo.Constraint, active=True):
+        constraints += 1
+        free = [v for v in identify_variables(c.body, include_fixed=False)]
+        nonzeros += len(free)
+        variables.update(id(v) for v in free)
+    binaries = sum(1 for v in m.component_data_objects(pyo.Var) if id(v) in variables and v.is_binary())
+    return {'variables': len(variables), 'binaries': binaries, 'constraints': constraints, 'nonzeros': nonzeros}
+
+
+def _fix_scenario(m, settings):
+    '''
+    Applies the design fixes of the run scripts: no SAF capacity at airports, no refinery investments unless allowed and
+    no mill specific incentives
+    '''
+    for i in m.AIRPORTS:
+        m.z[i].fix(0)
+    if not settings['refinery_investment']:
+        for i in m.REFINERIES:
+            m.y_ref[i].fix(0)
+    for i in m.MILLS:
+        m.s[i].fix(0)
+
+
+def _add_integer_cut(m):
+    '''
+    Adds the integer cut of run_integer_cuts excluding the current mill investment decisions
+    '''
+    cut_expr = 0
+    for i in m.MILLS:
+        if pyo.value(m.y[i]) < 0.5:
+            cut_expr += m.y[i]
+        else:
+            cut_expr += (1.0 - m.y[i])
+    m.int_cuts.add(cut_expr >= 1)
+
+
+def _extract_results(m):
+    '''
+    Extracts the mill to mill volumes, mill to airport volumes and key mill results the way the run scripts save them
+    '''
+    mill_volumes = {i: [pyo.value(m.vol_eth_sold[i, j]) if i != j else 0 for j in m.MILLS] for i in m.MILLS}
+    airport_volumes = {i: [pyo.value(m.vol_saf_sold_mills_air[i, a]) for a in m.AIRPORTS] for i in m.MILLS}
+    key_results = {key: [] for key in ['OPEX', 'CAPEX', 'logistic', 'individual profit', 'profit', 'sc cost', 'objective', 'SAF', 'et', 'sug']}
+    for i in m.MILLS:
+        key_results['OPEX'].append(pyo.value(m.individual_opex_mill[i]))
+        key_results['CAPEX'].append(pyo.value(m.CAPEX[i]))
+        key_results['logistic'].append(pyo.value(m.individual_mill_to_mill_log_cost[i]) + pyo.value(m.individual_mill_to_airport_log_cost[i]) + pyo.value(m.individual_mill_to_ref_log_cost[i]))
+        key_results['individual profit'].append(pyo.value(m.ind_profs[i]))
+        key_results['profit'].append(pyo.value(m.profit_expression))
+        key_results['sc cost'].append(pyo.value(m.sc_cost_expression))
+        key_results['objective'].append(pyo.value(m.objective))
+        for product in ['SAF', 'et', 'sug']:
+            key_results[product].append(pyo.value(m.x[i, 'saf' if product == 'SAF' else product]))
+    return pd.DataFrame(mill_volumes), pd.DataFrame(airport_volumes), pd.DataFrame(key_results)
+
+
+def run_scenario(name, data, solver_name=None, gap=0.0001, time_limit=600, max_saf_capacity=700000, solve=True):
+    '''
+    This function runs one benchmark scenario: builds the model, writes it as an LP file, solves it and extracts its
+    results, timing each step.
+
+    Inputs:
+
+            name: scenario name, one of SCENARIOS
+            data: excel sheet containing the model data (see create_supply_chain_model)
+            solver_name: solver name (defaults to benchmark_solver())
+            gap: relative MIP gap
+            time_limit: time limit per solve in seconds
+            max_saf_capacity: Maximum size for SAF technology at each mill, units: m3 eth
+            solve: False to only build and write the model, e.g. to measure the build memory of large instances
+
+    Returns: dictionary of the measurements of the scenario
+    '''
+    settings = SCENARIOS[name]
+    solver_name = solver_name or benchmark_solver()
+
+    with RunProfiler(name) as profiler:
+        with profiler.phase('build'):
+            m = create_supply_chain_model(data, settings.get('saf_prem', 0), 0, settings['blend'], max_saf_capacity, profit_obj=settings['profit_obj'],
+                                          grass_roots_factor=0.5, breakpoints=10, ref_blend=True, mutable_params=[])
+            _fix_scenario(m, settings)
+    measurements = {'scenario': name, 'solver': solver_name}
+    measurements['data_load_time'] = profiler.phases['read data']['wall_time']
+    measurements['build_time'] = profiler.phases['build']['wall_time'] - measurements['data_load_time']
+    measurements.update(model_size(m))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        m.write(os.path.join(tmp, name + '.lp'), io_options={'symbolic_solver_labels': False})
+        measurements['write_time'] = time.perf_counter() - start
+    if not solve:
+        measurements['peak_rss_mb'] = peak_rss_mb()
+        return measurements
+
+    #Solve the scenario, the integer cut loop solves the model once per cut
+    solver = get_solver(solver_name, gap=gap, time_limit=time_limit)
+    objectives = []
+    measurements['solve_time'] = 0
+    for cut in range(settings.get('integer_cuts', 0) + 1):
+        if cut == 1:
+            m.int_cuts = pyo.ConstraintList()
+        if cut > 0:
+            _add_integer_cut(m)
+        start = time.perf_counter()
+        results = solve_model(m, solver)
+        measurements['solve_time'] += time.perf_counter() - start
+        measurements['termination'] = str(results.solver.termination_condition)
+        objectives.append(pyo.value(m.objective) if len(results.solution) > 0 else None)
+    measurements['objective'] = objectives[0]
+    if len(objectives) > 1:
+        measurements['last_objective'] = objectives[-1]
+
+    start = time.perf_counter()
+    _extract_results(m)
+    measurements['extract_time'] = time.perf_counter() - start
+    measurements['peak_rss_mb'] = peak_rss_mb()
+    return measurements
+
+
+def _run_repeats(name, data, solver_name, gap, time_limit, repeat, solve):
+    '''
+    Runs a scenario repeat times and keeps the fastest time of each step, the largest peak memory and the last results
+    '''
+    runs = [run_scenario(name, data, solver_name, gap, time_limit, solve=solve) for r in range(repeat)]
+    measurements = dict(runs[-1])
+    for key in TIMINGS:
+        if key in measurements:
+            measurements[key] = min(run[key] for run in runs)
+    if measurements['peak_rss_mb'] is not None:
+        measurements['peak_rss_mb'] = max(run['peak_rss_mb'] for run in runs)
+    return measurements
+
+
+def run_benchmarks(data, scenarios=None, solver_name=None, gap=0.0001, time_limit=600, repeat=1, isolate=True, solve=True):
+    '''
+    This function runs the benchmark suite.
+
+    Inputs:
+
+            data: excel sheet containing the model data (see create_supply_chain_model)
+            scenarios: list of scenario names (defaults to all of SCENARIOS)
+            solver_name: solver name (defaults to benchmark_solver())
+            gap: relative MIP gap
+            time_limit: time limit per solve in seconds
+            repeat: number of runs of each scenario, the fastest time of each step is kept
+            isolate: True to run each scenario in a fresh process so its peak memory is measured separately (where
+                     processes can be forked)
+            solve: False to only build and write the models (memory and build time benchmark)
+
+    Returns: pandas DataFrame with one row of measurements per scenario
+    '''
+    solver_name = solver_name or benchmark_solver()
+    rows = []
+    for name in scenarios or SCENARIOS:
+        if isolate and 'fork' in multiprocessing.get_all_start_methods():
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('fork')) as pool:
+                rows.append(pool.submit(_run_repeats, name, data, solver_name, gap, time_limit, repeat, solve).result())
+        else:
+            rows.append(_run_repeats(name, data, solver_name, gap, time_limit, repeat, solve))
+        print(rows[-1])
+    return pd.DataFrame(rows)
+
+
+def save_baseline(results, path):
+    '''
+    This function stores benchmark results as the baseline later runs are compared with.
+
+    Inputs:
+
+            results: pandas DataFrame from run_benchmarks
+            path: path of the JSON baseline file
+
+    Returns: None
+    '''
+    baseline = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'machine': platform.node(),
+        'python': platform.python_version(),
+        'pyomo': pyomo_version,
+        'results': json.loads(results.set_index('scenario').to_json(orient='index')),
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2)
+
+
+def load_baseline(path):
+    '''
+    This function loads a baseline stored by save_baseline.
+
+    Inputs:
+
+            path: path of the JSON baseline file
+
+    Returns: pandas DataFrame with one row of measurements per scenario
+    '''
+    with open(path) as f:
+        baseline = json.load(f)
+    return pd.DataFrame.from_dict(baseline['results'], orient='index').rename_axis('scenario').reset_index()
+
+
+def compare_to_baseline(results, baseline, threshold=0.25, tol=0.0001):
+    '''
+    This function compares benchmark results with a baseline. A timing or the peak memory is a regression when it grew by
+    more than threshold, an objective is a regression when it differs by more than tol, and a change of the model size is
+    reported as a change.
+
+    Inputs:
+
+            results: pandas DataFrame from run_benchmarks
+            baseline: pandas DataFrame from load_baseline
+            threshold: relative growth of a timing or of the peak memory flagged as a regression
+            tol: relative objective difference flagged as a regression
+
+    Returns: pandas DataFrame with the baseline and current value, their ratio and the status of each scenario and metric
+    '''
+    baseline = baseline.set_index('scenario')
+    rows = []
+    for _, current in results.iterrows():
+        name = current['scenario']
+        if name not in baseline.index:
+            continue
+        for metric in TIMINGS + ['peak_rss_mb'] + SIZES + ['objective']:
+            if metric not in baseline.columns or pd.isna(baseline.loc[name, metric]) or pd.isna(current.get(metric)):
+                continue
+            old = float(baseline.loc[name, metric])
+            new = float(current[metric])
+            ratio = new/old if old else None
+            if metric == 'objective':
+                status = 'regression' if abs(new - old) > tol*max(abs(old), 1) else 'ok'
+            elif metric in SIZES:
+                status = 'changed' if new != old else 'ok'
+            elif ratio is not None and ratio > 1 + threshold:
+                status = 'regression'
+            elif ratio is not None and ratio < 1 - threshold:
+                status = 'improvement'
+            else:
+                status = 'ok'
+            rows.append({'scenario': name, 'metric': metric, 'baseline': old, 'current': new, 'ratio': ratio, 'status': status})
+    return pd.DataFrame(rows, columns=['scenario', 'metric', 'baseline', 'current', 'ratio', 'status'])
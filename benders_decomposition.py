@@ -0,0 +1,460 @@
+'''
+This file contains a Benders decomposition solver for the supply chain model built by create_supply_chain_model.
+
+The master problem keeps the investment binaries (y, y_ref, z), the CAPEX segments (csi, aux and their airport and refinery
+counterparts) and the production at each mill, refinery and airport. The subproblem is the continuous flow LP over the
+vol_* variables, with the master decisions held fixed through linking constraints whose duals provide the cuts.
+Keeping production in the master together with the aggregated supply/demand balance of each commodity means the flow LP
+is a transportation problem that is feasible for every master decision, apart from the per-mill profit constraints, which
+are handled with phase-1 feasibility cuts. Each master design is also evaluated as the full model with its binaries fixed,
+which provides the incumbent (upper bound) long before the feasibility cuts alone would.
+'''
+
+#Import the necessary packages
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pyomo.environ as pyo
+from pyomo.core.expr.visitor import identify_variables
+from pyomo.repn import generate_standard_repn
+import pandas as pd
+
+from solver_backends import get_solver
+
+#Flow variables handled by the subproblem, one commodity each
+FLOW_VARIABLES = ['vol_eth_sold', 'vol_eth_sold_air', 'vol_eth_sold_ref', 'vol_saf_sold_mills_air', 'vol_saf_sold_mills_ref', 'vol_saf_sold_ref_air']
+
+#Subproblems and fixed design model held by each worker process (set before the pool is forked)
+_SUBPROBLEMS = None
+
+
+class BendersStructure:
+    '''
+    Positional description of a supply chain model split into a master problem and flow subproblem blocks.
+    Positions refer to the order of m.component_data_objects(Var) and m.component_data_objects(Constraint, active=True),
+    which is preserved by m.clone().
+    '''
+    def __init__(self, m, split_commodities=True):
+        self.sense = 1 if m.objective.sense == pyo.minimize else -1
+        variables = list(m.component_data_objects(pyo.Var))
+        position = {id(v): k for k, v in enumerate(variables)}
+
+        #Commodity of every flow variable
+        family = {}
+        for f, name in enumerate(FLOW_VARIABLES):
+            for v in getattr(m, name).values():
+                family[position[id(v)]] = f
+        self.family = family
+
+        #Classify the constraints: master (no flow variables) or subproblem (with the commodities they touch)
+        parent = list(range(len(FLOW_VARIABLES)))
+        def find(f):
+            while parent[f] != f:
+                f = parent[f]
+            return f
+        constraint_info = []
+        for con in m.component_data_objects(pyo.Constraint, active=True):
+            vars_in = [position[id(v)] for v in identify_variables(con.body, include_fixed=False)]
+            families = sorted({family[k] for k in vars_in if k in family})
+            constraint_info.append((families, [k for k in vars_in if k not in family]))
+            for f in families:
+                parent[find(f)] = find(families[0] if split_commodities else 0)
+
+        #Group the commodities into independent subproblem blocks
+        roots = sorted({find(f) for f in range(len(FLOW_VARIABLES))})
+        self.block_of_family = {f: roots.index(find(f)) for f in range(len(FLOW_VARIABLES))}
+        self.n_blocks = len(roots)
+        self.constraint_block = []
+        linked = [set() for b in range(self.n_blocks)]
+        for families, master_vars in constraint_info:
+            if not families:
+                self.constraint_block.append(None)
+                continue
+            block = self.block_of_family[families[0]]
+            self.constraint_block.append(block)
+            linked[block].update(master_vars)
+        self.linked = [sorted(keys) for keys in linked]
+
+        #Split the (linear) objective into its master and subproblem parts, in minimization form
+        repn = generate_standard_repn(m.objective.expr, quadratic=False)
+        if not repn.is_linear():
+            raise ValueError('Benders decomposition requires a linear objective')
+        self.objective_constant = self.sense*pyo.value(repn.constant)
+        self.master_objective = []
+        self.block_objective = [[] for b in range(self.n_blocks)]
+        flow_cost = {}
+        for v, coef in zip(repn.linear_vars, repn.linear_coefs):
+            k = position[id(v)]
+            coef = self.sense*pyo.value(coef)
+            if k in family:
+                self.block_objective[self.block_of_family[family[k]]].append((k, coef))
+                flow_cost[k] = flow_cost.get(k, 0) + coef
+            else:
+                self.master_objective.append((k, coef))
+
+        #Lower bounds on the cost of each commodity: every unit shipped through a balance constraint costs at least the
+        #cheapest arc in that constraint. Constraints on disjoint sets of arcs (e.g. all supply balances) form one side.
+        self.flow_cost_bounds = {f: [] for f in range(len(FLOW_VARIABLES))}
+        used = {f: [] for f in range(len(FLOW_VARIABLES))}
+        for con, (families, master_vars) in zip(m.component_data_objects(pyo.Constraint, active=True), constraint_info):
+            if len(families) != 1:
+                continue
+            f = families[0]
+            con_repn = generate_standard_repn(con.body, quadratic=False)
+            flows = [(position[id(v)], pyo.value(coef)) for v, coef in zip(con_repn.linear_vars, con_repn.linear_coefs) if position[id(v)] in family]
+            rest = [(position[id(v)], pyo.value(coef)) for v, coef in zip(con_repn.linear_vars, con_repn.linear_coefs) if position[id(v)] not in family]
+            scale = flows[0][1]
+            if any(abs(coef - scale) > 1e-12 for k, coef in flows) or not con_repn.is_linear():
+                continue
+            if scale > 0 and con.has_lb():
+                bound_value = pyo.value(con.lower)
+            elif scale < 0 and con.has_ub():
+                bound_value = pyo.value(con.upper)
+            else:
+                continue
+            cheapest = min(flow_cost.get(k, 0) for k, coef in flows)
+            if cheapest <= 0:
+                continue
+            #sum(flows) >= (bound - constant - rest)/scale
+            arcs = {k for k, coef in flows}
+            side = next((s for s, taken in enumerate(used[f]) if not taken & arcs), None)
+            if side is None:
+                side = len(used[f])
+                used[f].append(set())
+                self.flow_cost_bounds[f].append([])
+            used[f][side].update(arcs)
+            self.flow_cost_bounds[f][side].append((cheapest/scale, bound_value - pyo.value(con_repn.constant), rest))
+
+
+def create_benders_master(m, structure):
+    '''
+    This function builds the Benders master problem for a supply chain model.
+
+    Inputs:
+
+            m: Pyomo model from create_supply_chain_model with any scenario specific fixes already applied
+            structure: BendersStructure of m
+
+    Returns: Pyomo model master, a copy of m without the flow constraints, with one cost estimate eta per subproblem block
+    '''
+    master = m.clone()
+    variables = list(master.component_data_objects(pyo.Var))
+    for con, block in zip(list(master.component_data_objects(pyo.Constraint, active=True)), structure.constraint_block):
+        if block is not None:
+            con.deactivate()
+
+    #Aggregated supply/demand balance of each commodity, implied by the flow constraints
+    master.transport_balances = pyo.ConstraintList()
+    master.transport_balances.add(sum(master.x[i, 'etref'] for i in master.MILLS) == sum(master.x[i, 'etpc'] for i in master.MILLS))
+    master.transport_balances.add(sum(master.x[i, 'eta'] for i in master.MILLS) == sum(master.v[a, 'et'] for a in master.AIRPORTS))
+    master.transport_balances.add(sum(master.x[i, 'etr'] for i in master.MILLS) == sum(master.x_ref[r, 'et'] for r in master.REFINERIES))
+    master.transport_balances.add(sum(master.x[i, 'saf ref'] for i in master.MILLS) == sum(master.x_ref[r, 'saf ref'] for r in master.REFINERIES))
+    saf_supply = sum(master.x_ref[r, 'blended saf'] for r in master.REFINERIES)
+    saf_target = sum(master.individual_saf_demand[a]*master.blend_requirement for a in master.AIRPORTS)
+    demand_vars = {id(v) for a in master.AIRPORTS for v in identify_variables(master.saf_demand[a].body)}
+    if id(master.v[next(iter(master.AIRPORTS)), 'saf']) in demand_vars:
+        #Blending at airports: SAF shipped from mills and produced at airports also meets the demand
+        master.transport_balances.add(saf_supply + sum(master.x[i, 'saf air'] for i in master.MILLS) + sum(master.v[a, 'saf'] for a in master.AIRPORTS) == saf_target)
+    else:
+        master.transport_balances.add(saf_supply == saf_target)
+
+    master.BLOCKS = pyo.RangeSet(0, structure.n_blocks - 1)
+    nonnegative = all(coef >= 0 for objective in structure.block_objective for k, coef in objective)
+    master.eta = pyo.Var(master.BLOCKS, within=pyo.NonNegativeReals if nonnegative else pyo.Reals)
+    master.cuts = pyo.ConstraintList()
+
+    #Cheapest-arc lower bounds on the cost of each commodity
+    master.FAMILIES = pyo.RangeSet(0, len(FLOW_VARIABLES) - 1)
+    master.flow_cost = pyo.Var(master.FAMILIES, within=pyo.NonNegativeReals)
+    master.flow_cost_bounds = pyo.ConstraintList()
+    for f, sides in structure.flow_cost_bounds.items():
+        for side in sides:
+            master.flow_cost_bounds.add(master.flow_cost[f] >= sum(factor*(rhs - sum(coef*variables[k] for k, coef in rest)) for factor, rhs, rest in side))
+    for b in master.BLOCKS:
+        master.flow_cost_bounds.add(master.eta[b] >= sum(master.flow_cost[f] for f in master.FAMILIES if structure.block_of_family[f] == b))
+    master.objective.deactivate()
+    master.benders_objective = pyo.Objective(
+        expr=structure.objective_constant + sum(coef*variables[k] for k, coef in structure.master_objective) + sum(master.eta[b] for b in master.BLOCKS),
+        sense=pyo.minimize)
+    master.variable_list = variables
+
+    return master
+
+
+def create_benders_subproblem(m, structure, block):
+    '''
+    This function builds one Benders subproblem block (flow LP) for a supply chain model.
+
+    Inputs:
+
+            m: Pyomo model from create_supply_chain_model
+            structure: BendersStructure of m
+            block: index of the subproblem block
+
+    Returns: Pyomo model sub, always minimized, with the linked master values as the mutable Param benders_value.
+             Every constraint carries elastic slacks (fixed to zero) used by the phase-1 feasibility problem.
+    '''
+    sub = m.clone()
+    variables = list(sub.component_data_objects(pyo.Var))
+    constraints = []
+    for con, con_block in zip(list(sub.component_data_objects(pyo.Constraint, active=True)), structure.constraint_block):
+        if con_block == block:
+            constraints.append(con)
+        else:
+            con.deactivate()
+    for v in variables:
+        if v.is_binary():
+            v.domain = pyo.UnitInterval
+
+    #Hold the linked master variables at the master values
+    linked = structure.linked[block]
+    sub.BENDERS_KEYS = pyo.RangeSet(0, len(linked) - 1)
+    sub.benders_value = pyo.Param(sub.BENDERS_KEYS, initialize=0, mutable=True)
+    def benders_link(sub, k):
+        return variables[linked[k]] == sub.benders_value[k]
+    sub.benders_link = pyo.Constraint(sub.BENDERS_KEYS, rule=benders_link)
+
+    #Elastic slacks for the phase-1 feasibility problem
+    sub.FEASIBILITY_KEYS = pyo.RangeSet(0, len(constraints) - 1)
+    sub.benders_slack_pos = pyo.Var(sub.FEASIBILITY_KEYS, within=pyo.NonNegativeReals, initialize=0)
+    sub.benders_slack_neg = pyo.Var(sub.FEASIBILITY_KEYS, within=pyo.NonNegativeReals, initialize=0)
+    for c, con in enumerate(constraints):
+        con.set_value((con.lower, con.body + sub.benders_slack_pos[c] - sub.benders_slack_neg[c], con.upper))
+    sub.benders_slack_pos.fix(0)
+    sub.benders_slack_neg.fix(0)
+
+    sub.objective.deactivate()
+    sub.benders_objective = pyo.Objective(expr=sum(coef*variables[k] for k, coef in structure.block_objective[block]), sense=pyo.minimize)
+    sub.benders_feasibility = pyo.Objective(expr=sum(sub.benders_slack_pos[c] + sub.benders_slack_neg[c] for c in sub.FEASIBILITY_KEYS), sense=pyo.minimize)
+    sub.benders_feasibility.deactivate()
+    sub.dual = pyo.Suffix(direction=pyo.Suffix.IMPORT)
+    sub.variable_list = variables
+    sub.linked_list = linked
+
+    return sub
+
+
+def _solve_subproblem(task):
+    '''
+    Solves one subproblem block of _SUBPROBLEMS at the master values and returns the cut data. When the flow LP is
+    infeasible the phase-1 problem is solved instead and the data describes a feasibility cut.
+    '''
+    block, values = task
+    subs, solver_name, solver_options, design = _SUBPROBLEMS
+    sub = subs[block]
+    #Clip the master values to the variable bounds to remove solver round-off
+    for k, val in enumerate(values):
+        v = sub.variable_list[sub.linked_list[k]]
+        if v.lb is not None:
+            val = max(val, v.lb)
+        if v.ub is not None:
+            val = min(val, v.ub)
+        sub.benders_value[k] = val
+
+    solver = get_solver(solver_name, options=solver_options)
+    results = solver.solve(sub, load_solutions=False)
+    feasible = results.solver.termination_condition == pyo.TerminationCondition.optimal
+
+    if not feasible:
+        sub.benders_objective.deactivate()
+        sub.benders_feasibility.activate()
+        sub.benders_slack_pos.unfix()
+        sub.benders_slack_neg.unfix()
+        results = solver.solve(sub, load_solutions=False)
+        if results.solver.termination_condition != pyo.TerminationCondition.optimal:
+            raise RuntimeError('Benders phase-1 subproblem %d terminated with %s' % (block, results.solver.termination_condition))
+    sub.solutions.load_from(results)
+    result = {
+        'objective': pyo.value(sub.benders_objective if feasible else sub.benders_feasibility),
+        'duals': [sub.dual.get(sub.benders_link[k], 0) for k in sub.BENDERS_KEYS],
+        'feasible': feasible,
+        'solution': [v.value for v in sub.variable_list] if feasible else None,
+    }
+
+    #Restore the flow LP for the next master design
+    if not feasible:
+        sub.benders_slack_pos.fix(0)
+        sub.benders_slack_neg.fix(0)
+        sub.benders_feasibility.deactivate()
+        sub.benders_objective.activate()
+
+    return result
+
+
+def _solve_design(values):
+    '''
+    Solves the full model of _SUBPROBLEMS as an LP with the binaries fixed at a master design and returns its minimized
+    objective and variable values (None when the design is infeasible). Used as the primal heuristic of solve_benders.
+    '''
+    subs, solver_name, solver_options, design = _SUBPROBLEMS
+    variables = design.variable_list
+    binaries = [k for k in design.binary_list if not variables[k].fixed]
+    for k in binaries:
+        variables[k].fix(round(values[k]))
+
+    solver = get_solver(solver_name, options=solver_options)
+    results = solver.solve(design, load_solutions=False)
+    result = None
+    if results.solver.termination_condition == pyo.TerminationCondition.optimal:
+        design.solutions.load_from(results)
+        result = {'objective': design.sense*pyo.value(design.objective), 'solution': [v.value for v in variables]}
+
+    for k in binaries:
+        variables[k].unfix()
+    return result
+
+
+def _master_candidates(master, solver, n_cuts):
+    '''
+    Solves the master problem and returns a valid lower bound and up to n_cuts distinct candidate designs. With a MIP gap
+    or a time limit the master incumbent is not a bound, so the bound is the dual bound reported by the solver (the
+    incumbent value is only used when the solver reports no bound and the master was solved to optimality)
+    '''
+    candidates = []
+    bound = None
+    binaries = [v for v in master.variable_list if v.is_binary() and not v.fixed]
+    master.exclusions = pyo.ConstraintList()
+    for c in range(n_cuts):
+        results = solver.solve(master)
+        if results.solver.termination_condition not in (pyo.TerminationCondition.optimal, pyo.TerminationCondition.maxTimeLimit):
+            break
+        if c == 0:
+            bound = pyo.value(master.benders_objective)
+            if math.isfinite(results.problem.lower_bound):
+                bound = min(bound, results.problem.lower_bound)
+            elif results.solver.termination_condition != pyo.TerminationCondition.optimal:
+                bound = -float('inf')
+        candidates.append({
+            'values': [v.value for v in master.variable_list],
+            'master_cost': pyo.value(master.benders_objective) - sum(pyo.value(master.eta[b]) for b in master.BLOCKS),
+        })
+        #Exclude the binary design just found to obtain the next candidate
+        master.exclusions.add(sum(v if v.value < 0.5 else 1 - v for v in binaries) >= 1)
+
+    #The extra candidates are only used to generate cuts, remove their exclusions
+    master.del_component(master.exclusions)
+    return bound, candidates
+
+
+def solve_benders(m, solver='gurobi', gap=None, solver_options=None, lp_solver=None, lp_solver_options=None, tol=1e-4, max_iter=200,
+                  split_commodities=True, n_cuts=1, workers=1, time_limit=None, tee=False):
+    '''
+    This function solves a supply chain model with Benders decomposition and loads the best design and flows back into m.
+
+    Inputs:
+
+            m: Pyomo model from create_supply_chain_model with any scenario specific fixes already applied
+            solver: name of the MILP solver used for the master problem, one of solver_backends.SOLVER_OPTIONS
+            gap: relative MIP gap of the master problem solves
+            solver_options: dictionary of solver specific options passed to the master problem solver
+            lp_solver: name of the LP solver used for the subproblems (defaults to solver)
+            lp_solver_options: dictionary of solver specific options passed to the subproblem solver (defaults to
+                               solver_options)
+            tol: relative gap between the master bound and the best feasible cost to stop at. The bound is the dual bound
+                 of the master solves, so use a master MIP gap below tol for the stop to be reached
+            max_iter: maximum number of master iterations
+            split_commodities: True to split the flow LP into independent commodity blocks, each with its own cost
+                               estimate in the master (multi-cut). Commodities coupled through a constraint, such as the
+                               per-mill profit constraints, stay in the same block.
+            n_cuts: number of distinct master designs evaluated per iteration, each adding its own cuts
+            workers: number of processes solving subproblems in parallel (requires the fork start method)
+            time_limit: time in seconds after which no new iteration is started (None for no limit)
+            tee: True to print the progress of each iteration
+
+    Returns: pandas DataFrame with the bound, incumbent and gap at each iteration, in the sense of m.objective
+    '''
+    global _SUBPROBLEMS
+    start = time.time()
+    solver_options = solver_options or {}
+    lp_solver = lp_solver or solver
+    lp_solver_options = lp_solver_options if lp_solver_options is not None else solver_options
+
+    structure = BendersStructure(m, split_commodities=split_commodities)
+    sense = structure.sense
+    master = create_benders_master(m, structure)
+    subs = [create_benders_subproblem(m, structure, b) for b in range(structure.n_blocks)]
+    design = m.clone()
+    design.variable_list = list(design.component_data_objects(pyo.Var))
+    design.binary_list = [k for k, v in enumerate(design.variable_list) if v.is_binary()]
+    design.sense = sense
+    _SUBPROBLEMS = (subs, lp_solver, lp_solver_options, design)
+
+    master_solver = get_solver(solver, gap=gap, options=solver_options)
+
+    if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+        evaluate = lambda tasks: list(pool.map(_solve_subproblem, tasks))
+        evaluate_designs = lambda candidates: list(pool.map(_solve_design, candidates))
+    else:
+        pool = None
+        evaluate = lambda tasks: [_solve_subproblem(task) for task in tasks]
+        evaluate_designs = lambda candidates: [_solve_design(candidate) for candidate in candidates]
+
+    #The first cuts come from the LP relaxation of the full model
+    relaxation = m.clone()
+    pyo.TransformationFactory('core.relax_integer_vars').apply_to(relaxation)
+    lp = get_solver(lp_solver, options=lp_solver_options)
+    lp.solve(relaxation)
+    pending = [{'values': [v.value for v in relaxation.component_data_objects(pyo.Var)], 'master_cost': None}]
+
+    upper_bound = float('inf')
+    lower_bound = -float('inf')
+    incumbent = None
+    history = []
+
+    try:
+        for iteration in range(max_iter):
+            #Evaluate the subproblem blocks of every candidate design and add their optimality cuts
+            tasks = [(b, [candidate['values'][k] for k in structure.linked[b]]) for candidate in pending for b in range(structure.n_blocks)]
+            results = evaluate(tasks)
+            #Primal heuristic: re-optimize all continuous variables with the binaries of each master design fixed
+            designs = evaluate_designs([candidate['values'] for candidate in pending if candidate['master_cost'] is not None])
+            for result in designs:
+                if result is not None and result['objective'] < upper_bound:
+                    upper_bound = result['objective']
+                    incumbent = result['solution']
+            for c, candidate in enumerate(pending):
+                block_results = results[c*structure.n_blocks:(c + 1)*structure.n_blocks]
+                for b, result in enumerate(block_results):
+                    duals = result['duals']
+                    cut = result['objective'] + sum(duals[j]*(master.variable_list[k] - candidate['values'][k]) for j, k in enumerate(structure.linked[b]) if abs(duals[j]) > 1e-9)
+                    if result['feasible']:
+                        master.cuts.add(master.eta[b] >= cut)
+                    else:
+                        master.cuts.add(cut <= 0)
+                if candidate['master_cost'] is None or not all(result['feasible'] for result in block_results):
+                    continue
+                cost = candidate['master_cost'] + sum(result['objective'] for result in block_results)
+                if cost < upper_bound:
+                    upper_bound = cost
+                    incumbent = [block_results[structure.block_of_family[structure.family[k]]]['solution'][k] if k in structure.family else val
+                                 for k, val in enumerate(candidate['values'])]
+
+            bound, pending = _master_candidates(master, master_solver, n_cuts)
+            if bound is None:
+                raise RuntimeError('The Benders master problem could not be solved')
+            #Cuts are only added, so the best bound found so far stays valid
+            lower_bound = max(lower_bound, bound)
+            rel_gap = (upper_bound - lower_bound)/max(abs(upper_bound), 1e-10) if incumbent else float('inf')
+            history.append({'iteration': iteration, 'bound': sense*lower_bound, 'incumbent': sense*upper_bound if incumbent else None,
+                            'gap': rel_gap, 'cuts': len(master.cuts), 'time': time.time() - start})
+            if tee:
+                print('Benders iteration %d: bound %.8e incumbent %.8e gap %.3e' % (iteration, sense*lower_bound, sense*upper_bound, rel_gap))
+            if rel_gap <= tol or (time_limit is not None and time.time() - start >= time_limit):
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        _SUBPROBLEMS = None
+
+    if incumbent is None:
+        raise RuntimeError('Benders decomposition did not find a feasible supply chain design')
+
+    #Load the best design and flows into the original model
+    for k, v in enumerate(m.component_data_objects(pyo.Var)):
+        if not v.fixed:
+            v.set_value(incumbent[k], skip_validation=True)
+
+    return pd.DataFrame(history)
@@ -0,0 +1,181 @@
+'''
+This file contains functions to make long scenario sweeps restartable: time limited solves split into segments that
+checkpoint the incumbent (used as a MIP start when the solve is resumed), and markers that let a restarted sweep skip the
+scenarios whose results were already saved.
+'''
+
+#Import the necessary packages
+import json
+import os
+import time
+
+import pyomo.environ as pyo
+
+from solver_backends import get_solver, solve_model
+
+#Results files saved by the run scripts for every scenario
+RESULT_FILES = ['mill_to_mill_volumes.csv', 'mill_to_mill_connections.csv', 'mill_to_airport_volumes.csv', 'mill_to_airport_connections.csv',
+                'mill_to_airport_volumes_eth.csv', 'mill_to_airport_connections_eth.csv', 'mill_to_ref_vol_eth.csv', 'mill_to_ref_vol_saf.csv',
+                'ref_to_air_vol_saf.csv', 'key_results_mills.csv', 'key_results_air.csv', 'key_results_ref.csv']
+
+#Files written by mark_scenario_complete
+STATUS_FILE = 'solve_status.json'
+SOLUTION_FILE = 'solution.json'
+
+
+def _write_json(data, path):
+    '''
+    Writes data to a JSON file through a temporary file, so an interrupted write never leaves a truncated file behind
+    '''
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def atomic_to_csv(df, path):
+    '''
+    This function saves a pandas DataFrame to a CSV file through a temporary file, so a killed run never leaves a truncated
+    results file behind.
+
+    Inputs:
+
+            df: pandas DataFrame
+            path: path of the CSV file
+
+    Returns: None
+    '''
+    temporary = path + '.tmp'
+    df.to_csv(temporary)
+    os.replace(temporary, path)
+
+
+def save_incumbent(m, path, elapsed=0):
+    '''
+    This function saves the current values of the free variables of a model to a JSON file (MIP start file).
+
+    Inputs:
+
+            m: Pyomo model
+            path: path of the JSON file
+            elapsed: solve time already spent on the model in seconds, stored to resume time limits
+
+    Returns: None
+    '''
+    values = {v.name: v.value for v in m.component_data_objects(pyo.Var) if not v.fixed and v.value is not None}
+    _write_json({'elapsed': elapsed, 'values': values}, path)
+
+
+def load_incumbent(m, path):
+    '''
+    This function loads the variable values saved by save_incumbent into a model, e.g. to use them as a MIP start.
+
+    Inputs:
+
+            m: Pyomo model with the same variables as the saved one
+            path: path of the JSON file
+
+    Returns: solve time already spent on the model in seconds
+    '''
+    with open(path) as f:
+        data = json.load(f)
+    values = data['values']
+    for v in m.component_data_objects(pyo.Var):
+        if not v.fixed and v.name in values:
+            v.set_value(values[v.name], skip_validation=True)
+    return data.get('elapsed', 0)
+
+
+def solve_with_checkpoints(m, solver_name=None, gap=None, time_limit=None, segment_time=None, checkpoint_file=None, threads=None, tee=False,
+                           log_file=None):
+    '''
+    This function solves a model in time limited segments, saving the incumbent after each segment and restarting the next
+    segment from it. Every segment is twice as long as the previous one, since a restart loses the branch and bound tree,
+    so the solve always finishes. If checkpoint_file exists the solve resumes from the saved incumbent and its elapsed time.
+
+    Inputs:
+
+            m: Pyomo model
+            solver_name: solver name, one of solver_backends.SOLVER_OPTIONS (defaults to solver_backends.default_solver())
+            gap: relative MIP gap
+            time_limit: total time limit in seconds, including the time spent before a restart (None for no limit)
+            segment_time: time limit of the first segment in seconds (None to solve in a single segment)
+            checkpoint_file: path of the JSON incumbent file (None to not checkpoint)
+            threads: number of threads
+            tee: True to print the solver log
+            log_file: path of a file the solver log of all segments is saved to (None to not capture it), kept when the
+                      solve is resumed
+
+    Returns: Pyomo results object of the last segment
+    '''
+    elapsed = 0
+    warmstart = False
+    if checkpoint_file is not None and os.path.isfile(checkpoint_file):
+        elapsed = load_incumbent(m, checkpoint_file)
+        warmstart = True
+    elif log_file is not None and os.path.isfile(log_file):
+        os.remove(log_file)
+    start = time.time() - elapsed
+    segment = segment_time
+
+    while True:
+        limits = [t for t in (segment, None if time_limit is None else time_limit - (time.time() - start)) if t is not None]
+        solver = get_solver(solver_name, gap=gap, threads=threads, time_limit=max(min(limits), 1) if limits else None)
+        results = solve_model(m, solver, warmstart=warmstart, tee=tee, log_file=log_file)
+        found = len(results.solution) > 0 and results.solver.termination_condition != pyo.TerminationCondition.infeasible
+        if found and checkpoint_file is not None:
+            save_incumbent(m, checkpoint_file, elapsed=time.time() - start)
+            warmstart = True
+        if results.solver.termination_condition != pyo.TerminationCondition.maxTimeLimit or segment_time is None:
+            break
+        if time_limit is not None and time.time() - start >= time_limit:
+            break
+        segment = 2*segment
+    return results
+
+
+def mark_scenario_complete(results_dir, m, termination):
+    '''
+    This function records that the results of a scenario were saved, together with its solution, so a restarted sweep can
+    skip it. It must be called after all results files were written.
+
+    Inputs:
+
+            results_dir: directory of the scenario results
+            m: solved Pyomo model
+            termination: termination condition of the solve
+
+    Returns: None
+    '''
+    save_incumbent(m, os.path.join(results_dir, SOLUTION_FILE))
+    _write_json({'termination': str(termination), 'objective': pyo.value(m.objective), 'time': time.strftime('%Y-%m-%d %H:%M:%S')},
+                os.path.join(results_dir, STATUS_FILE))
+
+
+def scenario_complete(results_dir, files=RESULT_FILES, accepted=('optimal',)):
+    '''
+    This function checks whether a scenario was already solved and its results saved.
+
+    Inputs:
+
+            results_dir: directory of the scenario results
+            files: results files that must exist and not be empty
+            accepted: termination conditions accepted as complete, add 'maxTimeLimit' to keep time limited results
+
+    Returns: True if the scenario results exist and are valid
+    '''
+    status_file = os.path.join(results_dir, STATUS_FILE)
+    if not os.path.isfile(status_file):
+        return False
+    try:
+        with open(status_file) as f:
+            status = json.load(f)
+    except ValueError:
+        return False
+    if status.get('termination') not in accepted:
+        return False
+    for name in list(files) + [SOLUTION_FILE]:
+        path = os.path.join(results_dir, name)
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            return False
+    return True
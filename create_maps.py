@@ -1,12 +1,195 @@
 #Import Necessary Packages
 import pandas as pd
+import numpy as np
 import folium
 from folium import LayerControl
+from folium.plugins import MarkerCluster
 import os
+import json
+import time
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import geopandas as gpd
 from shapely.geometry import Point
 
-def create_model_map(results_folder1,results_folder2):
+#Flow outputs a results folder needs to be mapped, and the map file saved in it
+MAP_INPUTS = ['mill_to_mill_volumes.csv', 'mill_to_airport_volumes.csv', 'mill_to_ref_vol_saf.csv', 'mill_to_ref_vol_eth.csv', 'ref_to_air_vol_saf.csv']
+MAP_FILE = 'mill_airport_map.html'
+
+#Country boundaries loaded in this session, by shapefile, country and simplification tolerance
+_BOUNDARIES = {}
+
+#Geographic data shared by the map workers of create_all_maps
+_MAP_DATA = None
+
+def load_boundary(shapefile_path="ne_50m_admin_0_countries.shp", country='Brazil', tolerance=0.01):
+    '''
+    This function loads the boundary of a country from a world shapefile, simplified to a tolerance, as a small GeoJSON
+    FeatureCollection. The boundary is kept for the rest of the session and cached next to the shapefile
+    (<shapefile>_<country>_<tolerance>.geojson), so the shapefile is only read again when it changes. The cache file alone
+    is enough to draw maps.
+
+    Inputs:
+
+            shapefile_path: path of the world countries shapefile (with a 'NAME' column)
+            country: name of the country
+            tolerance: simplification tolerance of the boundary, units: degrees (0 keeps the full geometry)
+
+    Returns: GeoJSON dictionary of the boundary in EPSG:4326, with its bounds in 'bbox' ([min lon, min lat, max lon, max lat])
+    '''
+    key = (os.path.abspath(shapefile_path), country, tolerance)
+    if key in _BOUNDARIES:
+        return _BOUNDARIES[key]
+
+    cache_path = os.path.splitext(shapefile_path)[0] + '_%s_%g.geojson' % (country, tolerance)
+    if os.path.isfile(cache_path) and (not os.path.isfile(shapefile_path) or os.path.getmtime(cache_path) >= os.path.getmtime(shapefile_path)):
+        with open(cache_path) as f:
+            boundary = json.load(f)
+    else:
+        world = gpd.read_file(shapefile_path)
+
+        if world.crs is None:
+            world = world.set_crs(epsg=4326)
+        else:
+            world = world.to_crs(epsg=4326)
+
+        # Filter for the country and simplify its outline
+        outline = world.loc[world['NAME'] == country, ['NAME', 'geometry']]
+        if tolerance > 0:
+            outline = outline.set_geometry(outline.geometry.simplify(tolerance))
+        boundary = json.loads(outline.to_json(drop_id=True, show_bbox=True))
+        try:
+            with open(cache_path, 'w') as f:
+                json.dump(boundary, f)
+        except OSError:
+            pass
+
+    _BOUNDARIES[key] = boundary
+    return boundary
+
+def load_map_data(boundary_tolerance=0.01):
+    '''
+    This function loads the geographic data shared by all maps: the lat/lon tables of the mills, airports and refineries
+    and the Brazil boundary.
+
+    Inputs:
+
+            boundary_tolerance: simplification tolerance of the Brazil boundary, units: degrees (0 keeps the full geometry)
+
+    Returns: dictionary with the lat/lon DataFrames ('mills', 'airports', 'refineries') and the boundary GeoJSON ('boundary')
+    '''
+    return {'mills': pd.read_excel('335MillsLatitudesLongitudes.xlsx'),
+            'airports': pd.read_excel('AirportsLatitudeLongitude.xlsx'),
+            'refineries': pd.read_excel('OilRefineriesLatLong.xlsx'),
+            'boundary': load_boundary("ne_50m_admin_0_countries.shp", 'Brazil', boundary_tolerance)}
+
+def flow_edges(volumes, row_coords, column_coords):
+    '''
+    This function melts a volume matrix of the results (one row per location in the 'volumes' column, one column per
+    location) into the list of its active arcs and joins the coordinates of both ends from the lat/lon tables, so the
+    map only handles the arcs with flow. Arcs with an end missing from the lat/lon tables are dropped.
+
+    Inputs:
+
+            volumes: pandas DataFrame read from a volume CSV file of the results
+            row_coords: pandas DataFrame with the 'Latitude' and 'Longitude' of the row locations, indexed by name
+            column_coords: pandas DataFrame with the 'Latitude' and 'Longitude' of the column locations, indexed by name
+
+    Returns: pandas DataFrame with the row location, column location, volume and coordinates of both ends ('row_lat',
+             'row_lon', 'column_lat', 'column_lon') of every arc with a positive volume
+    '''
+    matrix = volumes.set_index('volumes').drop(columns=volumes.columns[0])
+    values = pd.to_numeric(matrix.to_numpy().ravel(), errors='coerce').astype(float).reshape(matrix.shape)
+    rows, columns = np.nonzero(values > 0)
+    edges = pd.DataFrame({'row': matrix.index[rows], 'column': matrix.columns[columns], 'volume': values[rows, columns]})
+    edges = edges.join(row_coords.rename(columns={'Latitude': 'row_lat', 'Longitude': 'row_lon'}), on='row', how='inner')
+    edges = edges.join(column_coords.rename(columns={'Latitude': 'column_lat', 'Longitude': 'column_lon'}), on='column', how='inner')
+    return edges.reset_index(drop=True)
+
+def _flow_lines(edges, origin, color, weight, product):
+    '''
+    Returns the lines of the arcs of flow_edges from their origin end ('row' or 'column') to the other end, with their
+    color, weight and popup text
+    '''
+    destination = 'column' if origin == 'row' else 'row'
+    lines = pd.DataFrame({'from_lat': edges[origin + '_lat'], 'from_lon': edges[origin + '_lon'],
+                          'to_lat': edges[destination + '_lat'], 'to_lon': edges[destination + '_lon']})
+    lines['color'] = color
+    lines['weight'] = weight
+    lines['popup'] = [f"{volume} {product} from {a} to {b}" for volume, a, b in zip(edges['volume'], edges[origin], edges[destination])]
+    return lines
+
+def _line_style(feature):
+    '''
+    Style of a flow line of a GeoJSON layer, read from its properties
+    '''
+    return {'color': feature['properties']['color'], 'weight': feature['properties']['weight']}
+
+def _add_lines(lines, layer, geojson=False):
+    '''
+    Adds the lines of _flow_lines to a layer, as one folium PolyLine per line or as a single GeoJSON layer styled by the
+    properties of each line
+    '''
+    if not geojson:
+        for line in lines.itertuples(index=False):
+            folium.PolyLine(
+                locations=[[line.from_lat, line.from_lon], [line.to_lat, line.to_lon]],
+                color=line.color,
+                weight=line.weight,
+                popup=line.popup
+            ).add_to(layer)
+    elif len(lines) > 0:
+        features = [{'type': 'Feature',
+                     'geometry': {'type': 'LineString', 'coordinates': [[line.from_lon, line.from_lat], [line.to_lon, line.to_lat]]},
+                     'properties': {'color': line.color, 'weight': round(float(line.weight), 2), 'popup': line.popup}}
+                    for line in lines.itertuples(index=False)]
+        folium.GeoJson(
+            {'type': 'FeatureCollection', 'features': features},
+            style_function=_line_style,
+            popup=folium.GeoJsonPopup(fields=['popup'], labels=False)
+        ).add_to(layer)
+
+def _add_markers(names, lat_lon_dict, layer, icon, geojson=False):
+    '''
+    Adds a marker with a name popup at every location to a layer, as one folium Marker per location or as a single GeoJSON
+    layer sharing the icon (a dictionary of folium.Icon arguments)
+    '''
+    if not geojson:
+        for name in names:
+            folium.Marker(
+                location=[lat_lon_dict[name]['Latitude'], lat_lon_dict[name]['Longitude']],
+                popup=name,
+                icon=folium.Icon(**icon)
+            ).add_to(layer)
+    elif len(names) > 0:
+        features = [{'type': 'Feature',
+                     'geometry': {'type': 'Point', 'coordinates': [lat_lon_dict[name]['Longitude'], lat_lon_dict[name]['Latitude']]},
+                     'properties': {'name': name}}
+                    for name in names]
+        folium.GeoJson(
+            {'type': 'FeatureCollection', 'features': features},
+            marker=folium.Marker(icon=folium.Icon(**icon)),
+            popup=folium.GeoJsonPopup(fields=['name'], labels=False)
+        ).add_to(layer)
+
+def create_model_map(results_folder1,results_folder2,geojson=False,cluster_mills=False,boundary_tolerance=0.01,map_data=None):
+    '''
+    This function creates an interactive map of the supply chain design of a results folder and saves it to
+    mill_airport_map.html in that folder.
+
+    Inputs:
+
+            results_folder1: case study results folder, e.g. 'Case1'
+            results_folder2: blend requirement results folder inside results_folder1, e.g. 'interest_mid_blend_50'
+            geojson: True to pack the flow lines and mill markers of each layer into one GeoJSON layer (much smaller
+                     HTML files that render faster), False for one folium object per line and marker
+            cluster_mills: True to group the mill markers of each layer into marker clusters
+            boundary_tolerance: simplification tolerance of the Brazil boundary, units: degrees (0 keeps the full geometry)
+            map_data: geographic data from load_map_data to reuse across maps (None to load it)
+
+    Returns: None
+    '''
 
     this_file_path = os.path.dirname(os.path.realpath(__file__))
 
@@ -20,9 +203,8 @@ def create_model_map(results_folder1,results_folder2):
     mill_to_refinery_path = results_dir + '/mill_to_ref_vol_saf.csv'
     mill_to_ref_path_eth = results_dir + '/mill_to_ref_vol_eth.csv'
     ref_to_airport_path = results_dir + '/ref_to_air_vol_saf.csv'
-    mills_lat_lon_path = '335MillsLatitudesLongitudes.xlsx'
-    airports_lat_lon_path = 'AirportsLatitudeLongitude.xlsx'
-    refineries_lat_lon_path = 'OilRefineriesLatLong.xlsx'
+    if map_data is None:
+        map_data = load_map_data(boundary_tolerance)
 
     # Load the volume data ensuring proper decimal handling
     mill_to_mill_volumes = pd.read_csv(mill_to_mill_volumes_path, delimiter=',', decimal='.')
@@ -31,38 +213,34 @@ def create_model_map(results_folder1,results_folder2):
     mill_to_ref_volumes_eth = pd.read_csv(mill_to_ref_path_eth, delimiter=',', decimal='.')
     ref_to_air_volumes = pd.read_csv(ref_to_airport_path, delimiter=',', decimal='.')
 
-    # Load the lat/lon data for mills and airports
-    mills_lat_lon = pd.read_excel(mills_lat_lon_path)
-    airports_lat_lon = pd.read_excel(airports_lat_lon_path)
-    refineries_lat_lon = pd.read_excel(refineries_lat_lon_path)
+    # Lat/lon data for mills, airports and refineries
+    mills_lat_lon = map_data['mills']
+    airports_lat_lon = map_data['airports']
+    refineries_lat_lon = map_data['refineries']
 
     # Create dictionaries for lat/lon data
     mills_lat_lon_dict = mills_lat_lon.set_index('Mills')[['Latitude', 'Longitude']].to_dict('index')
     airports_lat_lon_dict = airports_lat_lon.set_index('NOME')[['Latitude', 'Longitude']].to_dict('index')
     refineries_lat_lon_dict = refineries_lat_lon.set_index('name')[['Latitude', 'Longitude']].to_dict('index')
 
-    shapefile_path = "ne_50m_admin_0_countries.shp"
-    world = gpd.read_file(shapefile_path)
+    # Coordinate tables to join to the arcs
+    mills_coords = mills_lat_lon.set_index('Mills')[['Latitude', 'Longitude']]
+    airports_coords = airports_lat_lon.set_index('NOME')[['Latitude', 'Longitude']]
+    refineries_coords = refineries_lat_lon.set_index('name')[['Latitude', 'Longitude']]
 
-    if world.crs is None:
-        world = world.set_crs(epsg=4326)
-    else:
-        world = world.to_crs(epsg=4326)
-
-    print(world.columns)
-
-    # Filter for Brazil
-    brazil = world[world['NAME'] == 'Brazil']
+    # Brazil boundary (read from the shapefile once and cached)
+    brazil = map_data['boundary']
 
     # Prepare the base map centered on Brazil
     map_center = [-15.788497, -47.879873]  # Center of Brazil
     m = folium.Map(location=map_center, zoom_start=5)
 
     # Add layers to the map
-    mill_to_airport_layer = folium.FeatureGroup(name="Mills producing SAF").add_to(m)
-    mill_to_mill_layer = folium.FeatureGroup(name="Ethanol supplying Mills (to Mills)").add_to(m)
-    mill_to_ref_layer = folium.FeatureGroup(name="Ethanol supplying Mills (to Refineries)").add_to(m)
-    inactive_mill_layer = folium.FeatureGroup(name="Unused Mills").add_to(m)
+    mill_group = MarkerCluster if cluster_mills else folium.FeatureGroup
+    mill_to_airport_layer = mill_group(name="Mills producing SAF").add_to(m)
+    mill_to_mill_layer = mill_group(name="Ethanol supplying Mills (to Mills)").add_to(m)
+    mill_to_ref_layer = mill_group(name="Ethanol supplying Mills (to Refineries)").add_to(m)
+    inactive_mill_layer = mill_group(name="Unused Mills").add_to(m)
     airport_layer = folium.FeatureGroup(name="Airports").add_to(m)
     refinery_layer = folium.FeatureGroup(name="Refineries").add_to(m)
     mill_mill_line_layer = folium.FeatureGroup(name="Ethanol Supply Lines (Blue)").add_to(m)
@@ -127,34 +305,23 @@ def create_model_map(results_folder1,results_folder2):
     total_inactive_refs = len(inactive_refs)
     total_airports = len(airports)
 
-    # Add markers for mills (with different colors)
+    # Sort the mills into their marker layers
+    saf_mills, ethanol_mills, ethanol_ref_mills, unused_mills = [], [], [], []
     for mill in mills:
-        coords = [mills_lat_lon_dict[mill]['Latitude'], mills_lat_lon_dict[mill]['Longitude']]
-        
         if mill in mills_sending_to_refs:
-            folium.Marker(
-                location=coords,
-                popup=mill,
-                icon=folium.Icon(color="green", icon="circle", prefix='fa')  # Green for mills sending to airports (using "tint" icon for drop)
-            ).add_to(mill_to_airport_layer)
+            saf_mills.append(mill)
         elif mill in mills_sending_to_mills:
-            folium.Marker(
-                location=coords,
-                popup=mill,
-                icon=folium.Icon(color="darkblue", icon="play", prefix = 'fa')  # Blue for mills sending to other mills
-            ).add_to(mill_to_mill_layer)
+            ethanol_mills.append(mill)
         elif mill in mills_sending_eth_to_refs:
-            folium.Marker(
-                location=coords,
-                popup=mill,
-                icon=folium.Icon(color="darkblue", icon="play", prefix = 'fa')  # Blue for mills sending eth to other refs
-            ).add_to(mill_to_ref_layer)
+            ethanol_ref_mills.append(mill)
         elif mill in inactive_mills:
-            folium.Marker(
-                location=coords,
-                popup=mill,
-                icon=folium.Icon(color="lightblue", icon="tint")  # Light blue for inactive mills
-            ).add_to(inactive_mill_layer)
+            unused_mills.append(mill)
+
+    # Add markers for mills (with different colors)
+    _add_markers(saf_mills, mills_lat_lon_dict, mill_to_airport_layer, {'color': "green", 'icon': "circle", 'prefix': 'fa'}, geojson)  # Green for mills sending to airports
+    _add_markers(ethanol_mills, mills_lat_lon_dict, mill_to_mill_layer, {'color': "darkblue", 'icon': "play", 'prefix': 'fa'}, geojson)  # Blue for mills sending to other mills
+    _add_markers(ethanol_ref_mills, mills_lat_lon_dict, mill_to_ref_layer, {'color': "darkblue", 'icon': "play", 'prefix': 'fa'}, geojson)  # Blue for mills sending eth to refs
+    _add_markers(unused_mills, mills_lat_lon_dict, inactive_mill_layer, {'color': "lightblue", 'icon': "tint"}, geojson)  # Light blue for inactive mills
 
     # Add markers for airports
     for airport in airports:
@@ -176,7 +343,7 @@ def create_model_map(results_folder1,results_folder2):
                 icon=folium.Icon(color="black", icon="stop")
             ).add_to(refinery_layer)
 
-        folium.GeoJson(
+    folium.GeoJson(
         brazil,
         name="Brazil",
         style_function=lambda x: {
@@ -187,94 +354,36 @@ def create_model_map(results_folder1,results_folder2):
     ).add_to(m)
 
     # # Fit map to Brazil’s bounds
-    m.fit_bounds(brazil.total_bounds.reshape(2,2).tolist())
-
-    # Add lines for mill-to-mill volumes (ethanol)
-    for i, row in mill_to_mill_volumes.iterrows():
-        mill_from = row['volumes']
-        for mill_to, volume in row[1:].items():
-            volume = pd.to_numeric(volume, errors='coerce')
-            if volume > 0 and mill_from in mills_lat_lon_dict and mill_to in mills_lat_lon_dict:
-                coords_from = [mills_lat_lon_dict[mill_from]['Latitude'], mills_lat_lon_dict[mill_from]['Longitude']]
-                coords_to = [mills_lat_lon_dict[mill_to]['Latitude'], mills_lat_lon_dict[mill_to]['Longitude']]
-                line_thickness = normalize_thickness(volume, min_ethanol_volume, max_ethanol_volume)
-                folium.PolyLine(
-                    locations=[coords_from, coords_to],
-                    color="blue",
-                    weight=line_thickness,  # Normalized line thickness
-                    popup=f"{volume} ethanol from {mill_from} to {mill_to}"
-                ).add_to(mill_mill_line_layer)
-
-    # Add lines for mill-to-airport volumes (SAF)
-    for i, row in mill_to_airport_volumes.iterrows():
-        airport = row['volumes']  # Get the name of the airport
-        if airport in airports_lat_lon_dict:  # Ensure the airport exists in the latitude/longitude data
-            coords_to = [airports_lat_lon_dict[airport]['Latitude'], airports_lat_lon_dict[airport]['Longitude']]
-            for mill, volume in row[2:].items():
-                volume = pd.to_numeric(volume, errors='coerce')
-                if volume > 0 and mill in mills_lat_lon_dict:  # Ensure the mill exists in the latitude/longitude data
-                    coords_from = [mills_lat_lon_dict[mill]['Latitude'], mills_lat_lon_dict[mill]['Longitude']]
-                    line_thickness = normalize_thickness(volume, min_saf_volume, max_saf_volume)
-                    folium.PolyLine(
-                        locations=[coords_from, coords_to],
-                        color="green",
-                        weight=line_thickness,  # Normalized line thickness
-                        popup=f"{volume} SAF from {mill} to {airport}"
-                    ).add_to(mill_airport_line_layer)
+    m.fit_bounds(np.reshape(brazil['bbox'], (2, 2)).tolist())
+
+    # Active arcs of each volume matrix with the coordinates of both ends (rows are the origin mills for mill-to-mill
+    # volumes and the destinations otherwise)
+    mill_mill_edges = flow_edges(mill_to_mill_volumes, mills_coords, mills_coords)
+    mill_airport_edges = flow_edges(mill_to_airport_volumes, airports_coords, mills_coords)
+    mill_ref_edges = flow_edges(mill_to_ref_volumes, refineries_coords, mills_coords)
+    mill_ref_eth_edges = flow_edges(mill_to_ref_volumes_eth, refineries_coords, mills_coords)
+    ref_airport_edges = flow_edges(ref_to_air_volumes, airports_coords, refineries_coords)
+
+    # Add lines for mill-to-mill volumes (ethanol, normalized line thickness)
+    mill_mill_weights = normalize_thickness(mill_mill_edges['volume'], min_ethanol_volume, max_ethanol_volume)
+    _add_lines(_flow_lines(mill_mill_edges, 'row', "blue", mill_mill_weights, 'ethanol'), mill_mill_line_layer, geojson)
+
+    # Add lines for mill-to-airport volumes (SAF, normalized line thickness)
+    mill_airport_weights = normalize_thickness(mill_airport_edges['volume'], min_saf_volume, max_saf_volume)
+    _add_lines(_flow_lines(mill_airport_edges, 'column', "green", mill_airport_weights, 'SAF'), mill_airport_line_layer, geojson)
 
     print(mill_to_ref_volumes)
 
     # Add lines for mill-to-ref volumes (SAF)
-    for i, row in mill_to_ref_volumes.iterrows():
-        refinery = row['volumes']  # Get the name of the airport
-        if refinery in refineries_lat_lon_dict:  # Ensure the airport exists in the latitude/longitude data
-            coords_to = [refineries_lat_lon_dict[refinery]['Latitude'], refineries_lat_lon_dict[refinery]['Longitude']]
-            for mill, volume in row[2:].items():
-                volume = pd.to_numeric(volume, errors='coerce')
-                if volume > 0 and mill in mills_lat_lon_dict:  # Ensure the mill exists in the latitude/longitude data
-                    coords_from = [mills_lat_lon_dict[mill]['Latitude'], mills_lat_lon_dict[mill]['Longitude']]
-                    # line_thickness = normalize_thickness(volume, min_saf_volume, max_saf_volume)
-                    folium.PolyLine(
-                        locations=[coords_from, coords_to],
-                        color="purple",
-                        weight=2,  # Normalized line thickness
-                        popup=f"{volume} SAF from {mill} to {refinery}"
-                    ).add_to(mill_to_ref_line_layer)
+    _add_lines(_flow_lines(mill_ref_edges, 'column', "purple", 2, 'SAF'), mill_to_ref_line_layer, geojson)
 
     # Add lines for mill-to-ref volumes (ethanol)
-    for i, row in mill_to_ref_volumes_eth.iterrows():
-        refinery = row['volumes']  # Get the name of the airport
-        if refinery in refineries_lat_lon_dict:  # Ensure the airport exists in the latitude/longitude data
-            coords_to = [refineries_lat_lon_dict[refinery]['Latitude'], refineries_lat_lon_dict[refinery]['Longitude']]
-            for mill, volume in row[2:].items():
-                volume = pd.to_numeric(volume, errors='coerce')
-                if volume > 0 and mill in mills_lat_lon_dict:  # Ensure the mill exists in the latitude/longitude data
-                    coords_from = [mills_lat_lon_dict[mill]['Latitude'], mills_lat_lon_dict[mill]['Longitude']]
-                    # line_thickness = normalize_thickness(volume, min_saf_volume, max_saf_volume)
-                    folium.PolyLine(
-                        locations=[coords_from, coords_to],
-                        color="blue",
-                        weight=2,  # Normalized line thickness
-                        popup=f"{volume} ethanol from {mill} to {refinery}"
-                    ).add_to(mill_to_ref_eth_line_layer)
+    _add_lines(_flow_lines(mill_ref_eth_edges, 'column', "blue", 2, 'ethanol'), mill_to_ref_eth_line_layer, geojson)
 
     print(ref_to_air_volumes)
 
-    for i, row in ref_to_air_volumes.iterrows():
-        airport = row['volumes']  # Get the name of the airport
-        if airport in airports_lat_lon_dict:  # Ensure the airport exists in the latitude/longitude data
-            coords_to = [airports_lat_lon_dict[airport]['Latitude'], airports_lat_lon_dict[airport]['Longitude']]
-            for ref, volume in row[2:].items():
-                volume = pd.to_numeric(volume, errors='coerce')
-                if volume > 0 and ref in refineries_lat_lon_dict:  # Ensure the mill exists in the latitude/longitude data
-                    coords_from = [refineries_lat_lon_dict[ref]['Latitude'], refineries_lat_lon_dict[ref]['Longitude']]
-                    # line_thickness = normalize_thickness(volume, min_saf_volume, max_saf_volume)
-                    folium.PolyLine(
-                        locations=[coords_from, coords_to],
-                        color="darkgreen",
-                        weight=2,  # Normalized line thickness
-                        popup=f"{volume} SAF from {ref} to {airport}"
-                    ).add_to(ref_airport_line_layer)
+    # Add lines for ref-to-airport volumes (blended SAF)
+    _add_lines(_flow_lines(ref_airport_edges, 'column', "darkgreen", 2, 'SAF'), ref_airport_line_layer, geojson)
 
 
     # Add layer control to toggle visibility of components
@@ -323,3 +432,81 @@ def create_model_map(results_folder1,results_folder2):
     # Save the map to an HTML file
     m.save(results_dir + '/mill_airport_map.html')
 
+def find_map_folders(root=None):
+    '''
+    This function finds the results folders that contain the flow outputs needed for a map (MAP_INPUTS), e.g. every case,
+    blend, integer cut and mill-specific incentive run.
+
+    Inputs:
+
+            root: directory to search (None for the directory of this file)
+
+    Returns: sorted list of the paths of the results folders relative to root
+    '''
+    if root is None:
+        root = os.path.dirname(os.path.realpath(__file__))
+    folders = []
+    for path, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if not d.startswith('.') and d != '__pycache__']
+        if all(f in files for f in MAP_INPUTS):
+            folders.append(os.path.relpath(path, root))
+    return sorted(folders)
+
+def map_is_current(results_dir):
+    '''
+    Returns True when the map of a results folder exists and is newer than all of its flow outputs
+    '''
+    map_path = os.path.join(results_dir, MAP_FILE)
+    if not os.path.isfile(map_path):
+        return False
+    return os.path.getmtime(map_path) >= max(os.path.getmtime(os.path.join(results_dir, f)) for f in MAP_INPUTS)
+
+def _render_map(task):
+    '''
+    Creates the map of one results folder with the shared geographic data, task = (folder, options)
+    '''
+    folder, options = task
+    start = time.time()
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            create_model_map(os.path.dirname(folder), os.path.basename(folder), map_data=_MAP_DATA, **options)
+        status = 'created'
+    except Exception as e:
+        status = 'failed: %s' % e
+    return {'folder': folder, 'status': status, 'time': time.time() - start}
+
+def create_all_maps(root=None, workers=1, force=False, boundary_tolerance=0.01, **options):
+    '''
+    This function creates the maps of every results folder found by find_map_folders. The lat/lon tables and the boundary
+    are loaded once and shared by the workers, and folders whose map is newer than their flow outputs are skipped.
+
+    Inputs:
+
+            root: directory to search (None for the directory of this file)
+            workers: number of processes creating maps in parallel (requires the fork start method)
+            force: True to recreate the maps that are up to date
+            boundary_tolerance: simplification tolerance of the Brazil boundary, units: degrees (0 keeps the full geometry)
+            options: other keyword arguments of create_model_map, e.g. geojson=True
+
+    Returns: pandas DataFrame with the status ('created', 'up to date' or 'failed: <error>') and time of every folder
+    '''
+    global _MAP_DATA
+    if root is None:
+        root = os.path.dirname(os.path.realpath(__file__))
+    folders = find_map_folders(root)
+    summary = [{'folder': folder, 'status': 'up to date', 'time': 0.0} for folder in folders if not force and map_is_current(os.path.join(root, folder))]
+    tasks = [(os.path.join(root, folder), options) for folder in folders if force or not map_is_current(os.path.join(root, folder))]
+
+    _MAP_DATA = load_map_data(boundary_tolerance)
+    try:
+        if workers > 1 and len(tasks) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+                results = list(pool.map(_render_map, tasks))
+        else:
+            results = [_render_map(task) for task in tasks]
+    finally:
+        _MAP_DATA = None
+
+    for result in results:
+        result['folder'] = os.path.relpath(result['folder'], root)
+    return pd.DataFrame(summary + results, columns=['folder', 'status', 'time']).sort_values('folder').reset_index(drop=True)
@@ -6,11 +6,27 @@ Created by Madelynn Watson and the University of Notre Dame
 '''
 
 #Import the necessary packages
+import itertools
 import pyomo.environ as pyo
+from pyomo.core.expr.numeric_expr import LinearExpression
 import pandas as pd
 import numpy as np
 
-def create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity, profit_obj = True, grass_roots_factor=0.5, breakpoints=10, ref_blend=False):
+from profiling import start_phase, stop_phase
+
+#Parameters of the model, only the ones listed in mutable_params can be changed after the model is built
+PARAMETERS = ['M', 'n', 'amortization', 'blend_requirement', 'minimum_sugar', 'minimum_ethanol', 'max_saf_capacity',
+              'reference_capex', 'reference_flow', 'reference_profit1a', 'reference_profit1b', 'Saf_CAPEX_Inputs',
+              'Sugarcane_Capacity', 'Conversion', 'individual_saf_demand', 'price', 'cost', 'logistic_cost',
+              'fixed_logistic_cost', 'mill_distance', 'airport_distance', 'mill_ref_distance', 'ref_air_distance',
+              'saf_premium', 'eth_prem', 'ethanol_energy', 'gas_energy', 'total_sugar_demand', 'ground_demand',
+              'ethanol_upper_bound', 'grass_roots_factor', 'greenfield_opex_air', 'greenfield_opex_ref']
+
+#Parameters changed between solves by the run scripts
+DEFAULT_MUTABLE_PARAMS = ('blend_requirement', 'saf_premium', 'eth_prem')
+
+def create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity, profit_obj = True, grass_roots_factor=0.5, breakpoints=10, ref_blend=False,
+                              mutable_params = DEFAULT_MUTABLE_PARAMS, distances=None):
     '''
     This function buils a supply chain model in Pyomo for bio-jet fuel production in Brazil.
 
@@ -26,28 +42,49 @@ def create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity,
             profit_obj: Determines the mode of the objective: True: Maximize Profit, False Minimize Cost
             grass_roots_factor: Factor to increase the brownfield CAPEX for greenfield implimentation
             ref_blend: True if blending must occur at refineries False if it can occur at airports
+            mutable_params: names of the parameters (from PARAMETERS) a sweep will change after the model is built, all
+                            other parameters are immutable constants, which gives smaller expressions and faster writes
+            distances: facility_index.FacilityIndex (or the path of one saved with its save method) to take the distances
+                       from instead of the distance sheets of data, None to read the sheets
 
     Returns: Pyomo model m
     '''
+    #Check the parameters to keep mutable
+    if isinstance(mutable_params, str):
+        raise ValueError('mutable_params must be a list of parameter names, got the string %r' % mutable_params)
+    mutable_params = set(mutable_params)
+    unknown = mutable_params - set(PARAMETERS)
+    if unknown:
+        raise ValueError('Unknown parameters %s in mutable_params, choose from %s' % (sorted(unknown), PARAMETERS))
+    def is_mutable(name):
+        return name in mutable_params
+
     #Create empty pyomo model
     m = pyo.ConcreteModel()
 
     #Read in Data from Excel sheet "data"
-    df_mill_distances = pd.read_excel(data,sheet_name = 'mill_distances')
+    start_phase('read data')
+    if isinstance(distances, str):
+        from facility_index import FacilityIndex
+        distances = FacilityIndex.load(distances)
+    if distances is None:
+        df_mill_distances = pd.read_excel(data,sheet_name = 'mill_distances')
+        df_airport_distances = pd.read_excel(data, sheet_name='airport_distances')
+        df_mill_refinery_distances = pd.read_excel(data,sheet_name='mill_ref_distances')
+        df_refinery_airport_distances = pd.read_excel(data, sheet_name='ref_air_distances')
     df_mill_capacities = pd.read_excel(data, sheet_name='mill_capacities')
     df_airport_demand = pd.read_excel(data, sheet_name= 'airport_demand')
-    df_airport_distances = pd.read_excel(data, sheet_name='airport_distances')
     df_refineries = pd.read_excel(data, sheet_name='refineries')
-    df_mill_refinery_distances = pd.read_excel(data,sheet_name='mill_ref_distances')
-    df_refinery_airport_distances = pd.read_excel(data, sheet_name='ref_air_distances')
     df_conversions = pd.read_excel(data, sheet_name = 'conversions')
     df_prices = pd.read_excel(data, sheet_name='prices')
     df_mill_type_eth = pd.read_excel(data, sheet_name = 'eth_mills')
     df_mill_type_annexed = pd.read_excel(data, sheet_name = 'annexed_mills')
     df_ref_profs1a = pd.read_excel(data, sheet_name='reference1a')
     df_ref_profs1b = pd.read_excel(data, sheet_name='reference1b')
+    stop_phase('read data')
     
     #SETS
+    start_phase('process data')
     products_and_intermeadiates = ['jui', 'j1', 'j2', 'bag', 'sug', 'et', 'el', 'mol', 'saf','saf air', 'saf ref', 'etmk', 'etsaf', 'etref','etr', 'etpc','eta','g','d','blended saf']
     mills = df_mill_capacities['mill'].tolist()
     annexed_mills = df_mill_type_annexed['Annexed Mills'].tolist()
@@ -107,61 +144,53 @@ def create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity,
         ref_prof1b[mills[i]] = df_ref_profs1b['Reference Mill Profs 1b'][i]
 
     #Distances
-    mill_distances = {}
-    for i in range(len(mills)):
-        for j in range(len(mills)):
-            mill_distances[mills[i],mills[j]] = df_mill_distances[mills[i]][j]
-
-    airport_distances = {}
-    for i in range(len(airports)):
-        for j in range(len(mills)):
-            airport_distances[airports[i],mills[j]] = df_airport_distances[airports[i]][j]
-
-    mill_ref_distances = {}
-    for i in range(len(refineries)):
-        for j in range(len(mills)):
-            mill_ref_distances[refineries[i],mills[j]] = df_mill_refinery_distances[refineries[i]][j]
-
-    ref_air_distances = {}
-    for i in range(len(refineries)):
-        for j in range(len(airports)):
-            ref_air_distances[refineries[i],airports[j]] = df_refinery_airport_distances[refineries[i]][j]
+    #Read each distance sheet as one array (column k of the sheet holds the distances from its k-th location) and store
+    #plain floats, the distance to location j from location i is sheet[i][j]
+    if distances is None:
+        mill_distances = dict(zip(itertools.product(mills, mills), df_mill_distances[mills].to_numpy(dtype=float).T.ravel().tolist()))
+        airport_distances = dict(zip(itertools.product(airports, mills), df_airport_distances[airports].iloc[:len(mills)].to_numpy(dtype=float).T.ravel().tolist()))
+        mill_ref_distances = dict(zip(itertools.product(refineries, mills), df_mill_refinery_distances[refineries].iloc[:len(mills)].to_numpy(dtype=float).T.ravel().tolist()))
+        ref_air_distances = dict(zip(itertools.product(refineries, airports), df_refinery_airport_distances[refineries].iloc[:len(airports)].to_numpy(dtype=float).T.ravel().tolist()))
+    else:
+        #Same orientation from the arrays of the facility index
+        mill_distances, airport_distances, mill_ref_distances, ref_air_distances = distances.model_distances(mills, airports, refineries)
+    stop_phase('process data')
 
 
     #PYOMO PARAMETERS
-    m.M = pyo.Param(initialize = 5e6, mutable = True)
-    m.n = pyo.Param(initialize = 0.65) #Capex scaling factor
-    m.amortization = pyo.Param(initialize = 1) #Already amortized 
-    m.blend_requirement = pyo.Param(initialize = blend, mutable = True)
-    m.minimum_sugar = pyo.Param(initialize = 0.4, mutable = True)
-    m.minimum_ethanol = pyo.Param(initialize = 0.4, mutable = True)
-    m.max_saf_capacity = pyo.Param(initialize = max_saf_capacity, mutable = True)
-    m.reference_capex = pyo.Param(initialize = 11970824, mutable = True) #2023 R$/year
-    m.reference_flow = pyo.Param(initialize = 84000, mutable = True) #m3 eth/year
-    m.reference_profit1a = pyo.Param(m.MILLS, initialize = ref_prof1a) #R$/year
-    m.reference_profit1b = pyo.Param(m.MILLS, initialize = ref_prof1b) #R$/year
-    m.Saf_CAPEX_Inputs = pyo.Param(m.INDEX_SET3, initialize = np.linspace(0,max_saf_capacity,breakpoints))
-    m.Sugarcane_Capacity = pyo.Param(m.MILLS, initialize = Ca, mutable = True) #tonne sc
-    m.Conversion = pyo.Param(m.CONVERSION_CODES, initialize = conv, mutable = True)
-    m.individual_saf_demand = pyo.Param(m.AIRPORTS, initialize = Da, mutable = True) #m3 saf
-    m.price = pyo.Param(m.SELLING_PRODUCTS, initialize = price, mutable = True) 
-    m.cost = pyo.Param(m.SELLING_PRODUCTS, initialize = cost, mutable = True) 
-    m.logistic_cost = pyo.Param(initialize = 0.16, mutable = True)
-    m.fixed_logistic_cost = pyo.Param(initialize = 17.82, mutable = True)
-    m.mill_distance = pyo.Param(m.MILLS, m.MILLS, initialize = mill_distances, mutable = True) #km
-    m.airport_distance = pyo.Param(m.AIRPORTS, m.MILLS, initialize = airport_distances, mutable = True) #km
-    m.mill_ref_distance = pyo.Param(m.REFINERIES,m.MILLS, initialize = mill_ref_distances, mutable = True) #km
-    m.ref_air_distance = pyo.Param(m.REFINERIES,m.AIRPORTS, initialize = ref_air_distances, mutable = True) #km
-    m.saf_premium = pyo.Param(initialize = saf_prem, mutable = True)
-    m.eth_prem = pyo.Param(initialize = eth_prem, mutable = True)
-    m.ethanol_energy = pyo.Param(initialize = 0.021200) #E100 energy density (TJ/m3)
-    m.gas_energy = pyo.Param(initialize = 0.029520) #E25 gasoline energy density (TJ/m3)
-    m.total_sugar_demand = pyo.Param(initialize = 44000000, mutable = True) #Sugar production in 2023/2024 season
-    m.ground_demand = pyo.Param(initialize = 1.74e6, mutable = True) #Energy consumed from hydrous ethanol and gasoline in 2023 in Brazil (TJ)
-    m.ethanol_upper_bound = pyo.Param(initialize = 6000000, mutable = True) #Corn ethanol available for purchase
-    m.grass_roots_factor = pyo.Param(initialize = grass_roots_factor, mutable = True) #increase in CAPEX for greenfield development (20%-100% 50% default)
-    m.greenfield_opex_air = pyo.Param(initialize = 1130, mutable = True) #Opex for non integrated SAF production (airport)
-    m.greenfield_opex_ref = pyo.Param(initialize = 1130, mutable = True) #Opex for non integrated SAF production (refinery)
+    m.M = pyo.Param(initialize = 5e6, mutable = is_mutable('M'))
+    m.n = pyo.Param(initialize = 0.65, mutable = is_mutable('n')) #Capex scaling factor
+    m.amortization = pyo.Param(initialize = 1, mutable = is_mutable('amortization')) #Already amortized 
+    m.blend_requirement = pyo.Param(initialize = blend, mutable = is_mutable('blend_requirement'))
+    m.minimum_sugar = pyo.Param(initialize = 0.4, mutable = is_mutable('minimum_sugar'))
+    m.minimum_ethanol = pyo.Param(initialize = 0.4, mutable = is_mutable('minimum_ethanol'))
+    m.max_saf_capacity = pyo.Param(initialize = max_saf_capacity, mutable = is_mutable('max_saf_capacity'))
+    m.reference_capex = pyo.Param(initialize = 11970824, mutable = is_mutable('reference_capex')) #2023 R$/year
+    m.reference_flow = pyo.Param(initialize = 84000, mutable = is_mutable('reference_flow')) #m3 eth/year
+    m.reference_profit1a = pyo.Param(m.MILLS, initialize = ref_prof1a, mutable = is_mutable('reference_profit1a')) #R$/year
+    m.reference_profit1b = pyo.Param(m.MILLS, initialize = ref_prof1b, mutable = is_mutable('reference_profit1b')) #R$/year
+    m.Saf_CAPEX_Inputs = pyo.Param(m.INDEX_SET3, initialize = np.linspace(0,max_saf_capacity,breakpoints), mutable = is_mutable('Saf_CAPEX_Inputs'))
+    m.Sugarcane_Capacity = pyo.Param(m.MILLS, initialize = Ca, mutable = is_mutable('Sugarcane_Capacity')) #tonne sc
+    m.Conversion = pyo.Param(m.CONVERSION_CODES, initialize = conv, mutable = is_mutable('Conversion'))
+    m.individual_saf_demand = pyo.Param(m.AIRPORTS, initialize = Da, mutable = is_mutable('individual_saf_demand')) #m3 saf
+    m.price = pyo.Param(m.SELLING_PRODUCTS, initialize = price, mutable = is_mutable('price')) 
+    m.cost = pyo.Param(m.SELLING_PRODUCTS, initialize = cost, mutable = is_mutable('cost')) 
+    m.logistic_cost = pyo.Param(initialize = 0.16, mutable = is_mutable('logistic_cost'))
+    m.fixed_logistic_cost = pyo.Param(initialize = 17.82, mutable = is_mutable('fixed_logistic_cost'))
+    m.mill_distance = pyo.Param(m.MILLS, m.MILLS, initialize = mill_distances, mutable = is_mutable('mill_distance')) #km
+    m.airport_distance = pyo.Param(m.AIRPORTS, m.MILLS, initialize = airport_distances, mutable = is_mutable('airport_distance')) #km
+    m.mill_ref_distance = pyo.Param(m.REFINERIES,m.MILLS, initialize = mill_ref_distances, mutable = is_mutable('mill_ref_distance')) #km
+    m.ref_air_distance = pyo.Param(m.REFINERIES,m.AIRPORTS, initialize = ref_air_distances, mutable = is_mutable('ref_air_distance')) #km
+    m.saf_premium = pyo.Param(initialize = saf_prem, mutable = is_mutable('saf_premium'))
+    m.eth_prem = pyo.Param(initialize = eth_prem, mutable = is_mutable('eth_prem'))
+    m.ethanol_energy = pyo.Param(initialize = 0.021200, mutable = is_mutable('ethanol_energy')) #E100 energy density (TJ/m3)
+    m.gas_energy = pyo.Param(initialize = 0.029520, mutable = is_mutable('gas_energy')) #E25 gasoline energy density (TJ/m3)
+    m.total_sugar_demand = pyo.Param(initialize = 44000000, mutable = is_mutable('total_sugar_demand')) #Sugar production in 2023/2024 season
+    m.ground_demand = pyo.Param(initialize = 1.74e6, mutable = is_mutable('ground_demand')) #Energy consumed from hydrous ethanol and gasoline in 2023 in Brazil (TJ)
+    m.ethanol_upper_bound = pyo.Param(initialize = 6000000, mutable = is_mutable('ethanol_upper_bound')) #Corn ethanol available for purchase
+    m.grass_roots_factor = pyo.Param(initialize = grass_roots_factor, mutable = is_mutable('grass_roots_factor')) #increase in CAPEX for greenfield development (20%-100% 50% default)
+    m.greenfield_opex_air = pyo.Param(initialize = 1130, mutable = is_mutable('greenfield_opex_air')) #Opex for non integrated SAF production (airport)
+    m.greenfield_opex_ref = pyo.Param(initialize = 1130, mutable = is_mutable('greenfield_opex_ref')) #Opex for non integrated SAF production (refinery)
 
     #VARIABLES
     #Continious
@@ -661,14 +690,18 @@ def create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity,
     # m.individual_mill_to_mill_log_cost = pyo.Expression(m.MILLS, rule = individual_mill_to_mill_log_cost)
 
     #Individual Mill to Mill Logistic Cost
+    #Built as linear expressions with the distances as float coefficients, so the mill pairs do not create a product
+    #expression for every term
     def individual_mill_to_mill_log_cost(m,j):
-        return sum((m.logistic_cost*m.mill_distance[i,j]* m.vol_eth_sold[i,j]  + m.fixed_logistic_cost*m.vol_eth_sold[i,j]) for i in m.MILLS if i != j)
+        volumes = [m.vol_eth_sold[i,j] for i in m.MILLS if i != j]
+        distances = [m.mill_distance[i,j] for i in m.MILLS if i != j]
+        return m.logistic_cost*LinearExpression(linear_coefs=distances, linear_vars=volumes) + m.fixed_logistic_cost*LinearExpression(linear_coefs=[1.0]*len(volumes), linear_vars=volumes)
     m.individual_mill_to_mill_log_cost = pyo.Expression(m.MILLS, rule = individual_mill_to_mill_log_cost)
 
     #Mill to Mill Logistic Cost
-    def mill_to_mill_logsitic_cost(m):
-        return sum(sum((m.logistic_cost*m.mill_distance[i,j]* m.vol_eth_sold[i,j]  + m.fixed_logistic_cost*m.vol_eth_sold[i,j]) for i in m.MILLS if i != j) for j in m.MILLS if i != j ) 
-    m.mill_to_mill_logistic_cost = pyo.Expression(rule = mill_to_mill_logsitic_cost)
+    def mill_to_mill_logistic_cost(m):
+        return sum(m.individual_mill_to_mill_log_cost[j] for j in m.MILLS)
+    m.mill_to_mill_logistic_cost = pyo.Expression(rule = mill_to_mill_logistic_cost)
 
     #Individual Mill to Airport Logistic Cost
     def individual_mill_to_airport_log_cost(m,j):
@@ -677,7 +710,7 @@ def create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity,
 
     #Mill to Airport Logistic Cost
     def mill_to_airport_logistic_cost(m):
-        return sum(sum((m.logistic_cost*m.airport_distance[i,j]* (m.vol_saf_sold_mills_air[j,i]+ m.vol_eth_sold_air[j,i]) + m.fixed_logistic_cost*(m.vol_saf_sold_mills_air[j,i] + m.vol_eth_sold_air[j,i])) for i in m.AIRPORTS) for j in m.MILLS)
+        return sum(m.individual_mill_to_airport_log_cost[j] for j in m.MILLS)
     m.mill_to_airport_logistic_cost = pyo.Expression(rule = mill_to_airport_logistic_cost)
 
     #Individual Mill to Refinery Logistic Cost
@@ -0,0 +1,331 @@
+'''
+This file contains a facility index: the coordinates of the mills, airports and refineries with the four distance matrices
+of the model computed from them (great circle distances, optionally times a road factor), spatial indexes for radius and
+nearest neighbour queries, and incremental updates when a facility is added.
+
+The index can be saved to a compressed numpy file and passed to create_supply_chain_model (distances argument) in place
+of the distance sheets of the data workbook, or written back as distance sheets.
+'''
+
+#Import the necessary packages
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from synthetic_data import EARTH_RADIUS, haversine_distances
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+#Kinds of facilities
+KINDS = ('mills', 'airports', 'refineries')
+
+#Distance sheets of the data workbook: kind of facility of the rows and of the columns
+DISTANCE_SHEETS = {'mill_distances': ('mills', 'mills'),
+                   'airport_distances': ('mills', 'airports'),
+                   'mill_ref_distances': ('mills', 'refineries'),
+                   'ref_air_distances': ('airports', 'refineries')}
+
+
+def _unit_vectors(coordinates):
+    '''
+    Returns the points of the unit sphere of an array of (latitude, longitude) rows in degrees
+    '''
+    lat, lon = np.radians(coordinates[:, 0]), np.radians(coordinates[:, 1])
+    return np.column_stack([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)])
+
+
+class FacilityIndex:
+    '''
+    Coordinates and distance matrices of the facilities of the supply chain. Distances are great circle distances on a
+    sphere of the given radius times road_factor, units: km. Distance matrices are computed when first needed, and
+    extended by one row or column when a facility is added.
+    '''
+
+    def __init__(self, locations, road_factor=1.0, radius=EARTH_RADIUS):
+        '''
+        Inputs:
+
+                locations: dictionary with a pandas DataFrame of the 'name', 'Latitude' and 'Longitude' of the facilities
+                           of each kind in KINDS, in the order of the model
+                road_factor: ratio of the road distance to the great circle distance
+                radius: radius of the Earth, units: km
+        '''
+        self.road_factor = float(road_factor)
+        self.radius = float(radius)
+        self.names = {kind: [str(name) for name in locations[kind]['name']] for kind in KINDS}
+        self.coordinates = {kind: locations[kind][['Latitude', 'Longitude']].to_numpy(dtype=float).reshape(-1, 2) for kind in KINDS}
+        self._positions = {kind: {name: k for k, name in enumerate(self.names[kind])} for kind in KINDS}
+        self._matrices = {}
+        self._trees = {}
+
+    @classmethod
+    def from_files(cls, data='base_case_data_with_demands.xlsx', mills_file='335MillsLatitudesLongitudes.xlsx',
+                   airports_file='AirportsLatitudeLongitude.xlsx', refineries_file='OilRefineriesLatLong.xlsx',
+                   road_factor=1.0, radius=EARTH_RADIUS):
+        '''
+        This function builds the index of the facilities of a data workbook, with the names and order of the model and the
+        coordinates of the latitude/longitude workbooks (matched by name, ignoring surrounding spaces).
+
+        Inputs:
+
+                data: data workbook of create_supply_chain_model (mill_capacities, airport_demand and refineries sheets)
+                mills_file: workbook with the mill names (Mills), latitudes and longitudes
+                airports_file: workbook with the airport names (NOME), latitudes and longitudes
+                refineries_file: workbook with the refinery names (name), latitudes and longitudes
+                road_factor: ratio of the road distance to the great circle distance
+                radius: radius of the Earth, units: km
+
+        Returns: FacilityIndex
+        '''
+        locations = {}
+        for kind, sheet, column, path, key in (('mills', 'mill_capacities', 'mill', mills_file, 'Mills'),
+                                               ('airports', 'airport_demand', 'airport', airports_file, 'NOME'),
+                                               ('refineries', 'refineries', 'ref', refineries_file, 'name')):
+            names = pd.read_excel(data, sheet_name=sheet)[column]
+            coordinates = pd.read_excel(path)
+            coordinates.index = coordinates[key].astype(str).str.strip()
+            missing = set(names.astype(str).str.strip()) - set(coordinates.index)
+            if missing:
+                raise ValueError('No coordinates in %s for the %s %s' % (path, kind, sorted(missing)))
+            located = coordinates.loc[names.astype(str).str.strip(), ['Latitude', 'Longitude']].reset_index(drop=True)
+            located.insert(0, 'name', names.values)
+            locations[kind] = located
+        return cls(locations, road_factor, radius)
+
+    def _distances(self, points, kind):
+        '''
+        Returns the distances from an array of (latitude, longitude) rows to all facilities of a kind
+        '''
+        coordinates = self.coordinates[kind]
+        scale = self.road_factor*self.radius/EARTH_RADIUS
+        return scale*haversine_distances(points[:, 0], points[:, 1], coordinates[:, 0], coordinates[:, 1])
+
+    def distances(self, sheet):
+        '''
+        This function returns a distance matrix of the model.
+
+        Inputs:
+
+                sheet: name of the distance sheet, one of DISTANCE_SHEETS
+
+        Returns: array with one row per facility of the row kind and one column per facility of the column kind, units: km
+        '''
+        if sheet not in self._matrices:
+            rows, columns = DISTANCE_SHEETS[sheet]
+            self._matrices[sheet] = self._distances(self.coordinates[rows], columns)
+        return self._matrices[sheet]
+
+    def set_distances(self, sheet, matrix):
+        '''
+        This function replaces a distance matrix of the index, e.g. by road network distances. Facilities added later get
+        great circle distances times road_factor in the replaced matrix.
+
+        Inputs:
+
+                sheet: name of the distance sheet, one of DISTANCE_SHEETS
+                matrix: array with one row per facility of the row kind and one column per facility of the column kind,
+                        units: km
+
+        Returns: None
+        '''
+        rows, columns = DISTANCE_SHEETS[sheet]
+        matrix = np.asarray(matrix, dtype=float)
+        if matrix.shape != (len(self.names[rows]), len(self.names[columns])):
+            raise ValueError('The %s matrix must have shape %s' % (sheet, (len(self.names[rows]), len(self.names[columns]))))
+        self._matrices[sheet] = matrix
+
+    def locations(self):
+        '''
+        Returns the dictionary of pandas DataFrames of the names and coordinates of the facilities of each kind
+        '''
+        return {kind: pd.DataFrame({'name': self.names[kind], 'Latitude': self.coordinates[kind][:, 0],
+                                    'Longitude': self.coordinates[kind][:, 1]}) for kind in KINDS}
+
+    def add(self, kind, name, latitude, longitude):
+        '''
+        This function adds a facility to the index, extending the distance matrices already computed with its row and
+        column only.
+
+        Inputs:
+
+                kind: kind of facility, one of KINDS
+                name: name of the facility
+                latitude, longitude: location of the facility, units: degrees
+
+        Returns: None
+        '''
+        name = str(name)
+        if name in self._positions[kind]:
+            raise ValueError('There already is a facility named %s in the %s' % (name, kind))
+        point = np.array([[latitude, longitude]], dtype=float)
+        self.coordinates[kind] = np.vstack([self.coordinates[kind], point])
+        self._positions[kind][name] = len(self.names[kind])
+        self.names[kind].append(name)
+        for sheet, matrix in self._matrices.items():
+            rows, columns = DISTANCE_SHEETS[sheet]
+            if columns == kind:
+                #Column of the new facility, with the distance to itself when the rows are of the same kind
+                matrix = np.hstack([matrix, self._distances(point, rows)[:, :matrix.shape[0]].T])
+            if rows == kind:
+                matrix = np.vstack([matrix, self._distances(point, columns)])
+            self._matrices[sheet] = matrix
+        self._trees.pop(kind, None)
+
+    def model_distances(self, mills, airports, refineries):
+        '''
+        This function returns the distance parameters of create_supply_chain_model for the facilities of a model.
+
+        Inputs:
+
+                mills, airports, refineries: lists of the names of the facilities of the model
+
+        Returns: dictionaries of the mill, airport, mill-refinery and refinery-airport distances, indexed like the
+                 parameters mill_distance, airport_distance, mill_ref_distance and ref_air_distance
+        '''
+        names = {'mills': list(mills), 'airports': list(airports), 'refineries': list(refineries)}
+        positions = {}
+        for kind in KINDS:
+            missing = [name for name in names[kind] if name not in self._positions[kind]]
+            if missing:
+                raise KeyError('The facility index has no %s %s' % (kind, missing[:10]))
+            positions[kind] = [self._positions[kind][name] for name in names[kind]]
+        parameters = []
+        for sheet, (rows, columns) in DISTANCE_SHEETS.items():
+            matrix = self.distances(sheet)[np.ix_(positions[rows], positions[columns])]
+            parameters.append(dict(zip(itertools.product(names[columns], names[rows]), matrix.T.ravel().tolist())))
+        return tuple(parameters)
+
+    def distance_sheets(self):
+        '''
+        This function returns the distance sheets of the data workbook.
+
+        Returns: dictionary of pandas DataFrames by sheet name, with the facility names of the rows as index
+        '''
+        return {sheet: pd.DataFrame(self.distances(sheet), index=self.names[rows], columns=self.names[columns])
+                for sheet, (rows, columns) in DISTANCE_SHEETS.items()}
+
+    def write_workbook(self, path, template='base_case_data_with_demands.xlsx'):
+        '''
+        This function writes a data workbook with the sheets of a template and the distance sheets of the index. Facilities
+        added to the index also need their rows in the other sheets (capacities, demands, mill types) to enter the model.
+
+        Inputs:
+
+                path: path of the excel workbook to write
+                template: data workbook the other sheets are copied from
+
+        Returns: None
+        '''
+        sheets = pd.read_excel(template, sheet_name=None)
+        distances = self.distance_sheets()
+        with pd.ExcelWriter(path) as writer:
+            for sheet, df in sheets.items():
+                if sheet in distances:
+                    #Distance sheets keep the row names in an unnamed first column like the base case data
+                    distances[sheet].to_excel(writer, sheet_name=sheet)
+                else:
+                    df.to_excel(writer, sheet_name=sheet, index=False)
+
+    def save(self, path):
+        '''
+        This function saves the coordinates and the four distance matrices to a compressed numpy file.
+
+        Inputs:
+
+                path: path of the .npz file
+
+        Returns: None
+        '''
+        arrays = {'road_factor': self.road_factor, 'radius': self.radius}
+        for kind in KINDS:
+            arrays['names_' + kind] = np.array(self.names[kind], dtype=str)
+            arrays['coordinates_' + kind] = self.coordinates[kind]
+        for sheet in DISTANCE_SHEETS:
+            arrays[sheet] = self.distances(sheet)
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        This function loads an index saved with save, with its distance matrices.
+
+        Inputs:
+
+                path: path of the .npz file
+
+        Returns: FacilityIndex
+        '''
+        with np.load(path) as arrays:
+            locations = {kind: pd.DataFrame({'name': arrays['names_' + kind], 'Latitude': arrays['coordinates_' + kind][:, 0],
+                                             'Longitude': arrays['coordinates_' + kind][:, 1]}) for kind in KINDS}
+            index = cls(locations, float(arrays['road_factor']), float(arrays['radius']))
+            for sheet in DISTANCE_SHEETS:
+                index.set_distances(sheet, arrays[sheet])
+        return index
+
+    def _tree(self, kind):
+        '''
+        Returns the KD-tree of the facilities of a kind on the unit sphere (None without scipy)
+        '''
+        if cKDTree is None:
+            return None
+        if kind not in self._trees:
+            self._trees[kind] = cKDTree(_unit_vectors(self.coordinates[kind]))
+        return self._trees[kind]
+
+    def _result(self, kind, positions, point):
+        '''
+        Returns the names and distances from a point of the facilities of a kind at some positions, nearest first
+        '''
+        positions = np.asarray(positions, dtype=int)
+        distances = self._distances(point, kind)[0, positions] if len(positions) else np.zeros(0)
+        order = np.lexsort((positions, distances))
+        return pd.DataFrame({'name': [self.names[kind][k] for k in positions[order]], 'distance': distances[order]})
+
+    def query_radius(self, kind, latitude, longitude, radius):
+        '''
+        This function finds the facilities of a kind within a distance of a location.
+
+        Inputs:
+
+                kind: kind of facility, one of KINDS
+                latitude, longitude: location, units: degrees
+                radius: distance, units: km (road km when road_factor is not 1)
+
+        Returns: pandas DataFrame with the name and distance of every facility within radius, nearest first
+        '''
+        point = np.array([[latitude, longitude]], dtype=float)
+        tree = self._tree(kind)
+        if tree is None:
+            positions = np.flatnonzero(self._distances(point, kind)[0] <= radius)
+        else:
+            angle = min(radius/(self.road_factor*self.radius), np.pi)
+            candidates = tree.query_ball_point(_unit_vectors(point)[0], 2*np.sin(angle/2)*(1 + 1e-9))
+            distances = self._distances(point, kind)[0]
+            positions = [k for k in candidates if distances[k] <= radius]
+        return self._result(kind, positions, point)
+
+    def query_nearest(self, kind, latitude, longitude, k=1):
+        '''
+        This function finds the facilities of a kind nearest to a location.
+
+        Inputs:
+
+                kind: kind of facility, one of KINDS
+                latitude, longitude: location, units: degrees
+                k: number of facilities
+
+        Returns: pandas DataFrame with the name and distance of the k nearest facilities, nearest first
+        '''
+        point = np.array([[latitude, longitude]], dtype=float)
+        k = min(k, len(self.names[kind]))
+        tree = self._tree(kind)
+        if tree is None:
+            positions = np.argsort(self._distances(point, kind)[0], kind='stable')[:k]
+        else:
+            positions = np.atleast_1d(tree.query(_unit_vectors(point)[0], k=k)[1])
+        return self._result(kind, positions, point)
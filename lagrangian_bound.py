@@ -0,0 +1,247 @@
+'''
+This file contains a Lagrangian relaxation bounding engine for the per-mill profit constraints (pos_profs) of the supply
+chain model built by create_supply_chain_model.
+
+The profit constraints are moved into the objective with one multiplier per mill (a mutable Param, so the relaxed model
+is built once), and the multipliers are updated with NumPy vectorized subgradient steps. Every relaxed solution gives a
+valid bound on the optimum. Its design is repaired into a feasible supply chain (mills that miss their profit floor do not
+invest) to provide incumbents. The best incumbent is loaded as a warm start for the main solve, and the bound becomes
+its stopping target (lagrangian_stop_options).
+'''
+
+#Import the necessary packages
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pyo
+
+from solver_backends import get_solver
+
+#Relaxed model and repair model held by each worker process (set before the pool is forked)
+_HEURISTIC = None
+
+
+def create_lagrangian_model(m, constraint='pos_profs'):
+    '''
+    This function builds the Lagrangian relaxation of a supply chain model with respect to its per-mill profit constraints.
+
+    Inputs:
+
+            m: Pyomo model from create_supply_chain_model with any scenario specific fixes already applied
+            constraint: name of the indexed (>=) constraint on m to relax, pos_profs by default
+
+    Returns: Pyomo model relaxed, a copy of m with the constraint deactivated and the mutable Param lagrange_multiplier in
+             the minimized objective lagrangian_objective
+    '''
+    relaxed = m.clone()
+    relaxed_con = getattr(relaxed, constraint)
+    relaxed_con.deactivate()
+    sense = 1 if relaxed.objective.sense == pyo.minimize else -1
+
+    relaxed.RELAXED = pyo.Set(initialize=list(relaxed_con.keys()), ordered=True)
+    relaxed.lagrange_multiplier = pyo.Param(relaxed.RELAXED, initialize=0, mutable=True, within=pyo.NonNegativeReals)
+
+    #Slack of each relaxed constraint, negative when the profit floor is violated
+    def profit_slack(relaxed, i):
+        return relaxed_con[i].body - relaxed_con[i].lower
+    relaxed.profit_slack = pyo.Expression(relaxed.RELAXED, rule=profit_slack)
+
+    relaxed.objective.deactivate()
+    def lagrangian_objective(relaxed):
+        return sense*relaxed.objective.expr - sum(relaxed.lagrange_multiplier[i]*relaxed.profit_slack[i] for i in relaxed.RELAXED)
+    relaxed.lagrangian_objective = pyo.Objective(rule=lagrangian_objective, sense=pyo.minimize)
+
+    return relaxed
+
+
+def _repair_design(values):
+    '''
+    Keeps the investments (y, y_ref, z) of a relaxed solution in the _HEURISTIC model, closes the SAF investment of every
+    mill that misses its profit floor and solves the original model over the remaining decisions. Returns the minimized
+    objective and the variable values, or None when no feasible design was found.
+    '''
+    relaxed, repair, solver_name, gap, solver_options = _HEURISTIC
+    y_values, y_ref_values, z_values, violated = values
+    fixed = []
+    for var, design in ((repair.y, y_values), (repair.y_ref, y_ref_values), (repair.z, z_values)):
+        for i, val in design.items():
+            if var[i].fixed:
+                continue
+            #Investments are kept, closed for violating mills, and the other locations can still invest to cover the demand
+            if i in violated:
+                var[i].fix(0)
+                fixed.append(var[i])
+            elif round(val) == 1:
+                var[i].fix(1)
+                fixed.append(var[i])
+
+    solver = get_solver(solver_name, gap=gap, options=solver_options)
+    results = solver.solve(repair, load_solutions=False)
+    result = None
+    if results.solver.termination_condition in (pyo.TerminationCondition.optimal, pyo.TerminationCondition.maxTimeLimit) and len(results.solution) > 0:
+        repair.solutions.load_from(results)
+        sense = 1 if repair.objective.sense == pyo.minimize else -1
+        result = {'objective': sense*pyo.value(repair.objective), 'solution': [v.value for v in repair.component_data_objects(pyo.Var)]}
+
+    for var in fixed:
+        var.unfix()
+    return result
+
+
+def solve_lagrangian_bound(m, solver='gurobi', gap=None, solver_options=None, constraint='pos_profs', max_iter=50, step_scale=2.0,
+                           patience=3, tol=1e-4, time_limit=None, workers=1, report_file=None, tee=False):
+    '''
+    This function computes a Lagrangian bound for a supply chain model by relaxing its per-mill profit constraints, and
+    loads the best repaired design into m (to be used as a warm start).
+
+    Inputs:
+
+            m: Pyomo model from create_supply_chain_model with any scenario specific fixes already applied
+            solver: name of the MILP solver used for the relaxed and repaired models, one of solver_backends.SOLVER_OPTIONS
+            gap: relative MIP gap of the relaxed and repaired model solves
+            solver_options: dictionary of solver specific options passed to the solver
+            constraint: name of the indexed (>=) constraint on m to relax, pos_profs by default
+            max_iter: maximum number of subgradient iterations
+            step_scale: initial Polyak step scale, halved after patience iterations without bound improvement
+            patience: number of iterations without bound improvement before the step scale is halved
+            tol: relative gap between the bound and the best incumbent to stop at
+            time_limit: time in seconds after which no new iteration is started (None for no limit)
+            workers: 2 or more to repair each design in a separate process while the next relaxed model is solved
+                     (requires the fork start method)
+            report_file: path of a CSV file to save the gap report to (None to skip)
+            tee: True to print the progress of each iteration
+
+    Returns: bound: best Lagrangian bound in the sense of m.objective (lower bound when minimizing, upper when maximizing)
+             report: pandas DataFrame with the bound, incumbent, gap, step and subgradient norm at each iteration
+    '''
+    global _HEURISTIC
+    start = time.time()
+    solver_options = solver_options or {}
+    sense = 1 if m.objective.sense == pyo.minimize else -1
+
+    relaxed = create_lagrangian_model(m, constraint)
+    repair = m.clone()
+    _HEURISTIC = (relaxed, repair, solver, gap, solver_options)
+    relaxed_solver = get_solver(solver, gap=gap, options=solver_options)
+
+    if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        pool = ProcessPoolExecutor(max_workers=workers - 1, mp_context=multiprocessing.get_context('fork'))
+    else:
+        pool = None
+
+    keys = list(relaxed.RELAXED)
+    multipliers = np.zeros(len(keys))
+    best_bound = -np.inf
+    best_multipliers = multipliers.copy()
+    upper_bound = np.inf
+    incumbent = None
+    scale = step_scale
+    stalled = 0
+    pending = None
+    report = []
+
+    def collect(result):
+        nonlocal upper_bound, incumbent
+        if result is not None and result['objective'] < upper_bound:
+            upper_bound = result['objective']
+            incumbent = result['solution']
+
+    try:
+        for iteration in range(max_iter):
+            for k, i in enumerate(keys):
+                relaxed.lagrange_multiplier[i] = multipliers[k]
+            results = relaxed_solver.solve(relaxed, load_solutions=False)
+            if results.solver.termination_condition not in (pyo.TerminationCondition.optimal, pyo.TerminationCondition.maxTimeLimit) or len(results.solution) == 0:
+                raise RuntimeError('The Lagrangian relaxation terminated with %s' % results.solver.termination_condition)
+            relaxed.solutions.load_from(results)
+
+            #With a MIP gap only the dual bound of the relaxed model is a valid bound
+            bound = pyo.value(relaxed.lagrangian_objective)
+            if np.isfinite(results.problem.lower_bound):
+                bound = min(bound, results.problem.lower_bound)
+            if bound > best_bound*(1 + 1e-9*np.sign(best_bound)):
+                best_bound = bound
+                best_multipliers = multipliers.copy()
+                stalled = 0
+            else:
+                stalled += 1
+                if stalled >= patience:
+                    scale = scale/2
+                    stalled = 0
+
+            #Repair the relaxed design, in parallel with the next relaxed solve when a pool is available
+            slack = np.array([pyo.value(relaxed.profit_slack[i]) for i in keys])
+            violated = {i for k, i in enumerate(keys) if slack[k] < -1e-6*max(1, abs(pyo.value(getattr(relaxed, constraint)[i].lower)))}
+            design = tuple({i: pyo.value(v) for i, v in var.items()} for var in (relaxed.y, relaxed.y_ref, relaxed.z)) + (violated,)
+            if pending is not None:
+                collect(pending.result())
+                pending = None
+            if pool is not None:
+                pending = pool.submit(_repair_design, design)
+            else:
+                collect(_repair_design(design))
+
+            #Polyak step towards the best incumbent (or an estimate of it) along the subgradient -slack
+            subgradient = -slack
+            norm = float(np.dot(subgradient, subgradient))
+            target = upper_bound if np.isfinite(upper_bound) else bound + 0.01*max(abs(bound), 1)
+            step = scale*(target - bound)/norm if norm > 0 else 0
+            multipliers = np.maximum(0, multipliers + step*subgradient)
+
+            gap = (upper_bound - best_bound)/max(abs(upper_bound), 1e-10) if np.isfinite(upper_bound) else np.inf
+            report.append({'iteration': iteration, 'time': time.time() - start, 'bound': sense*best_bound,
+                           'incumbent': sense*upper_bound if np.isfinite(upper_bound) else None, 'gap': gap,
+                           'step': step, 'subgradient_norm': np.sqrt(norm), 'violated_mills': len(violated)})
+            if tee:
+                print('Lagrangian iteration %d: bound %.8e incumbent %.8e gap %.3e violated mills %d' % (iteration, sense*best_bound, sense*upper_bound, gap, len(violated)))
+            if gap <= tol or norm == 0 or (time_limit is not None and time.time() - start > time_limit):
+                break
+
+        if pending is not None:
+            collect(pending.result())
+            report[-1]['incumbent'] = sense*upper_bound if np.isfinite(upper_bound) else None
+            report[-1]['gap'] = (upper_bound - best_bound)/max(abs(upper_bound), 1e-10) if np.isfinite(upper_bound) else np.inf
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        _HEURISTIC = None
+
+    #Load the best repaired design into m as a warm start
+    if incumbent is not None:
+        for v, val in zip(m.component_data_objects(pyo.Var), incumbent):
+            if not v.fixed:
+                v.set_value(val, skip_validation=True)
+
+    report = pd.DataFrame(report)
+    report['multiplier_norm'] = np.linalg.norm(best_multipliers)
+    if report_file is not None:
+        report.to_csv(report_file)
+
+    return sense*best_bound, report
+
+
+def lagrangian_stop_options(m, bound, gap, solver='gurobi'):
+    '''
+    This function converts a Lagrangian bound into solver options that stop the main solve as soon as its incumbent is
+    within gap of the bound. The bound is passed as a stopping target rather than as a constraint on the objective, which
+    would add a dense row with coefficients of the order of the objective and is numerically unreliable for this model.
+
+    Inputs:
+
+            m: Pyomo model from create_supply_chain_model
+            bound: bound returned by solve_lagrangian_bound for the same model
+            gap: relative gap to the bound at which the main solve can stop
+            solver: name of the solver used for the main solve
+
+    Returns: dictionary of solver options (empty when the solver has no objective target option)
+    '''
+    sense = 1 if m.objective.sense == pyo.minimize else -1
+    target = bound + sense*gap*abs(bound)
+    if solver.startswith('gurobi'):
+        return {'BestObjStop': target}
+    if 'highs' in solver:
+        return {'objective_target': target}
+    return {}
@@ -0,0 +1,504 @@
+'''
+This file contains functions to export the supply chain model of a case once to a compressed MPS file and to solve the
+points of a parameter sweep from that file, applying each point as a small patch of row bounds, matrix coefficients and
+objective coefficients through the solver API (HiGHS through highspy or Gurobi through gurobipy) instead of writing the
+whole model again for every point. For batches of many points, the patch terms can be written as affine functions of the
+parameters once, so the patch of each point is computed with array arithmetic.
+'''
+
+#Import the necessary packages
+import gzip
+import json
+import os
+import shutil
+
+import numpy as np
+import pyomo.environ as pyo
+from pyomo.core.expr.visitor import identify_mutable_parameters
+from pyomo.repn import generate_standard_repn
+
+#Prefixes of the MPS row names written by Pyomo, with the bound of the constraint each row holds
+ROW_BOUNDS = {'c_e_': 'equality', 'c_l_': 'lower', 'r_l_': 'lower', 'c_u_': 'upper', 'r_u_': 'upper'}
+
+#Column Pyomo adds to hold a constant objective term
+OBJECTIVE_CONSTANT = 'ONE_VAR_CONSTANT'
+
+
+def export_base_model(m, path):
+    '''
+    This function writes the model to an MPS file with symbolic names, compressed with gzip when path ends with .gz
+    (HiGHS and Gurobi read the compressed file directly). Fixed variables are written as constants, so fix the
+    investments of the case before exporting and do not change them afterwards.
+
+    Inputs:
+
+            m: Pyomo model
+            path: path of the MPS file, e.g. exported_sweep/Case1/base_model.mps.gz
+
+    Returns: dictionary with the file path, the column name of each variable ('columns'), the row names of each
+             constraint ('rows', by the id of the constraint) and the objective row name ('objective')
+    '''
+    mps_file = path[:-3] if path.endswith('.gz') else path
+    _, symbol_map_id = m.write(mps_file, format='mps', io_options={'symbolic_solver_labels': True})
+    symbol_map = m.solutions.symbol_map[symbol_map_id]
+    if mps_file != path:
+        with open(mps_file, 'rb') as f_in, gzip.open(path, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(mps_file)
+
+    #Constraints are written as one row per bound, named by a prefix and their symbol
+    rows = {}
+    for label, obj in symbol_map.aliases.items():
+        if label[:4] in ROW_BOUNDS:
+            rows.setdefault(id(obj), []).append(label)
+    columns = {label: obj for label, obj in symbol_map.bySymbol.items() if obj.ctype is pyo.Var}
+    objective = next(obj for obj in m.component_data_objects(pyo.Objective, active=True))
+    return {'file': path, 'columns': columns, 'rows': rows, 'objective': symbol_map.byObject[id(objective)],
+            'labels': {id(var): label for label, var in columns.items()}}
+
+
+def _depends_on(expr, targets):
+    '''
+    Checks whether an expression (or number) contains one of the parameters in targets (set of ids of parameter data)
+    '''
+    if expr is None or type(expr) in (int, float):
+        return False
+    return any(id(p) in targets for p in identify_mutable_parameters(expr))
+
+
+def parameter_terms(m, base, params):
+    '''
+    This function finds the parts of the exported model that depend on the given mutable parameters: the bounds and
+    matrix coefficients of the constraint rows and the objective coefficients. It walks the model once per case, after
+    which parameter_patch only evaluates these terms.
+
+    Inputs:
+
+            m: Pyomo model exported with export_base_model
+            base: dictionary returned by export_base_model
+            params: names of the mutable parameters changed by the sweep, e.g. ['blend_requirement']
+
+    Returns: dictionary with the row terms ('rows', list of row name, bound type, bound and body constant expressions and
+             list of column name, coefficient expression pairs) and the objective terms ('costs', list of column name,
+             coefficient expression pairs, and 'offset', the constant expression or None)
+    '''
+    targets = {id(p) for name in params for p in getattr(m, name).values()}
+    labels = base['labels']
+
+    rows = []
+    for con in m.component_data_objects(pyo.Constraint, active=True):
+        if id(con) not in base['rows']:
+            continue
+        if not any(_depends_on(expr, targets) for expr in (con.body, con.lower, con.upper)):
+            continue
+        repn = generate_standard_repn(con.body, compute_values=False)
+        coefficients = [(labels[id(var)], coef) for var, coef in zip(repn.linear_vars, repn.linear_coefs) if _depends_on(coef, targets)]
+        for row in base['rows'][id(con)]:
+            bound_type = ROW_BOUNDS[row[:4]]
+            rows.append((row, bound_type, con.upper if bound_type == 'upper' else con.lower, repn.constant, coefficients))
+
+    objective = next(obj for obj in m.component_data_objects(pyo.Objective, active=True))
+    repn = generate_standard_repn(objective.expr, compute_values=False)
+    costs = [(labels[id(var)], coef) for var, coef in zip(repn.linear_vars, repn.linear_coefs) if _depends_on(coef, targets)]
+    offset = repn.constant if _depends_on(repn.constant, targets) else None
+    return {'rows': rows, 'costs': costs, 'offset': offset}
+
+
+def parameter_patch(terms):
+    '''
+    This function evaluates the parameter terms at the current parameter values of the model, e.g. after setting
+    m.blend_requirement to the next point of a sweep.
+
+    Inputs:
+
+            terms: dictionary returned by parameter_terms
+
+    Returns: patch dictionary (JSON serializable) with the new bounds of each row ('row_bounds', lower and upper bound as
+             in HiGHS), the new matrix coefficients ('coefficients', list of row, column and value), the new objective
+             coefficients ('costs') and the new objective constant ('offset', None when it does not change)
+    '''
+    patch = {'row_bounds': {}, 'coefficients': [], 'costs': {}, 'offset': None}
+    for row, bound_type, bound, constant, coefficients in terms['rows']:
+        rhs = pyo.value(bound) - pyo.value(constant)
+        if bound_type == 'equality':
+            patch['row_bounds'][row] = [rhs, rhs]
+        elif bound_type == 'lower':
+            patch['row_bounds'][row] = [rhs, float('inf')]
+        else:
+            patch['row_bounds'][row] = [-float('inf'), rhs]
+        patch['coefficients'] += [[row, column, pyo.value(coef)] for column, coef in coefficients]
+    patch['costs'] = {column: pyo.value(coef) for column, coef in terms['costs']}
+    if terms['offset'] is not None:
+        patch['offset'] = pyo.value(terms['offset'])
+    return patch
+
+
+def linear_parameter_terms(m, terms, params):
+    '''
+    This function writes the parameter terms as affine functions of the parameter values, so the patch of a parameter
+    vector is computed with array arithmetic instead of evaluating the Pyomo expressions of every term, e.g. for batches of
+    thousands of what-if points. The gradient of each term is found by moving one parameter at a time, and the affine form
+    is checked at a point moving every parameter at once, so terms with products of the parameters (e.g.
+    blend_requirement times individual_saf_demand) raise an error.
+
+    Inputs:
+
+            m: Pyomo model exported with export_base_model
+            terms: dictionary returned by parameter_terms
+            params: names of the mutable parameters of terms
+
+    Returns: dictionary with the parameters ('parameters', list of name and index pairs) and their base values ('values'),
+             the rows and bound types of the row terms ('rows', 'row_types'), the row and column of the coefficient terms
+             ('coefficients'), the columns of the cost terms ('costs'), whether the objective constant is a term
+             ('offset'), the base value of every term ('base', rows then coefficients then costs then offset) and the
+             gradient of every term ('gradient', arrays of term position, parameter position and value)
+    '''
+    parameters = [(name, index, p) for name in params for index, p in getattr(m, name).items()]
+    positions = {id(p): k for k, (name, index, p) in enumerate(parameters)}
+    values = np.array([pyo.value(p) for name, index, p in parameters], dtype=float)
+
+    #Every term is an expression minus a constant (the bound and body constant of a row) or a single expression
+    exprs = [(bound, constant) for row, bound_type, bound, constant, coefficients in terms['rows']]
+    exprs += [(coef, 0) for row, bound_type, bound, constant, coefficients in terms['rows'] for column, coef in coefficients]
+    exprs += [(coef, 0) for column, coef in terms['costs']]
+    if terms['offset'] is not None:
+        exprs.append((terms['offset'], 0))
+
+    def evaluate(items):
+        return np.array([pyo.value(exprs[t][0]) - pyo.value(exprs[t][1]) for t in items], dtype=float)
+
+    #Terms depending on each parameter
+    dependents = {}
+    for t, pair in enumerate(exprs):
+        found = {positions[id(p)] for expr in pair if type(expr) not in (int, float) for p in identify_mutable_parameters(expr) if id(p) in positions}
+        for k in found:
+            dependents.setdefault(k, []).append(t)
+
+    base = evaluate(range(len(exprs)))
+    term, param, gradient = [], [], []
+    try:
+        for k, items in dependents.items():
+            step = max(abs(values[k]), 1.0)
+            parameters[k][2].value = values[k] + step
+            term += items
+            param += [k]*len(items)
+            gradient.append((evaluate(items) - base[items])/step)
+            parameters[k][2].value = values[k]
+        term, param = np.array(term, dtype=int), np.array(param, dtype=int)
+        gradient = np.concatenate(gradient) if gradient else np.zeros(0)
+
+        #Check the affine form at a point moving every parameter
+        shift = np.random.default_rng(0).uniform(0.25, 0.75, len(parameters))*np.maximum(np.abs(values), 1.0)
+        for k, (name, index, p) in enumerate(parameters):
+            p.value = values[k] + shift[k]
+        moved = evaluate(range(len(exprs)))
+    finally:
+        for k, (name, index, p) in enumerate(parameters):
+            p.value = values[k]
+    predicted = base + np.bincount(term, gradient*shift[param], minlength=len(exprs))
+    wrong = np.flatnonzero(np.abs(moved - predicted) > 1e-8*np.maximum(np.maximum(np.abs(moved), np.abs(base)), 1.0))
+    if len(wrong) > 0:
+        names = sorted({'%s[%s]' % parameters[k][:2] for k in param[np.isin(term, wrong)]})
+        raise ValueError('%d terms are not affine in the parameters, e.g. products of %s' % (len(wrong), ', '.join(names[:5])))
+
+    return {'parameters': [(name, index) for name, index, p in parameters], 'values': values,
+            'rows': [row for row, bound_type, bound, constant, coefficients in terms['rows']],
+            'row_types': [bound_type for row, bound_type, bound, constant, coefficients in terms['rows']],
+            'coefficients': [(row, column) for row, bound_type, bound, constant, coefficients in terms['rows'] for column, coef in coefficients],
+            'costs': [column for column, coef in terms['costs']], 'offset': terms['offset'] is not None,
+            'base': base, 'gradient': (term, param, gradient)}
+
+
+def parameter_vector(linear, scenario):
+    '''
+    This function converts a scenario into a vector of the parameters of linear terms.
+
+    Inputs:
+
+            linear: dictionary returned by linear_parameter_terms
+            scenario: dictionary of parameter values by name (a value, or a dictionary by index for indexed parameters),
+                      in the format of stochastic_prices.sample_price_scenarios; missing parameters keep their base value
+
+    Returns: numpy array with the value of each parameter of linear
+    '''
+    positions = {parameter: k for k, parameter in enumerate(linear['parameters'])}
+    theta = linear['values'].copy()
+    for name, val in scenario.items():
+        if name == 'probability':
+            continue
+        for index, v in (val.items() if isinstance(val, dict) else [(None, val)]):
+            if (name, index) not in positions:
+                raise ValueError('Parameter %s[%s] is not one of the linearized parameters' % (name, index))
+            theta[positions[name, index]] = v
+    return theta
+
+
+def linear_term_values(linear, theta):
+    '''
+    This function evaluates the linear terms at a parameter vector.
+
+    Inputs:
+
+            linear: dictionary returned by linear_parameter_terms
+            theta: parameter vector, e.g. from parameter_vector
+
+    Returns: numpy array with the value of every term, in the order of linear['base']
+    '''
+    term, param, gradient = linear['gradient']
+    return linear['base'] + np.bincount(term, gradient*(np.asarray(theta, dtype=float) - linear['values'])[param], minlength=len(linear['base']))
+
+
+def linear_patch(linear, theta):
+    '''
+    This function computes the patch of a parameter vector from the linear terms.
+
+    Inputs:
+
+            linear: dictionary returned by linear_parameter_terms
+            theta: parameter vector, e.g. from parameter_vector
+
+    Returns: patch dictionary in the format of parameter_patch
+    '''
+    values = linear_term_values(linear, theta).tolist()
+    n_rows, n_coefs = len(linear['rows']), len(linear['coefficients'])
+    patch = {'row_bounds': {}, 'coefficients': [], 'costs': {}, 'offset': None}
+    for row, bound_type, rhs in zip(linear['rows'], linear['row_types'], values):
+        patch['row_bounds'][row] = [rhs if bound_type != 'upper' else -float('inf'), rhs if bound_type != 'lower' else float('inf')]
+    patch['coefficients'] = [[row, column, val] for (row, column), val in zip(linear['coefficients'], values[n_rows:])]
+    patch['costs'] = dict(zip(linear['costs'], values[n_rows + n_coefs:]))
+    if linear['offset']:
+        patch['offset'] = values[-1]
+    return patch
+
+
+def linear_indices(solver, linear):
+    '''
+    This function finds the row and column indices of the linear terms in a HiGHS base model, once per solver.
+
+    Inputs:
+
+            solver: highspy.Highs with the base model
+            linear: dictionary returned by linear_parameter_terms
+
+    Returns: dictionary with the arrays of row indices ('rows'), coefficient row and column indices ('coefficients'), cost
+             column indices ('costs') and the objective constant column (None when the model has none)
+    '''
+    lp = solver.getLp()
+    rows = {name: k for k, name in enumerate(lp.row_names_)}
+    columns = {name: k for k, name in enumerate(lp.col_names_)}
+    return {'rows': np.array([rows[row] for row in linear['rows']], dtype=np.int32),
+            'coefficients': [(rows[row], columns[column]) for row, column in linear['coefficients']],
+            'costs': np.array([columns[column] for column in linear['costs']], dtype=np.int32),
+            'offset': columns.get(OBJECTIVE_CONSTANT)}
+
+
+def apply_linear_patch(solver, linear, theta, indices=None):
+    '''
+    This function applies the patch of a parameter vector to a base model read with read_base_model. The bounds and costs
+    are changed with one call each in HiGHS.
+
+    Inputs:
+
+            solver: highspy.Highs or gurobipy.Model with the base model
+            linear: dictionary returned by linear_parameter_terms
+            theta: parameter vector, e.g. from parameter_vector
+            indices: dictionary returned by linear_indices for a HiGHS solver (None to find them)
+
+    Returns: None
+    '''
+    if not type(solver).__module__.startswith('highspy'):
+        apply_patch(solver, linear_patch(linear, theta))
+        return
+    indices = indices or linear_indices(solver, linear)
+    values = linear_term_values(linear, theta)
+    n_rows, n_coefs, n_costs = len(linear['rows']), len(linear['coefficients']), len(linear['costs'])
+    rhs = values[:n_rows]
+    types = np.array(linear['row_types'])
+    if n_rows > 0:
+        solver.changeRowsBounds(n_rows, indices['rows'], np.where(types == 'upper', -np.inf, rhs), np.where(types == 'lower', np.inf, rhs))
+    for (row, column), val in zip(indices['coefficients'], values[n_rows:n_rows + n_coefs].tolist()):
+        solver.changeCoeff(row, column, val)
+    if n_costs > 0:
+        solver.changeColsCost(n_costs, indices['costs'], values[n_rows + n_coefs:n_rows + n_coefs + n_costs])
+    if linear['offset']:
+        if indices['offset'] is not None:
+            solver.changeColCost(indices['offset'], values[-1])
+        else:
+            solver.changeObjectiveOffset(values[-1])
+
+
+def save_patches(patches, path):
+    '''
+    This function saves the patches of a sweep to a JSON file, e.g. to share them with solver workers reading the same
+    base model file.
+
+    Inputs:
+
+            patches: dictionary of patches by sweep point name
+            path: path of the JSON file
+
+    Returns: None
+    '''
+    with open(path, 'w') as f:
+        json.dump(patches, f)
+
+
+def load_patches(path):
+    '''
+    This function loads the patches saved by save_patches.
+
+    Inputs:
+
+            path: path of the JSON file
+
+    Returns: dictionary of patches by sweep point name
+    '''
+    with open(path) as f:
+        return json.load(f)
+
+
+def read_base_model(path, solver_name='highs'):
+    '''
+    This function reads an exported base model into a solver.
+
+    Inputs:
+
+            path: path of the MPS file written by export_base_model
+            solver_name: 'highs' (highspy) or 'gurobi' (gurobipy)
+
+    Returns: highspy.Highs or gurobipy.Model with the base model
+    '''
+    if solver_name == 'highs':
+        import highspy
+        solver = highspy.Highs()
+        solver.setOptionValue('output_flag', False)
+        if solver.readModel(path) != highspy.HighsStatus.kOk:
+            raise RuntimeError('HiGHS could not read ' + path)
+        return solver
+    if solver_name == 'gurobi':
+        import gurobipy
+        solver = gurobipy.read(path)
+        solver.Params.OutputFlag = 0
+        return solver
+    raise ValueError('Unsupported solver %s, choose highs or gurobi' % solver_name)
+
+
+def apply_patch(solver, patch):
+    '''
+    This function applies a patch to a base model read with read_base_model.
+
+    Inputs:
+
+            solver: highspy.Highs or gurobipy.Model with the base model
+            patch: dictionary returned by parameter_patch
+
+    Returns: None
+    '''
+    if type(solver).__module__.startswith('highspy'):
+        import highspy
+        rows = {}
+        for row, (lower, upper) in patch['row_bounds'].items():
+            rows[row] = solver.getRowByName(row)[1]
+            solver.changeRowBounds(rows[row], lower, upper)
+        for row, column, val in patch['coefficients']:
+            solver.changeCoeff(rows.get(row, solver.getRowByName(row)[1]), solver.getColByName(column)[1], val)
+        for column, val in patch['costs'].items():
+            solver.changeColCost(solver.getColByName(column)[1], val)
+        if patch['offset'] is not None:
+            status, column = solver.getColByName(OBJECTIVE_CONSTANT)
+            if status == highspy.HighsStatus.kOk:
+                solver.changeColCost(column, patch['offset'])
+            else:
+                solver.changeObjectiveOffset(patch['offset'])
+    else:
+        for row, (lower, upper) in patch['row_bounds'].items():
+            solver.getConstrByName(row).RHS = lower if lower > -float('inf') else upper
+        for row, column, val in patch['coefficients']:
+            solver.chgCoeff(solver.getConstrByName(row), solver.getVarByName(column), val)
+        for column, val in patch['costs'].items():
+            solver.getVarByName(column).Obj = val
+        if patch['offset'] is not None:
+            column = solver.getVarByName(OBJECTIVE_CONSTANT)
+            if column is not None:
+                column.Obj = patch['offset']
+            else:
+                solver.ObjCon = patch['offset']
+
+
+def solve_patched(solver, patch, gap=None, time_limit=None, threads=None):
+    '''
+    This function applies a patch to a base model and solves it.
+
+    Inputs:
+
+            solver: highspy.Highs or gurobipy.Model with the base model
+            patch: dictionary returned by parameter_patch
+            gap: relative MIP gap
+            time_limit: time limit in seconds
+            threads: number of threads
+
+    Returns: dictionary with the solver status, the objective value and the value of each column by name (empty when no
+             solution was found)
+    '''
+    apply_patch(solver, patch)
+    return solve_base_model(solver, gap=gap, time_limit=time_limit, threads=threads)
+
+
+def solve_base_model(solver, gap=None, time_limit=None, threads=None, values=True):
+    '''
+    This function solves a base model in its current state, e.g. after apply_patch or apply_linear_patch. HiGHS and
+    Gurobi start from the basis of the previous solve when only bounds and coefficients changed.
+
+    Inputs:
+
+            solver: highspy.Highs or gurobipy.Model with the base model
+            gap: relative MIP gap
+            time_limit: time limit in seconds
+            threads: number of threads
+            values: whether to return the value of each column (set to False when only the objective is needed)
+
+    Returns: dictionary with the solver status, the objective value and the value of each column by name (empty when no
+             solution was found or values is False)
+    '''
+    if type(solver).__module__.startswith('highspy'):
+        import highspy
+        for option, val in (('mip_rel_gap', gap), ('time_limit', time_limit), ('threads', threads)):
+            if val is not None:
+                solver.setOptionValue(option, val)
+        solver.run()
+        status = solver.modelStatusToString(solver.getModelStatus())
+        info = solver.getInfo()
+        #Only a feasible primal solution of an optimal or time limited solve is a solution, e.g. an infeasible LP still
+        #has the infeasible point where the simplex stopped
+        if info.primal_solution_status != 2 or solver.getModelStatus() not in (highspy.HighsModelStatus.kOptimal, highspy.HighsModelStatus.kTimeLimit):
+            return {'status': status, 'objective': None, 'values': {}}
+        if not values:
+            return {'status': status, 'objective': info.objective_function_value, 'values': {}}
+        names = solver.getLp().col_names_
+        return {'status': status, 'objective': info.objective_function_value, 'values': dict(zip(names, solver.getSolution().col_value))}
+    for option, val in (('MIPGap', gap), ('TimeLimit', time_limit), ('Threads', threads)):
+        if val is not None:
+            solver.setParam(option, val)
+    solver.optimize()
+    if solver.SolCount == 0:
+        return {'status': solver.Status, 'objective': None, 'values': {}}
+    if not values:
+        return {'status': solver.Status, 'objective': solver.ObjVal, 'values': {}}
+    return {'status': solver.Status, 'objective': solver.ObjVal, 'values': {var.VarName: var.X for var in solver.getVars()}}
+
+
+def load_solution(base, values):
+    '''
+    This function sets the variables of the exported Pyomo model to the values of a patched solve, so the results can be
+    saved with the same code as a Pyomo solve.
+
+    Inputs:
+
+            base: dictionary returned by export_base_model
+            values: value of each column by name, from solve_patched
+
+    Returns: None
+    '''
+    for column, var in base['columns'].items():
+        if column in values:
+            var.set_value(values[column], skip_validation=True)
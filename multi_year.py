@@ -0,0 +1,204 @@
+'''
+This file contains a multi-year extension of the supply chain model to plan the ramp of the SAF blend mandate, and a
+rolling horizon (fix-and-relax) solver for it.
+
+Each year is a copy of the model of create_supply_chain_model in the block year[t], with its own blend requirement,
+demands and prices. SAF plants persist once built: the investment binaries (y, y_ref, z) and the SAF capacity of each
+plant cannot decrease from one year to the next, so capacity is added incrementally. As in the single year model the SAF
+production of a plant is its capacity and the CAPEX of each year is the annualized CAPEX of the installed capacity.
+The objective is the discounted sum of the yearly objectives.
+
+The rolling horizon solver builds a window of a few years once and moves it over the horizon: the first years of the
+window keep their binaries, the later ones are relaxed, the first years are then committed and the capacity of the last
+committed year is passed to the next window through mutable parameters. Every solve is window times the size of the
+single year model, whatever the length of the horizon.
+'''
+
+#Import the necessary packages
+import time
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pyo
+
+from solver_backends import get_solver
+
+#Investment binaries that persist once built, with the production variable holding the SAF capacity of the plant
+PERSISTENT = {'y': 'x', 'y_ref': 'x_ref', 'z': 'v'}
+
+
+def yearly_data(m, years, blend, demand_growth=0.0, price_growth=None):
+    '''
+    This function builds the data of each year from the data of a model: the blend requirement of each year and the SAF
+    demands and prices grown from their values in the first year.
+
+    Inputs:
+
+            m: Pyomo model created by create_supply_chain_model with the first year data
+            years: list of years, e.g. [2030, 2031, 2032]
+            blend: blend requirement of each year (list) or a (first, last) tuple ramped linearly over the years
+            demand_growth: yearly growth rate of the airport jet fuel demands
+            price_growth: dictionary of yearly growth rates of the prices by product (None to keep the prices)
+
+    Returns: list of year dictionaries with the year ('year') and the values of the parameters that change ('blend_requirement',
+             'individual_saf_demand' and 'price', by index)
+    '''
+    if isinstance(blend, tuple):
+        blend = list(np.linspace(blend[0], blend[1], len(years)))
+    data = []
+    for t, year in enumerate(years):
+        values = {'year': year, 'blend_requirement': float(blend[t])}
+        if demand_growth:
+            values['individual_saf_demand'] = {a: pyo.value(m.individual_saf_demand[a])*(1 + demand_growth)**t for a in m.AIRPORTS}
+        if price_growth:
+            values['price'] = {product: pyo.value(m.price[product])*(1 + rate)**t for product, rate in price_growth.items()}
+        data.append(values)
+    return data
+
+
+def _set_year(block, values):
+    '''
+    Sets the mutable parameters of a year block to the values of a year
+    '''
+    for name, val in values.items():
+        if name == 'year':
+            continue
+        param = getattr(block, name)
+        if not param.mutable:
+            raise ValueError('Parameter %s changes between years, build the model with it in mutable_params' % name)
+        for index, v in (val.items() if isinstance(val, dict) else [(None, val)]):
+            param[index] = v
+
+
+def create_multi_year_model(m, years, discount_rate=0.0):
+    '''
+    This function builds the multi-year model: one copy of m per year in the blocks mm.year, linked by the persistence of
+    the SAF investments and capacities, and the discounted objective. The first year is linked to the mutable parameters
+    previous_investment and previous_capacity (no plants by default).
+
+    Inputs:
+
+            m: Pyomo model from create_supply_chain_model with the fixes of the case applied and the parameters that change
+               over the years mutable
+            years: list of year dictionaries, e.g. from yearly_data
+            discount_rate: yearly discount rate of the objective
+
+    Returns: Pyomo model mm with the objective in the sense of m
+    '''
+    mm = pyo.ConcreteModel()
+    mm.YEARS = pyo.RangeSet(0, len(years) - 1)
+    mm.year = pyo.Block(mm.YEARS)
+    for t in mm.YEARS:
+        mm.year[t].transfer_attributes_from(m.clone())
+        mm.year[t].objective.deactivate()
+        _set_year(mm.year[t], years[t])
+    mm.binary_list = {t: [v for v in mm.year[t].component_data_objects(pyo.Var) if v.is_binary() and not v.fixed] for t in mm.YEARS}
+
+    #Investments and capacities of the plants in the year before the first one
+    mm.PLANTS = pyo.Set(initialize=[(name, i) for name in PERSISTENT for i in getattr(m, name) if not getattr(m, name)[i].fixed], dimen=2)
+    mm.previous_investment = pyo.Param(mm.PLANTS, initialize=0, mutable=True)
+    mm.previous_capacity = pyo.Param(mm.PLANTS, initialize=0, mutable=True)
+    mm.discount = pyo.Param(mm.YEARS, initialize={t: 1/(1 + discount_rate)**t for t in mm.YEARS}, mutable=True)
+
+    #SAF plants are kept once built
+    def persistent_investment(mm, t, name, i):
+        previous = getattr(mm.year[t-1], name)[i] if t > 0 else mm.previous_investment[name, i]
+        return getattr(mm.year[t], name)[i] >= previous
+    mm.persistent_investment = pyo.Constraint(mm.YEARS, mm.PLANTS, rule=persistent_investment)
+
+    #SAF capacity is only added
+    def persistent_capacity(mm, t, name, i):
+        previous = getattr(mm.year[t-1], PERSISTENT[name])[i, 'saf'] if t > 0 else mm.previous_capacity[name, i]
+        return getattr(mm.year[t], PERSISTENT[name])[i, 'saf'] >= previous
+    mm.persistent_capacity = pyo.Constraint(mm.YEARS, mm.PLANTS, rule=persistent_capacity)
+
+    def discounted_objective(mm):
+        return sum(mm.discount[t]*mm.year[t].objective.expr for t in mm.YEARS)
+    mm.objective = pyo.Objective(rule=discounted_objective, sense=m.objective.sense)
+    return mm
+
+
+def _relax_years(mm, first):
+    '''
+    Relaxes the binaries of the years from first on and restores those of the earlier years
+    '''
+    for t in mm.YEARS:
+        for v in mm.binary_list[t]:
+            v.domain = pyo.UnitInterval if t >= first else pyo.Binary
+
+
+def solve_rolling_horizon(m, years, solver='gurobi', gap=None, solver_options=None, window=2, step=1, discount_rate=0.0,
+                          report_file=None, tee=False):
+    '''
+    This function solves the multi-year model with a rolling horizon: windows of window years are solved with the binaries
+    of their first step years and relaxed binaries in the later years, and those first step years are committed. The
+    windows past the last year repeat the data of the last year without weight in the objective.
+
+    Inputs:
+
+            m: Pyomo model from create_supply_chain_model with the fixes of the case applied and the parameters that change
+               over the years mutable
+            years: list of year dictionaries, e.g. from yearly_data
+            solver: name of the MILP solver, one of solver_backends.SOLVER_OPTIONS
+            gap: relative MIP gap of the window solves
+            solver_options: dictionary of solver specific options passed to the solver
+            window: number of years of each solve (1 for a myopic solve of one year at a time)
+            step: number of years committed after each solve, at most window
+            discount_rate: yearly discount rate of the objective
+            report_file: path of a CSV file to save the yearly results to (None to skip)
+            tee: True to print the progress of each window
+
+    Returns: report: pandas DataFrame with the blend, objective, SAF plants and added capacity of each year and the
+                     size and solve time of its window
+             capacity: pandas DataFrame with the SAF capacity of every plant (rows) in every year (columns)
+    '''
+    if not 1 <= step <= window:
+        raise ValueError('step must be between 1 and window')
+    mm = create_multi_year_model(m, years[:1]*window, discount_rate)
+    solver = get_solver(solver, gap=gap, options=solver_options)
+    plants = list(mm.PLANTS)
+    invested = {plant: 0 for plant in plants}
+    previous = {plant: 0 for plant in plants}
+
+    report = []
+    capacity = {}
+    for start in range(0, len(years), step):
+        #Move the window: year data, weights of the years inside the horizon and the capacity built so far
+        for t in mm.YEARS:
+            _set_year(mm.year[t], years[min(start + t, len(years) - 1)])
+            mm.discount[t] = 1/(1 + discount_rate)**(start + t) if start + t < len(years) else 0
+        for plant in plants:
+            mm.previous_investment[plant] = invested[plant]
+            mm.previous_capacity[plant] = previous[plant]
+        _relax_years(mm, step)
+
+        begin = time.time()
+        results = solver.solve(mm, load_solutions=False)
+        if len(results.solution) == 0 or results.solver.termination_condition not in (pyo.TerminationCondition.optimal, pyo.TerminationCondition.maxTimeLimit):
+            raise RuntimeError('Rolling horizon window starting in %s terminated with %s' % (years[start]['year'], results.solver.termination_condition))
+        mm.solutions.load_from(results)
+        solve_time = time.time() - begin
+
+        #Commit the first step years
+        for t in range(min(step, len(years) - start)):
+            block = mm.year[t]
+            year = years[start + t]['year']
+            invested = {(name, i): int(round(pyo.value(getattr(block, name)[i]))) for name, i in plants}
+            built = {plant: invested[plant]*pyo.value(getattr(block, PERSISTENT[plant[0]])[plant[1], 'saf']) for plant in plants}
+            capacity[year] = built
+            report.append({'year': year, 'blend': pyo.value(block.blend_requirement), 'objective': pyo.value(block.objective),
+                           'plants': sum(invested.values()),
+                           'added capacity': sum(built[plant] - previous[plant] for plant in plants),
+                           'window start': years[start]['year'], 'window years': window, 'solve time': solve_time})
+            previous = built
+            if tee:
+                print('Rolling horizon year %s: objective %.8e plants %d added capacity %.0f (%.1f s)' % (year, report[-1]['objective'], report[-1]['plants'], report[-1]['added capacity'], solve_time))
+
+    _relax_years(mm, len(mm.YEARS))
+    report = pd.DataFrame(report)
+    report['discounted objective'] = report['objective']/(1 + discount_rate)**np.arange(len(report))
+    if report_file is not None:
+        report.to_csv(report_file)
+    capacity = pd.DataFrame(capacity)
+    capacity.index = pd.MultiIndex.from_tuples(capacity.index, names=['plant type', 'location'])
+    return report, capacity
@@ -0,0 +1,241 @@
+'''
+This file contains a lightweight profiler for the model lifecycle of the run scripts: timers around phases (reading data,
+building the model, solving, exporting results), the construction time of every named constraint, expression and
+variable block of the model from Pyomo's construction timing, and optional cProfile and tracemalloc hooks. The timing and
+peak memory breakdown of a run is saved as JSON.
+'''
+
+#Import the necessary packages
+import cProfile
+import json
+import logging
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    #resource is not available on Windows, the peak resident memory is then not reported
+    resource = None
+
+#Profiler collecting the phases started through start_phase, stop_phase and phase (None when no profiler is active)
+_ACTIVE = None
+
+#Logger of Pyomo's component construction timers
+_CONSTRUCTION_LOGGER = logging.getLogger('pyomo.common.timing.construction')
+
+
+class _ConstructionHandler(logging.Handler):
+    '''
+    Logging handler recording the construction time of every Pyomo component reported by the construction logger
+    '''
+    def __init__(self, components):
+        logging.Handler.__init__(self, logging.INFO)
+        self.components = components
+
+    def emit(self, record):
+        timer = record.msg
+        if not hasattr(timer, 'obj'):
+            return
+        try:
+            ctype = timer.obj.ctype.__name__
+            indices = len(timer.obj) if timer.obj.is_indexed() else 1
+        except Exception:
+            ctype = type(timer.obj).__name__
+            indices = None
+        entry = self.components.setdefault(timer.name, {'type': ctype, 'indices': indices, 'calls': 0, 'time': 0})
+        entry['calls'] += 1
+        entry['time'] += timer.timer
+
+
+class RunProfiler:
+    '''
+    This class profiles a run script. Use it as a context manager around the run (or call enable and disable), mark the
+    phases with phase (context manager) or start and stop, and save the breakdown with save.
+
+    Inputs:
+
+            name: name of the run, stored in the report
+            cprofile: True to profile the Python functions called during the run with cProfile
+            memory: True to trace the peak Python memory of every phase with tracemalloc (slows the run down)
+            components: True to record the construction time of every Pyomo component
+            top: number of functions reported when cprofile is True
+    '''
+    def __init__(self, name, cprofile=False, memory=False, components=True, top=30):
+        self.name = name
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.memory = memory
+        self.components = {} if components else None
+        self.top = top
+        self.phases = {}
+        self.open = {}
+        self.start_time = None
+        self.wall_time = None
+        self._handler = None
+        self._logger_state = None
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, et, ev, tb):
+        self.disable()
+
+    def enable(self):
+        '''
+        Starts profiling the run and makes this profiler the one collecting start_phase, stop_phase and phase
+        '''
+        global _ACTIVE
+        _ACTIVE = self
+        self.start_time = time.time()
+        if self.components is not None:
+            self._handler = _ConstructionHandler(self.components)
+            self._logger_state = (_CONSTRUCTION_LOGGER.level, _CONSTRUCTION_LOGGER.propagate)
+            _CONSTRUCTION_LOGGER.setLevel(logging.INFO)
+            _CONSTRUCTION_LOGGER.propagate = False
+            _CONSTRUCTION_LOGGER.addHandler(self._handler)
+        if self.memory:
+            tracemalloc.start()
+        if self.cprofile is not None:
+            self.cprofile.enable()
+        return self
+
+    def disable(self):
+        '''
+        Stops profiling the run, stopping the phases still open
+        '''
+        global _ACTIVE
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        for name in list(self.open):
+            self.stop(name)
+        if self.memory:
+            tracemalloc.stop()
+        if self._handler is not None:
+            _CONSTRUCTION_LOGGER.removeHandler(self._handler)
+            _CONSTRUCTION_LOGGER.setLevel(self._logger_state[0])
+            _CONSTRUCTION_LOGGER.propagate = self._logger_state[1]
+        self.wall_time = time.time() - self.start_time
+        _ACTIVE = None
+
+    def _update_peaks(self):
+        '''
+        Passes the traced memory peak since the last update to all open phases, so nested phases keep correct peaks
+        '''
+        if not (self.memory and tracemalloc.is_tracing()):
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        for record in self.open.values():
+            record['peak_memory'] = max(record['peak_memory'], peak)
+        tracemalloc.reset_peak()
+
+    def start(self, name):
+        '''
+        Starts timing the phase name, phases can be nested but a phase cannot be started twice before it is stopped
+        '''
+        self._update_peaks()
+        self.open[name] = {'wall': time.perf_counter(), 'cpu': time.process_time(), 'peak_memory': 0}
+
+    def stop(self, name):
+        '''
+        Stops timing the phase name and adds the elapsed time to the phase totals
+        '''
+        self._update_peaks()
+        record = self.open.pop(name)
+        totals = self.phases.setdefault(name, {'calls': 0, 'wall_time': 0, 'cpu_time': 0, 'peak_memory_mb': None})
+        totals['calls'] += 1
+        totals['wall_time'] += time.perf_counter() - record['wall']
+        totals['cpu_time'] += time.process_time() - record['cpu']
+        if self.memory:
+            totals['peak_memory_mb'] = max(totals['peak_memory_mb'] or 0, record['peak_memory']/1e6)
+
+    @contextmanager
+    def phase(self, name):
+        '''
+        Context manager timing the phase name
+        '''
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def report(self):
+        '''
+        This function summarizes the run.
+
+        Returns: dictionary with the total wall time, the peak resident memory, the phase totals, the construction time of
+                 each Pyomo component (slowest first) and the functions with the largest cumulative time if cprofile is True
+        '''
+        report = {
+            'run': self.name,
+            'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.start_time)) if self.start_time else None,
+            'wall_time': self.wall_time if self.wall_time is not None else time.time() - self.start_time,
+            'peak_rss_mb': peak_rss_mb(),
+            'phases': self.phases,
+        }
+        if self.components is not None:
+            report['components'] = [dict(name=name, **entry) for name, entry in
+                                    sorted(self.components.items(), key=lambda item: -item[1]['time'])]
+        if self.cprofile is not None:
+            stats = pstats.Stats(self.cprofile)
+            functions = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:self.top]
+            report['functions'] = [{'function': '%s:%d(%s)' % key, 'calls': val[1], 'total_time': val[2], 'cumulative_time': val[3]}
+                                   for key, val in functions]
+        return report
+
+    def save(self, path):
+        '''
+        This function saves the report of the run to a JSON file.
+
+        Inputs:
+
+                path: path of the JSON file
+
+        Returns: report dictionary
+        '''
+        report = self.report()
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        return report
+
+
+def peak_rss_mb():
+    '''
+    Returns the peak resident memory of the process in MB, or None where it is not available
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak/1e6 if sys.platform == 'darwin' else peak/1e3
+
+
+def start_phase(name):
+    '''
+    Starts timing the phase name in the active RunProfiler, does nothing when no profiler is active
+    '''
+    if _ACTIVE is not None:
+        _ACTIVE.start(name)
+
+
+def stop_phase(name):
+    '''
+    Stops timing the phase name in the active RunProfiler, does nothing when no profiler is active
+    '''
+    if _ACTIVE is not None and name in _ACTIVE.open:
+        _ACTIVE.stop(name)
+
+
+@contextmanager
+def phase(name):
+    '''
+    Context manager timing the phase name in the active RunProfiler, does nothing when no profiler is active
+    '''
+    start_phase(name)
+    try:
+        yield
+    finally:
+        stop_phase(name)
@@ -0,0 +1,392 @@
+'''
+This file contains an offline road distance engine: shortest path distances on a local road graph between the facilities
+of a facility index (mills to all airports, refineries and nearby mills, refineries to airports), to replace the great
+circle distances of the distance sheets.
+
+Facilities are snapped to their nearest road node, with the great circle distance to it added at both ends of the path.
+Shortest paths are computed with scipy's Dijkstra from batches of source nodes, batches running in a process pool. Every
+distance computed is stored in a persistent cache keyed by facility pair (with the facility coordinates and a signature
+of the graph), so regenerating the distance sheets after a facility is added or moved only runs the missing sources.
+'''
+
+#Import the necessary packages
+import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from facility_index import DISTANCE_SHEETS, FacilityIndex, _unit_vectors
+from synthetic_data import EARTH_RADIUS
+
+#Direction of the trips of each distance sheet: kind of facility of the origins and of the destinations
+TRIPS = {'mill_distances': ('mills', 'mills'),
+         'airport_distances': ('mills', 'airports'),
+         'mill_ref_distances': ('mills', 'refineries'),
+         'ref_air_distances': ('refineries', 'airports')}
+
+#Columns of the distance cache
+CACHE_COLUMNS = ['graph', 'origin kind', 'origin', 'destination kind', 'destination', 'origin latitude', 'origin longitude',
+                 'destination latitude', 'destination longitude', 'limit', 'distance']
+
+#Road network shared with the worker processes
+_ROAD_NETWORK = None
+
+
+class RoadNetwork:
+    '''
+    Road graph with the coordinates of its nodes and the length of its edges, units: km
+    '''
+
+    def __init__(self, nodes, edges, directed=False):
+        '''
+        Inputs:
+
+                nodes: pandas DataFrame with the 'node' id, 'Latitude' and 'Longitude' of the road nodes
+                edges: pandas DataFrame with the nodes of the ends ('u', 'v') and the 'length' of the road edges, units: km
+                directed: True if the edges can only be travelled from u to v (one way roads)
+        '''
+        self.nodes = pd.Index(nodes['node'])
+        self.coordinates = nodes[['Latitude', 'Longitude']].to_numpy(dtype=float)
+        u = self.nodes.get_indexer(edges['u'])
+        v = self.nodes.get_indexer(edges['v'])
+        if (u < 0).any() or (v < 0).any():
+            raise ValueError('%d road edges end at nodes missing from the nodes table' % ((u < 0) | (v < 0)).sum())
+        #Keep the shortest of parallel edges, zero lengths would be read as missing edges
+        length = np.maximum(edges['length'].to_numpy(dtype=float), 1e-9)
+        order = np.lexsort((length, v, u))
+        u, v, length = u[order], v[order], length[order]
+        first = np.ones(len(u), dtype=bool)
+        first[1:] = (u[1:] != u[:-1]) | (v[1:] != v[:-1])
+        self.graph = csr_matrix((length[first], (u[first], v[first])), shape=(len(self.nodes), len(self.nodes)))
+        self.directed = directed
+        self._tree = cKDTree(_unit_vectors(self.coordinates))
+
+        #Signature of the graph, cached distances of another graph are not used
+        signature = hashlib.sha1()
+        for array in (self.coordinates, self.graph.indptr, self.graph.indices, self.graph.data):
+            signature.update(np.ascontiguousarray(array).tobytes())
+        signature.update(b'directed' if directed else b'undirected')
+        self.signature = signature.hexdigest()[:16]
+
+    @classmethod
+    def from_files(cls, nodes_file, edges_file, directed=False, length_unit=1.0):
+        '''
+        This function loads a road graph from node and edge tables (CSV, Excel or Parquet files), e.g. an OSM extract
+        exported with osmnx.graph_to_gdfs.
+
+        Inputs:
+
+                nodes_file: table of the nodes with the columns node (or osmid), Latitude and Longitude (or y and x)
+                edges_file: table of the edges with the columns u, v and length
+                directed: True if the edges can only be travelled from u to v
+                length_unit: length of one unit of the length column, units: km (0.001 for lengths in meters)
+
+        Returns: RoadNetwork
+        '''
+        nodes, edges = _read_table(nodes_file), _read_table(edges_file)
+        nodes = nodes.rename(columns={'osmid': 'node', 'y': 'Latitude', 'x': 'Longitude'})
+        edges = edges.assign(length=edges['length']*length_unit)
+        return cls(nodes, edges, directed)
+
+    @classmethod
+    def from_graphml(cls, path, directed=False):
+        '''
+        This function loads a road graph saved by osmnx.save_graphml (node coordinates y and x, edge lengths in meters).
+        Requires networkx.
+
+        Inputs:
+
+                path: path of the GraphML file
+                directed: True to keep the one way roads of the file
+
+        Returns: RoadNetwork
+        '''
+        try:
+            import networkx as nx
+        except ImportError:
+            raise ImportError('Reading GraphML road graphs requires networkx, or export the graph to node and edge tables for RoadNetwork.from_files')
+        graph = nx.read_graphml(path)
+        nodes = pd.DataFrame([(node, float(data['y']), float(data['x'])) for node, data in graph.nodes(data=True)],
+                             columns=['node', 'Latitude', 'Longitude'])
+        edges = pd.DataFrame([(u, v, float(data['length'])/1000) for u, v, data in graph.edges(data=True)],
+                             columns=['u', 'v', 'length'])
+        return cls(nodes, edges, directed)
+
+    def snap(self, coordinates):
+        '''
+        This function finds the nearest road node of each location.
+
+        Inputs:
+
+                coordinates: array of (latitude, longitude) rows, units: degrees
+
+        Returns: array of the positions of the nearest nodes and array of the great circle distances to them, units: km
+        '''
+        chords, positions = self._tree.query(_unit_vectors(np.asarray(coordinates, dtype=float).reshape(-1, 2)))
+        return np.atleast_1d(positions), 2*EARTH_RADIUS*np.arcsin(np.minimum(np.atleast_1d(chords)/2, 1))
+
+    def shortest_paths(self, sources, targets, limit=np.inf, workers=1, batch_size=None):
+        '''
+        This function computes the shortest path distances from source nodes to target nodes.
+
+        Inputs:
+
+                sources: positions of the source nodes
+                targets: positions of the target nodes
+                limit: longest path searched, longer paths are returned as inf, units: km
+                workers: number of processes running batches of sources in parallel
+                batch_size: number of sources of each Dijkstra run, None for batches of about 256 MB of distances
+
+        Returns: array with one row per source and one column per target, units: km (inf when there is no path)
+        '''
+        global _ROAD_NETWORK
+        sources, targets = np.asarray(sources, dtype=int), np.asarray(targets, dtype=int)
+        if len(sources) == 0:
+            return np.zeros((0, len(targets)))
+        if batch_size is None:
+            batch_size = max(1, int(2**25//len(self.nodes)))
+        if workers > 1:
+            batch_size = min(batch_size, -(-len(sources)//workers))
+        tasks = [(sources[k:k + batch_size], targets, limit) for k in range(0, len(sources), batch_size)]
+        _ROAD_NETWORK = self
+        try:
+            if workers > 1 and len(tasks) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+                with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+                    results = list(pool.map(_run_dijkstra, tasks))
+            else:
+                results = [_run_dijkstra(task) for task in tasks]
+        finally:
+            _ROAD_NETWORK = None
+        return np.vstack(results)
+
+
+def _read_table(path):
+    '''
+    Reads a CSV, Excel or Parquet table
+    '''
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.parquet', '.pq'):
+        return pd.read_parquet(path)
+    if extension in ('.xlsx', '.xls'):
+        return pd.read_excel(path)
+    return pd.read_csv(path)
+
+
+def _run_dijkstra(task):
+    '''
+    Runs Dijkstra from a batch of sources of the shared road network, task = (sources, targets, limit)
+    '''
+    sources, targets, limit = task
+    distances = dijkstra(_ROAD_NETWORK.graph, directed=_ROAD_NETWORK.directed, indices=sources, limit=limit)
+    return distances[:, targets]
+
+
+def _read_cache(cache_file):
+    '''
+    Reads the cache file with the distances exactly as saved
+    '''
+    return pd.read_csv(cache_file, dtype={'graph': str, 'origin': str, 'destination': str}, float_precision='round_trip')
+
+
+def _cover(origins, destinations, directed):
+    '''
+    Returns the fewest nodes found greedily such that every (origin, destination) pair has its origin among them, or on an
+    undirected graph either end
+    '''
+    if directed:
+        return np.unique(origins)
+    chosen = []
+    remaining = np.ones(len(origins), dtype=bool)
+    size = max(origins.max(), destinations.max()) + 1
+    while remaining.any():
+        counts = np.bincount(origins[remaining], minlength=size) + np.bincount(destinations[remaining], minlength=size)
+        best = int(np.argmax(counts))
+        chosen.append(best)
+        remaining &= (origins != best) & (destinations != best)
+    return np.array(sorted(chosen), dtype=int)
+
+
+def load_cache(cache_file, signature):
+    '''
+    This function loads the cached road distances of a road graph.
+
+    Inputs:
+
+            cache_file: path of the CSV file of the cache
+            signature: signature of the road graph (RoadNetwork.signature)
+
+    Returns: pandas DataFrame of the cache rows of the graph, indexed by (origin kind, origin, destination kind, destination)
+    '''
+    if cache_file is None or not os.path.isfile(cache_file):
+        cache = pd.DataFrame(columns=CACHE_COLUMNS)
+    else:
+        cache = _read_cache(cache_file)
+        cache = cache[cache['graph'] == signature]
+    return cache.set_index(['origin kind', 'origin', 'destination kind', 'destination'])
+
+
+def _save_cache(cache_file, rows):
+    '''
+    Appends new rows to the cache file, keeping the last distance of each pair and graph
+    '''
+    if cache_file is None or len(rows) == 0:
+        return
+    rows = pd.DataFrame(rows, columns=CACHE_COLUMNS)
+    if os.path.isfile(cache_file):
+        rows = pd.concat([_read_cache(cache_file), rows], ignore_index=True)
+    rows = rows.drop_duplicates(['graph', 'origin kind', 'origin', 'destination kind', 'destination'], keep='last')
+    rows.to_csv(cache_file, index=False)
+
+
+def road_distance_index(index, network, cache_file='road_distance_cache.csv', mill_radius=None, fallback_factor=None,
+                        workers=1, tee=False):
+    '''
+    This function computes the road distances of the four distance sheets between the facilities of a facility index,
+    running Dijkstra only from the facilities with pairs missing from the cache.
+
+    Mill to mill distances are only searched up to mill_radius. Pairs further apart, whichever run reached them, and pairs
+    with no road path between them get the great circle distance times fallback_factor, so the distances are the same
+    whatever the cache holds (check_fresh_run compares them with a run without cache).
+
+    Inputs:
+
+            index: facility_index.FacilityIndex of the facilities
+            network: RoadNetwork
+            cache_file: path of the CSV file of the distance cache (None for no cache)
+            mill_radius: longest road distance searched between mills, units: km (None for all mill pairs)
+            fallback_factor: ratio of the road distance to the great circle distance of the pairs without a road distance,
+                             None for the median ratio of the pairs with one within the search limit
+            workers: number of processes running Dijkstra
+            tee: True to print the progress
+
+    Returns: road_index: FacilityIndex with the road distance matrices, to save or pass to create_supply_chain_model
+             report: pandas DataFrame with the number of pairs, cached, computed and fallback distances of each sheet
+    '''
+    begin = time.time()
+    limit = np.inf if mill_radius is None else float(mill_radius)
+    cache = load_cache(cache_file, network.signature)
+
+    #Road node of every facility
+    node, access = {}, {}
+    for kind in index.names:
+        node[kind], access[kind] = network.snap(index.coordinates[kind])
+
+    #Cached distances of each sheet, valid for the current locations of both facilities and, for the pairs beyond the
+    #search limit, a limit at least mill_radius
+    road, missing = {}, {}
+    for sheet, (origins, destinations) in TRIPS.items():
+        sheet_limit = limit if sheet == 'mill_distances' else np.inf
+        n_origins, n_destinations = len(index.names[origins]), len(index.names[destinations])
+        pairs = pd.MultiIndex.from_arrays([[origins]*n_origins*n_destinations, np.repeat(index.names[origins], n_destinations),
+                                           [destinations]*n_origins*n_destinations, np.tile(index.names[destinations], n_origins)])
+        rows = cache.reindex(pairs)
+        location = np.hstack([np.repeat(index.coordinates[origins], n_destinations, axis=0), np.tile(index.coordinates[destinations], (n_origins, 1))])
+        cached_location = rows[['origin latitude', 'origin longitude', 'destination latitude', 'destination longitude']].to_numpy(dtype=float)
+        distance = rows['distance'].to_numpy(dtype=float)
+        valid = (np.abs(cached_location - location) <= 1e-7).all(axis=1) & (np.isfinite(distance) | (rows['limit'].to_numpy(dtype=float) >= sheet_limit))
+        matrix = np.where(valid, distance, np.nan).reshape(n_origins, n_destinations)
+        if sheet == 'mill_distances':
+            np.fill_diagonal(matrix, 0.0)
+        road[sheet] = matrix
+        missing[sheet] = np.argwhere(np.isnan(matrix))
+    report = {sheet: {'pairs': road[sheet].size, 'cached': road[sheet].size - len(missing[sheet])} for sheet in TRIPS}
+
+    #Run Dijkstra from few nodes covering the missing pairs (an end of every pair on an undirected graph, the origins on a
+    #directed one), without limit for the airport and refinery sheets first and then with the limit for the remaining mill pairs
+    targets = np.unique(np.concatenate([node[kind] for kind in index.names]))
+    new_rows = []
+    for phase in (('airport_distances', 'mill_ref_distances', 'ref_air_distances'), ('mill_distances',)):
+        pair_limit = limit if phase == ('mill_distances',) else np.inf
+        pairs = [(sheet, o, d) for sheet in phase for o, d in missing[sheet] if np.isnan(road[sheet][o, d])]
+        if not pairs:
+            continue
+        origin_nodes = np.array([node[TRIPS[sheet][0]][o] for sheet, o, d in pairs])
+        destination_nodes = np.array([node[TRIPS[sheet][1]][d] for sheet, o, d in pairs])
+        sources = _cover(origin_nodes, destination_nodes, network.directed)
+        if tee:
+            print('Road distances: %d missing pairs, Dijkstra from %d nodes' % (len(pairs), len(sources)))
+        paths = network.shortest_paths(sources, targets, limit=pair_limit, workers=workers)
+        source_row = {n: k for k, n in enumerate(sources)}
+        target_column = {n: k for k, n in enumerate(targets)}
+
+        #Fill every missing pair the runs reached, including the pairs of the other sheets
+        for sheet, (origins, destinations) in TRIPS.items():
+            sheet_limit = limit if sheet == 'mill_distances' else np.inf
+            if pair_limit < sheet_limit:
+                continue
+            for o, d in missing[sheet]:
+                if not np.isnan(road[sheet][o, d]):
+                    continue
+                a, b = node[origins][o], node[destinations][d]
+                if a in source_row:
+                    path = paths[source_row[a], target_column[b]]
+                elif not network.directed and b in source_row:
+                    path = paths[source_row[b], target_column[a]]
+                else:
+                    continue
+                road[sheet][o, d] = path + access[origins][o] + access[destinations][d]
+                new_rows.append([network.signature, origins, index.names[origins][o], destinations, index.names[destinations][d],
+                                 *index.coordinates[origins][o], *index.coordinates[destinations][d], sheet_limit, road[sheet][o, d]])
+    _save_cache(cache_file, new_rows)
+
+    #Mill pairs beyond mill_radius reached by the runs without limit, or cached from a run with a longer limit, fall back
+    #like the pairs a run with the limit does not reach
+    road['mill_distances'][road['mill_distances'] > limit] = np.inf
+
+    #Great circle distances times the fallback factor for the pairs without road distance
+    great_circle = {}
+    for sheet, (origins, destinations) in TRIPS.items():
+        rows, columns = DISTANCE_SHEETS[sheet]
+        great_circle[sheet] = index.distances(sheet)/index.road_factor if rows == origins else (index.distances(sheet)/index.road_factor).T
+    if fallback_factor is None:
+        #Median ratio of the pairs more than 1 km apart with a road distance within the search limit
+        ratios = []
+        for sheet in TRIPS:
+            found = np.isfinite(road[sheet]) & (great_circle[sheet] > 1)
+            ratios.append(road[sheet][found]/great_circle[sheet][found])
+        ratios = np.concatenate(ratios)
+        fallback_factor = float(np.median(ratios)) if len(ratios) else 1.0
+    road_index = FacilityIndex(index.locations(), road_factor=fallback_factor, radius=index.radius)
+    for sheet, (origins, destinations) in TRIPS.items():
+        fallback = ~np.isfinite(road[sheet])
+        road[sheet][fallback] = fallback_factor*great_circle[sheet][fallback]
+        apart = great_circle[sheet] > 1
+        report[sheet].update({'computed': len(missing[sheet]), 'fallback': int(fallback.sum()),
+                              'mean road to great circle ratio': float(np.mean(road[sheet][apart]/great_circle[sheet][apart])) if apart.any() else np.nan})
+        rows, columns = DISTANCE_SHEETS[sheet]
+        road_index.set_distances(sheet, road[sheet] if rows == origins else road[sheet].T)
+    report = pd.DataFrame(report).T
+    if tee:
+        print(report)
+        print('Road distances done in %.1f s, fallback factor %.3f' % (time.time() - begin, fallback_factor))
+    return road_index, report
+
+
+
+def check_fresh_run(road_index, index, network, mill_radius=None, fallback_factor=None, workers=1):
+    '''
+    This function recomputes the road distances of a facility index without the cache and compares them with road
+    distances computed with it, to check that an incremental update matches a fresh run.
+
+    Inputs:
+
+            road_index: FacilityIndex returned by road_distance_index with the cache
+            index: facility_index.FacilityIndex of the facilities
+            network: RoadNetwork
+            mill_radius: mill_radius of the run with the cache, units: km
+            fallback_factor: fallback_factor of the run with the cache
+            workers: number of processes running Dijkstra
+
+    Returns: pandas Series with the largest absolute difference of each distance sheet, units: km
+    '''
+    fresh_index, _ = road_distance_index(index, network, cache_file=None, mill_radius=mill_radius,
+                                         fallback_factor=fallback_factor, workers=workers)
+    return pd.Series({sheet: float(np.max(np.abs(road_index.distances(sheet) - fresh_index.distances(sheet)), initial=0.0))
+                      for sheet in TRIPS})
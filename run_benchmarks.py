@@ -0,0 +1,36 @@
+from benchmarks import SCENARIOS, run_benchmarks, save_baseline, load_baseline, compare_to_baseline
+import os
+
+this_file_path = os.path.dirname(os.path.realpath(__file__))
+
+# create a directory to save results
+results_dir = os.path.join(this_file_path, "benchmark_results")
+if not os.path.isdir(results_dir):
+    os.mkdir(results_dir)
+
+#Specify Input Data and Benchmark Settings
+data = 'base_case_data_with_demands.xlsx'
+scenarios = list(SCENARIOS) #Replace with a list of names, e.g. ['Case1_blend_0', 'Case1_blend_50'], for a quick check
+solver_name = None #Use HiGHS or CBC, whichever is available
+gap = 0.0001 #Fix MIP gap to 0.01%
+time_limit = 600 #Time limit per solve in seconds
+repeat = 1 #Runs of each scenario, the fastest time of each step is kept
+threshold = 0.25 #Flag timings or peak memory more than 25% above the baseline as regressions
+update_baseline = False #Set to True to store this run as the new baseline
+
+baseline_file = results_dir + "/baseline.json"
+
+#Run the benchmark suite
+results = run_benchmarks(data, scenarios, solver_name=solver_name, gap=gap, time_limit=time_limit, repeat=repeat)
+results.to_csv(results_dir + "/benchmark.csv")
+
+#Compare with the stored baseline, or store the first run as the baseline
+if update_baseline or not os.path.isfile(baseline_file):
+    save_baseline(results, baseline_file)
+    print('Saved the baseline to', baseline_file)
+else:
+    comparison = compare_to_baseline(results, load_baseline(baseline_file), threshold=threshold)
+    comparison.to_csv(results_dir + "/comparison.csv")
+    print(comparison[comparison['status'] != 'ok'])
+    if (comparison['status'] == 'regression').any():
+        print('Performance regressions found, see', results_dir + "/comparison.csv")
@@ -0,0 +1,87 @@
+from create_sc_model_full import *
+from benders_decomposition import solve_benders
+from solver_backends import default_solver, get_solver, solve_model
+from synthetic_data import generate_synthetic_data
+from concurrent.futures.process import BrokenProcessPool
+import os
+import time
+import pandas as pd
+
+this_file_path = os.path.dirname(os.path.realpath(__file__))
+
+# create a directory to save results
+results_dir = os.path.join(this_file_path, "benders_comparison")
+if not os.path.isdir(results_dir):
+    os.mkdir(results_dir)
+
+#Specify Input Data and Parameters
+data = 'base_case_data_with_demands.xlsx'
+scale = 3 #The synthetic instance has scale times the mills, airports and refineries of the base case
+seed = 0 #Seed of the synthetic instance, keep it fixed to compare runs
+saf_prem = 0 #No SAF premium
+eth_prem = 0 #No ethanol premium
+max_saf_capacity = 700000
+blend = 0.1 #10% SAF blend
+
+#Select the solver, set the SC_SOLVER environment variable to gurobi, appsi_highs or cbc to override the default
+solver_name = default_solver()
+
+#Benders settings
+n_cuts = 3 #Candidate designs evaluated per iteration
+workers = 4 #Parallel subproblem solves
+tol = 0.0001 #Relative gap between the Benders bound and incumbent to stop at, as the 0.01% MIP gap of the monolithic solve
+time_limit = 3600 #Time limit per solve in seconds, Benders checks it between iterations
+
+def build_model(data):
+    #Create supply chain model for Case 1 and apply the scenario fixes
+    m = create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity, profit_obj = False, grass_roots_factor=0.5, breakpoints=10, ref_blend=True, mutable_params=[])
+    for i in m.AIRPORTS:
+        m.z[i].fix(0)
+    for i in m.REFINERIES:
+        m.y_ref[i].fix(0)
+    for i in m.MILLS:
+        m.s[i].fix(0)
+    return m
+
+#Generate the synthetic instance once and reuse it in later runs
+synthetic_data = results_dir + "/synthetic_x%d_seed_%d.xlsx" % (scale, seed)
+if not os.path.isfile(synthetic_data):
+    base_data = pd.read_excel(data, sheet_name=None)
+    generate_synthetic_data(synthetic_data, scale*len(base_data['mill_capacities']), scale*len(base_data['airport_demand']),
+                            scale*len(base_data['refineries']), seed=seed, template=data)
+instances = {'base case': data, 'synthetic x%d' % scale: synthetic_data}
+
+comparison = []
+for instance, instance_data in instances.items():
+    #Solve the monolithic model
+    m = build_model(instance_data)
+    solver = get_solver(solver_name, gap=0.0001, time_limit=time_limit) #Fix MIP gap to 0.01%
+    start = time.time()
+    results = solve_model(m, solver, tee=True)
+    comparison.append({'instance': instance, 'mills': len(m.MILLS), 'method': 'monolithic', 'time': time.time() - start,
+                       'termination': str(results.solver.termination_condition),
+                       'objective': pyo.value(m.objective) if len(results.solution) > 0 else None})
+
+    #Solve the same model with Benders decomposition
+    m = build_model(instance_data)
+    start = time.time()
+    #The master MIP gap is below the Benders tolerance, since the stop uses the proven bound of the master solves
+    try:
+        history = solve_benders(m, solver=solver_name, gap=tol/10, tol=tol, n_cuts=n_cuts, workers=workers, time_limit=time_limit, tee=True)
+    except BrokenProcessPool:
+        raise
+    except RuntimeError as error:
+        #No feasible design found within the time limit
+        print(error)
+        comparison.append({'instance': instance, 'mills': len(m.MILLS), 'method': 'benders', 'time': time.time() - start,
+                           'termination': 'no incumbent', 'objective': None})
+    else:
+        comparison.append({'instance': instance, 'mills': len(m.MILLS), 'method': 'benders', 'time': time.time() - start,
+                           'termination': 'optimal' if history['gap'].iloc[-1] <= tol else 'gap %.2e' % history['gap'].iloc[-1],
+                           'objective': pyo.value(m.objective)})
+        history.to_csv(results_dir + "/benders_history_%s.csv" % instance.replace(' ', '_'))
+
+    #Save the comparison after every instance
+    pd.DataFrame(comparison).to_csv(results_dir + "/comparison.csv")
+
+print(pd.DataFrame(comparison))
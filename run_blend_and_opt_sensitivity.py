@@ -1,5 +1,11 @@
 # from create_sc_model_with_demand import *
 from create_sc_model_full import *
+from solver_backends import default_solver
+from checkpointing import scenario_complete, mark_scenario_complete, solve_with_checkpoints
+from solver_telemetry import record_solver_telemetry
+from profiling import RunProfiler
+from symmetry_breaking import add_symmetry_breaking
+from validate_results import model_snapshot, validate_snapshot
 import os
 import pandas as pd
 import numpy as np
@@ -20,9 +26,38 @@ saf_prem = 0 #No SAF premium
 eth_prem = 0 #No ethanol premium
 max_saf_capacity = 700000
 blend = 0 #Initialize blend to 0
+#Select the solver, set the SC_SOLVER environment variable to gurobi, appsi_highs or cbc to override the default
+solver_name = default_solver()
+
+#Solve settings
+default_gap = 0.00003 #Fix MIP gap to 0.003%
+gap_schedule = {} #MIP gap for specific blends, e.g. {0.5: 0.00003} with a looser default_gap to only tighten the 50% blend case
+time_limit = None #Total time limit per scenario in seconds (None for no limit)
+segment_time = None #Save the incumbent every segment_time seconds so a killed run resumes from it (None for a single solve)
+
+#Symmetry breaking settings
+symmetry_breaking = False #Add symmetry breaking constraints between interchangeable mills to prove optimality faster, only for duplicated or extended mill sets (the base case data has no interchangeable mills, so it adds no constraints)
+symmetry_tolerance = 0 #Distance tolerance in km, above 0 near-identical mills are also ordered but the optimum may be cut off
+
+#Validation settings, the largest violation of each constraint family of a scenario is saved to validation.csv
+validate = True #Set to False to skip the post-solve validation of the results
+validation_tol = 1e-5 #Relative violation tolerance
+
+#Profiling settings, the timing and peak memory breakdown of the run is saved to profile.json
+profile_functions = False #Set to True to profile the Python functions with cProfile
+profile_memory = False #Set to True to trace the peak memory of each phase with tracemalloc (slows the run down)
+profiler = RunProfiler(os.path.basename(__file__), cprofile=profile_functions, memory=profile_memory)
+profiler.enable()
 
 #Create supply chain model, set profit_obj = True for Cases 3 and 4 and profit_obj = False for Cases 1 and 2
-m = create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity, profit_obj = False, grass_roots_factor=0.5, breakpoints=10, ref_blend=True)
+profiler.start('build')
+m = create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity, profit_obj = False, grass_roots_factor=0.5, breakpoints=10, ref_blend=True, mutable_params=['blend_requirement'])
+profiler.stop('build')
+
+#Add symmetry breaking constraints on the investment decisions of interchangeable mills
+if symmetry_breaking:
+    dominance = add_symmetry_breaking(m, symmetry_tolerance)
+    dominance.to_csv(results_dir1 + "/symmetry_breaking.csv")
 
 #Loop through the premium range
 p=0
@@ -33,6 +68,10 @@ for k in blend_range:
     if not os.path.isdir(results_dir):
         os.mkdir(results_dir)
 
+    #Skip the scenario if a previous run already saved its results
+    if scenario_complete(results_dir):
+        continue
+
     #Specify SAF Premium Parameter
     m.blend_requirement= k
     
@@ -52,14 +91,15 @@ for k in blend_range:
     for i in m.MILLS:
         m.s[i].fix(0)
 
-    solver = pyo.SolverFactory('gurobi')
+    #Solve the model in checkpointed segments, resuming from the saved incumbent after a restart
+    results = solve_with_checkpoints(m, solver_name, gap=gap_schedule.get(k, default_gap), time_limit=time_limit, segment_time=segment_time, checkpoint_file=results_dir + "/incumbent.json", tee=True, log_file=results_dir + "/solver.log")
+    termination = results.solver.termination_condition
 
-    solver.options['MIPGap'] = 0.00003 #Fix MIP gap to 0.003%
-    
-    #Solve the model
-    results = solver.solve(m, tee=True)
+    #Record the solver telemetry of the scenario in the metrics table of the run
+    record_solver_telemetry(results_dir + "/solver.log", solver_name, results_dir1 + "/solver_metrics.csv", results_dir, {'case': os.path.basename(results_dir1), 'blend': k})
 
     #Save Connection Data to CSV File
+    profiler.start('export')
 
     #Mill to Mill Volumes
     mill_volumes = {}
@@ -330,4 +370,20 @@ for k in blend_range:
         
 
     results = pd.DataFrame.from_dict(key_results)
-    results.to_csv(results_dir + '/key_results_ref.csv')
\ No newline at end of file
+    results.to_csv(results_dir + '/key_results_ref.csv')
+
+    #Re-check the balances, demands and profit floors of the solution
+    if validate:
+        validation = validate_snapshot(model_snapshot(m), tol=validation_tol)
+        validation.to_csv(results_dir + '/validation.csv')
+        if not validation['passed'].all():
+            print('Validation failed for blend %s:' % k)
+            print(validation.loc[~validation['passed']].to_string())
+
+    #Record that the scenario results are complete
+    mark_scenario_complete(results_dir, m, termination)
+    profiler.stop('export')
+
+#Save the timing and peak memory breakdown of the run
+profiler.disable()
+profiler.save(results_dir1 + '/profile.json')
@@ -0,0 +1,15 @@
+from create_maps import *
+
+#Generates the interactive maps of every results folder with flow outputs (cases, blends, integer cuts and mill-specific incentives)
+
+workers = 4 #Number of processes creating maps in parallel
+
+force = False #Set to True to recreate the maps that are newer than their results
+
+geojson = True #Pack the flow lines and mill markers of each layer into one GeoJSON layer (smaller, faster maps), False for one folium object per line and marker
+
+cluster_mills = False #Group the mill markers into marker clusters
+
+summary = create_all_maps(workers=workers, force=force, geojson=geojson, cluster_mills=cluster_mills)
+print(summary.to_string())
+print(summary['status'].value_counts())
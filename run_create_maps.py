@@ -6,4 +6,8 @@ results_folder1 = "Case1" #Specify the case study the results folder the solutio
 
 results_folder2 = 'interest_mid_blend_50' #Specify the blend requirement results folder the solution comes from
 
-create_model_map(results_folder1,results_folder2)
+geojson = True #Pack the flow lines and mill markers of each layer into one GeoJSON layer (smaller, faster maps), False for one folium object per line and marker
+
+cluster_mills = False #Group the mill markers into marker clusters
+
+create_model_map(results_folder1,results_folder2,geojson=geojson,cluster_mills=cluster_mills)
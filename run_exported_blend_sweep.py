@@ -0,0 +1,78 @@
+from create_sc_model_full import *
+from model_export import export_base_model, parameter_terms, parameter_patch, save_patches, read_base_model, solve_patched, load_solution
+from solver_backends import default_solver, get_solver, solve_model
+import os
+import pandas as pd
+
+this_file_path = os.path.dirname(os.path.realpath(__file__))
+
+# create a directory to save results, outside the stored results of the case
+results_dir1 = os.path.join(this_file_path, "exported_sweep", "Case1") #Update the name for each case study: Case1, Case2, Case3, Case4
+if not os.path.isdir(results_dir1):
+    os.makedirs(results_dir1)
+
+#Specify a blend range to iterate over
+blend_range = [0,.1,.2,.3,.4,.5] #0% to 50% SAF blend range, 0% is the reference point for each case study
+
+#Specify Input Data and Parameters
+data = 'base_case_data_with_demands.xlsx'
+saf_prem = 0 #No SAF premium
+eth_prem = 0 #No ethanol premium
+max_saf_capacity = 700000
+blend = 0 #Initialize blend to 0
+
+#Solve settings
+solver_name = 'highs' #Solver reading the base model file: highs (highspy) or gurobi (gurobipy)
+gap = 0.00003 #Fix MIP gap to 0.003%
+time_limit = None #Time limit per blend in seconds (None for no limit)
+verify_blends = [] #Blends also solved through Pyomo to check the objective of the base model file, e.g. [0.1]
+
+#Create supply chain model, set profit_obj = True for Cases 3 and 4 and profit_obj = False for Cases 1 and 2
+m = create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity, profit_obj = False, grass_roots_factor=0.5, breakpoints=10, ref_blend=True, mutable_params=['blend_requirement'])
+
+#Fix to no saf capacity at all airports
+for i in m.AIRPORTS:
+    m.z[i].fix(0)
+
+#Fix investments at refineries to 0 for Cases 1 and 3, comment out for Cases 2 and 4
+for i in m.REFINERIES:
+   m.y_ref[i].fix(0)
+
+#Set mill specific incetives to 0, not used for this analysis
+for i in m.MILLS:
+    m.s[i].fix(0)
+
+#Export the base model of the case once, the blends are patches of its SAF demand rows
+base = export_base_model(m, results_dir1 + "/base_model.mps.gz")
+terms = parameter_terms(m, base, ['blend_requirement'])
+patches = {}
+for k in blend_range:
+    m.blend_requirement = k
+    patches[str(k)] = parameter_patch(terms)
+save_patches(patches, results_dir1 + "/blend_patches.json")
+
+#Solve every blend from the base model file
+solver = read_base_model(base['file'], solver_name)
+summary = []
+for k in blend_range:
+    results = solve_patched(solver, patches[str(k)], gap=gap, time_limit=time_limit)
+    row = {'blend': k, 'status': results['status'], 'objective': results['objective']}
+
+    #Load the solution into the Pyomo model to report it like a Pyomo solve
+    if results['values']:
+        m.blend_requirement = k
+        load_solution(base, results['values'])
+        row['SAF mills'] = sum(pyo.value(m.x[i,'saf']) for i in m.MILLS)
+        row['SAF refineries'] = sum(pyo.value(m.x_ref[i,'saf']) for i in m.REFINERIES)
+        row['total logistic'] = pyo.value(m.mill_to_mill_logistic_cost) + pyo.value(m.mill_to_airport_logistic_cost) + pyo.value(m.mill_to_ref_logistic_cost) + pyo.value(m.ref_to_air_logistic_cost)
+
+    #Check the objective against a Pyomo solve of the same blend
+    if k in verify_blends:
+        m.blend_requirement = k
+        solve_model(m, get_solver(default_solver(), gap=gap, time_limit=time_limit))
+        row['pyomo objective'] = pyo.value(m.objective)
+    summary.append(row)
+
+    pd.DataFrame(summary).to_csv(results_dir1 + "/exported_blend_sweep.csv")
+
+print(pd.DataFrame(summary))
@@ -0,0 +1,40 @@
+from facility_index import FacilityIndex, DISTANCE_SHEETS
+from synthetic_data import EARTH_RADIUS
+import os
+import pandas as pd
+
+this_file_path = os.path.dirname(os.path.realpath(__file__))
+
+# create a directory to save results
+results_dir = os.path.join(this_file_path, "facility_index")
+if not os.path.isdir(results_dir):
+    os.mkdir(results_dir)
+
+#Specify Input Data and Parameters
+data = 'base_case_data_with_demands.xlsx'
+road_factor = 1.0 #Ratio of the road distance to the great circle distance, e.g. 1.3 for a typical road network
+radius = EARTH_RADIUS #Radius of the Earth, units: km
+write_workbook = False #True to also write a data workbook with the distance sheets of the index
+compare_sheets = True #Compare the distances of the index with the distance sheets of data
+
+#Build the index of the facilities of the model and save it, pass the .npz file to create_supply_chain_model(..., distances=...)
+index = FacilityIndex.from_files(data, road_factor=road_factor, radius=radius)
+index.save(results_dir + "/facility_index.npz")
+if write_workbook:
+    index.write_workbook(results_dir + "/data_with_index_distances.xlsx", template=data)
+
+#Largest differences of the index distances from the distance sheets
+if compare_sheets:
+    comparison = {}
+    for sheet, (rows, columns) in DISTANCE_SHEETS.items():
+        df = pd.read_excel(data, sheet_name=sheet)
+        difference = (index.distances(sheet) - df[index.names[columns]].iloc[:len(index.names[rows])].to_numpy(dtype=float))
+        comparison[sheet] = {'max abs difference': abs(difference).max(), 'mean difference': difference.mean()}
+    comparison = pd.DataFrame(comparison).T
+    comparison.to_csv(results_dir + "/distance_sheet_comparison.csv")
+    print(comparison)
+
+#Nearest refineries of every airport
+nearest = pd.concat({airport: index.query_nearest('refineries', *index.coordinates['airports'][k], k=3) for k, airport in enumerate(index.names['airports'])})
+nearest.to_csv(results_dir + "/nearest_refineries.csv")
+print(nearest)
@@ -1,4 +1,9 @@
 from create_sc_model_full import *
+from solver_backends import default_solver
+from checkpointing import SOLUTION_FILE, scenario_complete, mark_scenario_complete, load_incumbent, solve_with_checkpoints
+from solver_telemetry import record_solver_telemetry
+from profiling import RunProfiler
+from symmetry_breaking import add_symmetry_breaking
 import os
 import pandas as pd
 import numpy as np
@@ -20,9 +25,28 @@ saf_prem = 0 #No SAF premium
 eth_prem = 0 #No ethanoll premium
 max_saf_capacity = 700000
 blend = 0.5 #Nominally set to 50% but adjust this paramter accordingly
+#Select the solver, set the SC_SOLVER environment variable to gurobi, appsi_highs or cbc to override the default
+solver_name = default_solver()
+
+#Solve settings
+gap = 0.00003 #Set the MIP gap to 0.003%
+time_limit = None #Total time limit per scenario in seconds (None for no limit)
+segment_time = None #Save the incumbent every segment_time seconds so a killed run resumes from it (None for a single solve)
+
+#Symmetry breaking settings
+symmetry_breaking = False #Keep False so the integer cuts also find the designs that only differ by interchangeable mills
+symmetry_tolerance = 0 #Distance tolerance in km, above 0 near-identical mills are also ordered but the optimum may be cut off
+
+#Profiling settings, the timing and peak memory breakdown of the run is saved to profile.json
+profile_functions = False #Set to True to profile the Python functions with cProfile
+profile_memory = False #Set to True to trace the peak memory of each phase with tracemalloc (slows the run down)
+profiler = RunProfiler(os.path.basename(__file__), cprofile=profile_functions, memory=profile_memory)
+profiler.enable()
 
 #Create supply chain model, set profit_obj = True for case 3 and profit_obj = False for case 1
-m = create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity, profit_obj = False, grass_roots_factor=0.5, breakpoints=10, ref_blend=True)
+profiler.start('build')
+m = create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity, profit_obj = False, grass_roots_factor=0.5, breakpoints=10, ref_blend=True, mutable_params=[])
+profiler.stop('build')
 
 #Fix to no saf capacity at all airports
 for i in m.AIRPORTS:
@@ -36,21 +60,45 @@ for i in m.REFINERIES:
 for i in m.MILLS:
     m.s[i].fix(0)
 
-solver = pyo.SolverFactory('gurobi')
-solver.options['MIPGap'] = 0.00003 #Set the MIP gap to 0.003%
+#Add symmetry breaking constraints on the investment decisions of interchangeable mills
+if symmetry_breaking:
+    dominance = add_symmetry_breaking(m, symmetry_tolerance)
+    dominance.to_csv(results_dir1 + "/symmetry_breaking.csv")
 
 # create the ConstraintList to hold the integer cuts
 m.int_cuts = pyo.ConstraintList()
 
-for l in range(10):
-    #solve the model
-    results = solver.solve(m, tee=True)
+#Integer cut that excludes the current mill investment decisions
+def add_integer_cut(m):
+    #Binary for upgrading at the Mills
+    cut_expr = 0
+    for i in m.MILLS:
+        if pyo.value(m.y[i]) < 0.5:
+            cut_expr += m.y[i]
+        else:
+            cut_expr += (1.0 - m.y[i])
+    m.int_cuts.add(cut_expr >= 1)
 
+for l in range(10):
     #save the optimization results
     results_dir = os.path.join(results_dir2, "int_cuts" + str(l))
     if not os.path.isdir(results_dir):
         os.mkdir(results_dir)
+
+    #Restore the design of a cut solved by a previous run and add its integer cut
+    if scenario_complete(results_dir):
+        load_incumbent(m, os.path.join(results_dir, SOLUTION_FILE))
+        add_integer_cut(m)
+        continue
+
+    #solve the model in checkpointed segments, resuming from the saved incumbent after a restart
+    results = solve_with_checkpoints(m, solver_name, gap=gap, time_limit=time_limit, segment_time=segment_time, checkpoint_file=results_dir + "/incumbent.json", tee=True, log_file=results_dir + "/solver.log")
+    termination = results.solver.termination_condition
+
+    #Record the solver telemetry of the scenario in the metrics table of the run
+    record_solver_telemetry(results_dir + "/solver.log", solver_name, results_dir1 + "/solver_metrics.csv", results_dir, {'blend': blend, 'integer cut': l})
     #Save Connection Data to CSV File
+    profiler.start('export')
 
     #Mill to Mill Volumes
     mill_volumes = {}
@@ -322,12 +370,14 @@ for l in range(10):
 
     results = pd.DataFrame.from_dict(key_results)
     results.to_csv(results_dir + '/key_results_ref.csv')
+
+    #Record that the cut results are complete
+    mark_scenario_complete(results_dir, m, termination)
+    profiler.stop('export')
+
     #add the integer cut based on the current solution
-    #Binary for upgrading at the Mills
-    cut_expr = 0
-    for i in m.MILLS:
-        if pyo.value(m.y[i]) < 0.5:
-            cut_expr += m.y[i]
-        else:
-            cut_expr += (1.0 - m.y[i])
-    m.int_cuts.add(cut_expr >= 1)
\ No newline at end of file
+    add_integer_cut(m)
+
+#Save the timing and peak memory breakdown of the run
+profiler.disable()
+profiler.save(results_dir2 + '/profile.json')
@@ -0,0 +1,58 @@
+from create_sc_model_full import *
+from stochastic_prices import scenario_table
+from validate_results import load_snapshot
+from what_if import DUAL_CONSTRAINTS, design_from_snapshot, create_what_if_lp, sensitivity_grid, solve_what_if
+import os
+import pandas as pd
+import numpy as np
+
+this_file_path = os.path.dirname(os.path.realpath(__file__))
+
+# create a directory to save results
+results_dir = os.path.join(this_file_path, "lp_sensitivity")
+if not os.path.isdir(results_dir):
+    os.mkdir(results_dir)
+
+#Specify Input Data and Parameters of the stored results
+stored_results = os.path.join(this_file_path, "Case1", "interest_mid_blend_10") #Stored results with the optimal design
+data = 'base_case_data_with_demands.xlsx'
+saf_prem = 0 #No SAF premium
+eth_prem = 0 #No ethanol premium
+max_saf_capacity = 700000
+blend = 0.1 #SAF blend requirement of the stored results
+
+#Sensitivity settings
+factors = np.linspace(0.5, 1.5, 11) #Factors of the base value of each parameter
+parameters = ['logistic_cost', 'fixed_logistic_cost', 'price[saf]', 'price[et]', 'price[sug]', 'Conversion[et_to_saf]'] #Parameters varied one at a time
+one_at_a_time = True #Set to False to solve every combination of the parameter values
+workers = 4 #Processes solving batches of LPs in parallel
+
+#Create supply chain model for Case 1 with the varied parameters mutable, set profit_obj = True for Case 3
+params = sorted({parameter.split('[')[0] for parameter in parameters})
+m = create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity, profit_obj = False, grass_roots_factor=0.5, breakpoints=10, ref_blend=True, mutable_params=params)
+
+#Fix to no saf capacity at all airports
+for i in m.AIRPORTS:
+    m.z[i].fix(0)
+
+#Fix investments at refineries to 0 for Cases 1 and 3
+for i in m.REFINERIES:
+   m.y_ref[i].fix(0)
+
+#Set mill specific incetives to 0, not used for this analysis
+for i in m.MILLS:
+    m.s[i].fix(0)
+
+#Fix the optimal design of the stored results and export its flow LP once
+design = design_from_snapshot(m, load_snapshot(stored_results))
+what_if = create_what_if_lp(m, design, params, results_dir + "/sensitivity_lp.mps.gz", duals=DUAL_CONSTRAINTS)
+
+#Re-solve the LP over the parameter grid, with the shadow prices of the demand constraints of every scenario
+base_values = {parameter: pyo.value(m.find_component(parameter)) for parameter in parameters}
+scenarios = sensitivity_grid(m, {parameter: list(base_values[parameter]*factors) for parameter in parameters}, one_at_a_time=one_at_a_time)
+results = solve_what_if(what_if, scenarios, workers=workers)
+results = pd.concat([scenario_table(scenarios).drop(columns='probability'), results], axis=1)
+results.to_csv(results_dir + "/sensitivity_results.csv")
+
+print('%d LPs solved in %.1f s of solver time' % (len(results), results['time'].sum()))
+print(results[[column for column in results.columns if not column.startswith('saf_demand[')]])
@@ -1,5 +1,10 @@
 # from create_sc_model_with_demand import *
 from create_sc_model_full import *
+from solver_backends import default_solver, get_solver, solve_model
+from checkpointing import scenario_complete, mark_scenario_complete, solve_with_checkpoints
+from lagrangian_bound import solve_lagrangian_bound, lagrangian_stop_options
+from solver_telemetry import record_solver_telemetry
+from profiling import RunProfiler
 import os
 import pandas as pd
 import numpy as np
@@ -22,9 +27,26 @@ saf_prem = 3000 #Set the base SAF premium iterations included are 0, 500, 1000,
 eth_prem = 0 #No ethanol premium
 max_saf_capacity = 700000
 blend = 0.5 #Set the SAF blend requirment to 50%
+#Select the solver, set the SC_SOLVER environment variable to gurobi, appsi_highs or cbc to override the default
+solver_name = default_solver()
+use_lagrangian_bound = False #Set to True to bound the solve with a Lagrangian relaxation of the profit constraints
+
+#Solve settings
+default_gap = 0.0003 #Larger MIP gap to avoid extensive computation times
+gap_schedule = {} #MIP gap for specific blends, e.g. {0.5: 0.00003} with a looser default_gap to only tighten the 50% blend case
+time_limit = None #Total time limit per scenario in seconds (None for no limit)
+segment_time = None #Save the incumbent every segment_time seconds so a killed run resumes from it (None for a single solve)
+
+#Profiling settings, the timing and peak memory breakdown of the run is saved to profile.json
+profile_functions = False #Set to True to profile the Python functions with cProfile
+profile_memory = False #Set to True to trace the peak memory of each phase with tracemalloc (slows the run down)
+profiler = RunProfiler(os.path.basename(__file__), cprofile=profile_functions, memory=profile_memory)
+profiler.enable()
 
 #Create supply chain model - For this case we consider Case 1, upgrading at mills only, blend at refinery or airport, minimize supply chain cost
-m = create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity, profit_obj = False, grass_roots_factor=0.5, breakpoints=10, ref_blend=True)
+profiler.start('build')
+m = create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity, profit_obj = False, grass_roots_factor=0.5, breakpoints=10, ref_blend=True, mutable_params=['blend_requirement'])
+profiler.stop('build')
 
 #Loop through the premium range
 p=50
@@ -33,6 +55,10 @@ for k in blend_range:
     results_dir = os.path.join(results_dir1, "sp3000_e0_interest_mid_blend_" + str(p)) #Change the name of the case study as you loop through premium prices options sp0_e0, sp500_e0, sp1000_e0, sp1500_e0, sp2000_e0, sp2500_e0, sp3000_e0
     if not os.path.isdir(results_dir):
         os.mkdir(results_dir)
+
+    #Skip the scenario if a previous run already saved its results
+    if scenario_complete(results_dir):
+        continue
         
     #Specify SAF Premium Parameter
     m.blend_requirement= k
@@ -52,14 +78,24 @@ for k in blend_range:
         
         
 
-    solver = pyo.SolverFactory('gurobi')
 
-    solver.options['MIPGap'] = 0.0003 #Larger MIP gap to avoid extensive computation times
-    
-    
-    results = solver.solve(m, tee=True)
+    #Bound the profit constraints with a Lagrangian relaxation, warm start from its best design and stop at its bound
+    if use_lagrangian_bound:
+        bound, gap_report = solve_lagrangian_bound(m, solver=solver_name, gap=0.0001, tol=0.0001, workers=2, report_file=results_dir + "/lagrangian_gap_report.csv", tee=True)
+        solver = get_solver(solver_name, gap=gap_schedule.get(k, default_gap), time_limit=time_limit, options=lagrangian_stop_options(m, bound, 0.0001, solver_name))
+        if os.path.isfile(results_dir + "/solver.log"):
+            os.remove(results_dir + "/solver.log")
+        results = solve_model(m, solver, warmstart=True, tee=True, log_file=results_dir + "/solver.log")
+    else:
+        #Solve the model in checkpointed segments, resuming from the saved incumbent after a restart
+        results = solve_with_checkpoints(m, solver_name, gap=gap_schedule.get(k, default_gap), time_limit=time_limit, segment_time=segment_time, checkpoint_file=results_dir + "/incumbent.json", tee=True, log_file=results_dir + "/solver.log")
+    termination = results.solver.termination_condition
+
+    #Record the solver telemetry of the scenario in the metrics table of the run
+    record_solver_telemetry(results_dir + "/solver.log", solver_name, results_dir1 + "/solver_metrics.csv", results_dir, {'saf premium': saf_prem, 'blend': k})
 
     #Save Connection Data to CSV File
+    profiler.start('export')
 
     #Mill to Mill Volumes
     mill_volumes = {}
@@ -330,4 +366,12 @@ for k in blend_range:
         
 
     results = pd.DataFrame.from_dict(key_results)
-    results.to_csv(results_dir + '/key_results_ref.csv')
\ No newline at end of file
+    results.to_csv(results_dir + '/key_results_ref.csv')
+
+    #Record that the scenario results are complete
+    mark_scenario_complete(results_dir, m, termination)
+    profiler.stop('export')
+
+#Save the timing and peak memory breakdown of the run
+profiler.disable()
+profiler.save(results_dir1 + '/profile.json')
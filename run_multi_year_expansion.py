@@ -0,0 +1,58 @@
+from create_sc_model_full import *
+from solver_backends import default_solver
+from multi_year import yearly_data, solve_rolling_horizon
+import os
+import pandas as pd
+
+this_file_path = os.path.dirname(os.path.realpath(__file__))
+
+# create a directory to save results
+results_dir = os.path.join(this_file_path, "multi_year_expansion")
+if not os.path.isdir(results_dir):
+    os.mkdir(results_dir)
+
+#Specify Input Data and Parameters
+data = 'base_case_data_with_demands.xlsx'
+saf_prem = 0 #No SAF premium
+eth_prem = 0 #No ethanol premium
+max_saf_capacity = 700000
+#Select the solver, set the SC_SOLVER environment variable to gurobi, appsi_highs or cbc to override the default
+solver_name = default_solver()
+
+#Specify the planning horizon
+years = list(range(2030, 2041)) #Planning years
+blend_ramp = (0.05, 0.5) #SAF blend requirement of the first and last year, ramped linearly in between
+demand_growth = 0.02 #Yearly growth of the airport jet fuel demands
+price_growth = None #Yearly growth of the prices by product, e.g. {'saf': -0.02} for a falling SAF price
+discount_rate = 0.08 #Yearly discount rate of the objective
+
+#Rolling horizon settings
+gap = 0.0001 #MIP gap of each window
+window = 2 #Years per solve: the first step years keep their binaries and the later ones are relaxed
+step = 1 #Years committed after each solve
+
+#Create supply chain model for Case 1 with the parameters that change over the years mutable
+m = create_supply_chain_model(data, saf_prem, eth_prem, blend_ramp[0], max_saf_capacity, profit_obj = False, grass_roots_factor=0.5, breakpoints=10, ref_blend=True,
+                              mutable_params=['blend_requirement', 'individual_saf_demand', 'price'])
+
+#Fix to no saf capacity at all airports
+for i in m.AIRPORTS:
+    m.z[i].fix(0)
+
+#Fix investments at refineries to 0 for Cases 1 and 3, comment out for Cases 2 and 4
+for i in m.REFINERIES:
+   m.y_ref[i].fix(0)
+
+#Set mill specific incetives to 0, not used for this analysis
+for i in m.MILLS:
+    m.s[i].fix(0)
+
+#Solve the capacity expansion over the horizon
+year_data = yearly_data(m, years, blend_ramp, demand_growth=demand_growth, price_growth=price_growth)
+report, capacity = solve_rolling_horizon(m, year_data, solver=solver_name, gap=gap, window=window, step=step, discount_rate=discount_rate,
+                                         report_file=results_dir + "/rolling_horizon_report.csv", tee=True)
+
+#Save the SAF capacity of every plant over the years
+capacity[(capacity > 1e-6).any(axis=1)].to_csv(results_dir + "/saf_capacity.csv")
+print(report)
+print('Discounted objective:', report['discounted objective'].sum())
@@ -0,0 +1,38 @@
+from create_sc_model_full import *
+from stored_results import objective_regression_check
+import os
+import pandas as pd
+
+this_file_path = os.path.dirname(os.path.realpath(__file__))
+
+#Stored Case 1 results checked against the current model
+results_dir1 = os.path.join(this_file_path, "Case1")
+
+# create a directory to save the check, outside the stored results
+results_dir = os.path.join(this_file_path, "regression_check")
+if not os.path.isdir(results_dir):
+    os.mkdir(results_dir)
+blend_range = [0,.1,.2,.3,.4,.5] #Blends of the stored results, saved in interest_mid_blend_0 to interest_mid_blend_50
+
+#Specify Input Data and Parameters, as in run_blend_and_opt_sensitivity
+data = 'base_case_data_with_demands.xlsx'
+saf_prem = 0 #No SAF premium
+eth_prem = 0 #No ethanol premium
+max_saf_capacity = 700000
+rtol = 1e-9 #Relative tolerance of the comparisons
+
+#Create supply chain model for Case 1
+m = create_supply_chain_model(data, saf_prem, eth_prem, 0, max_saf_capacity, profit_obj = False, grass_roots_factor=0.5, breakpoints=10, ref_blend=True, mutable_params=['blend_requirement'])
+
+checks = []
+for p, k in enumerate(blend_range):
+    m.blend_requirement = k
+    check = objective_regression_check(m, os.path.join(results_dir1, "interest_mid_blend_" + str(10*p)), rtol=rtol)
+    check.insert(0, 'blend', k)
+    checks.append(check)
+
+checks = pd.concat(checks, ignore_index=True)
+checks.to_csv(results_dir + "/regression_check.csv")
+print(checks[['blend', 'check', 'relative difference', 'passed']])
+if not checks['passed'].all():
+    raise RuntimeError('The model does not reproduce the stored Case 1 results, see ' + results_dir + "/regression_check.csv")
@@ -0,0 +1,39 @@
+from facility_index import FacilityIndex
+from road_distances import RoadNetwork, road_distance_index, check_fresh_run
+import os
+
+this_file_path = os.path.dirname(os.path.realpath(__file__))
+
+# create a directory to save results
+results_dir = os.path.join(this_file_path, "road_distances")
+if not os.path.isdir(results_dir):
+    os.mkdir(results_dir)
+
+#Specify Input Data and Parameters
+data = 'base_case_data_with_demands.xlsx'
+nodes_file = 'brazil_road_nodes.csv' #Road nodes with node, Latitude and Longitude columns (or osmid, y and x from osmnx)
+edges_file = 'brazil_road_edges.csv' #Road edges with u, v and length columns
+length_unit = 0.001 #Length of one unit of the length column in km, 0.001 for the meters of OSM extracts
+directed = False #True to keep one way roads
+mill_radius = 300 #Longest road distance searched between mills in km, None for all mill pairs
+fallback_factor = None #Ratio of road to great circle distance of the pairs without road path, None for the median ratio
+workers = 4 #Processes running Dijkstra in parallel
+cache_file = os.path.join(results_dir, "road_distance_cache.csv") #Distances by facility pair, reused by the next runs
+check_fresh = False #True to recompute all the distances without the cache and check they match the run with it
+
+#Compute the road distances of the model facilities, only the pairs missing from the cache are searched
+index = FacilityIndex.from_files(data)
+network = RoadNetwork.from_files(nodes_file, edges_file, directed=directed, length_unit=length_unit)
+road_index, report = road_distance_index(index, network, cache_file=cache_file, mill_radius=mill_radius, fallback_factor=fallback_factor,
+                                         workers=workers, tee=True)
+report.to_csv(results_dir + "/road_distance_report.csv")
+
+#Check the distances computed with the cache against a run without it
+if check_fresh:
+    difference = check_fresh_run(road_index, index, network, mill_radius=mill_radius, fallback_factor=fallback_factor, workers=workers)
+    print('Largest difference to a run without cache (km):')
+    print(difference)
+
+#Save the road distances, pass the .npz file to create_supply_chain_model(..., distances=...) or use the regenerated workbook
+road_index.save(results_dir + "/road_distance_index.npz")
+road_index.write_workbook(results_dir + "/base_case_data_road_distances.xlsx", template=data)
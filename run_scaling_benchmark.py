@@ -0,0 +1,37 @@
+from benchmarks import run_benchmarks
+from synthetic_data import generate_synthetic_data
+import os
+import pandas as pd
+
+this_file_path = os.path.dirname(os.path.realpath(__file__))
+
+# create a directory to save results
+results_dir = os.path.join(this_file_path, "benchmark_results")
+if not os.path.isdir(results_dir):
+    os.mkdir(results_dir)
+
+#Specify the Network Sizes and Benchmark Settings
+mill_counts = [100, 335, 500, 1000, 2000] #Number of mills of each synthetic instance
+n_airports = 29 #Airports with a SAF demand, as in the base case
+n_refineries = 9 #Oil refineries, as in the base case
+seed = 0 #Seed of the synthetic instances, keep it fixed to compare runs
+scenarios = ['Case1_blend_50'] #Benchmark scenarios run on every instance
+gap = 0.0001 #Fix MIP gap to 0.01%
+time_limit = 1800 #Time limit per solve in seconds
+solve = True #Set to False to only measure the build time, peak memory and model size of each instance
+
+scaling = []
+for n in mill_counts:
+    #Generate the synthetic instance once and reuse it in later runs
+    data = results_dir + "/synthetic_%d_mills_seed_%d.xlsx" % (n, seed)
+    if not os.path.isfile(data):
+        generate_synthetic_data(data, n, n_airports, n_refineries, seed=seed)
+
+    results = run_benchmarks(data, scenarios, gap=gap, time_limit=time_limit, solve=solve)
+    results.insert(0, 'mills', n)
+    scaling.append(results)
+
+    #Save the scaling curves after every instance
+    pd.concat(scaling, ignore_index=True).to_csv(results_dir + "/scaling.csv")
+
+print(pd.concat(scaling, ignore_index=True))
@@ -0,0 +1,104 @@
+from create_sc_model_full import *
+from solver_backends import available_solvers, get_solver, solve_model
+from solver_telemetry import parse_solver_log
+import os
+import time
+import pandas as pd
+
+this_file_path = os.path.dirname(os.path.realpath(__file__))
+
+# create a directory to save results
+results_dir = os.path.join(this_file_path, "solver_benchmark")
+if not os.path.isdir(results_dir):
+    os.mkdir(results_dir)
+
+#Specify Input Data and Parameters
+data = 'base_case_data_with_demands.xlsx'
+saf_prem = 0 #No SAF premium
+eth_prem = 0 #No ethanol premium
+max_saf_capacity = 700000
+blend_range = [0,.1,.2,.3,.4,.5] #Same blend sweep as run_blend_and_opt_sensitivity
+
+#Common solver settings, applied to every solver
+solvers = available_solvers() #Replace with a list of names to benchmark specific solvers
+gap = 0.00003 #Fix MIP gap to 0.003%
+threads = None #Use the solver default
+time_limit = 3600 #Time limit per solve in seconds
+
+#Case studies: minimize supply chain cost (Cases 1 and 2) or maximize mill profit (Cases 3 and 4), with SAF investments at
+#refineries fixed to 0 (Cases 1 and 3) or allowed (Cases 2 and 4)
+cases = {
+    'Case1': {'profit_obj': False, 'refinery_investment': False},
+    'Case2': {'profit_obj': False, 'refinery_investment': True},
+    'Case3': {'profit_obj': True, 'refinery_investment': False},
+    'Case4': {'profit_obj': True, 'refinery_investment': True},
+}
+
+benchmark = []
+for solver_name in solvers:
+    for case, settings in cases.items():
+        #Create supply chain model for the case study
+        m = create_supply_chain_model(data, saf_prem, eth_prem, 0, max_saf_capacity, profit_obj = settings['profit_obj'], grass_roots_factor=0.5, breakpoints=10, ref_blend=True, mutable_params=['blend_requirement'])
+
+        #Fix to no saf capacity at all airports
+        for i in m.AIRPORTS:
+            m.z[i].fix(0)
+
+        #Fix investments at refineries to 0 for Cases 1 and 3
+        if not settings['refinery_investment']:
+            for i in m.REFINERIES:
+                m.y_ref[i].fix(0)
+
+        #Set mill specific incetives to 0
+        for i in m.MILLS:
+            m.s[i].fix(0)
+
+        for k in blend_range:
+            m.blend_requirement = k
+            solver = get_solver(solver_name, gap=gap, threads=threads, time_limit=time_limit)
+
+            #Capture the solver log of each solve to compare the search effort of the solvers
+            log_file = results_dir + "/%s_%s_blend_%s.log" % (solver_name, case, k)
+            if os.path.isfile(log_file):
+                os.remove(log_file)
+            start = time.time()
+            results = solve_model(m, solver, log_file=log_file)
+            solve_time = time.time() - start
+            with open(log_file) as f:
+                telemetry, trajectory = parse_solver_log(f.read(), solver_name)
+
+            feasible = len(results.solution) > 0
+            benchmark.append({
+                'solver': solver_name,
+                'case': case,
+                'blend': k,
+                'time': solve_time,
+                'termination': str(results.solver.termination_condition),
+                'objective': pyo.value(m.objective) if feasible else None,
+                'nodes': telemetry.get('nodes'),
+                'root gap': telemetry.get('root_gap'),
+                'time to first incumbent': telemetry.get('time_to_first_incumbent'),
+            })
+            print(benchmark[-1])
+
+benchmark = pd.DataFrame(benchmark)
+
+#Objective agreement with the first solver that solved each case and blend to optimality
+optimal = benchmark[benchmark['termination'] == 'optimal']
+reference = optimal.groupby(['case', 'blend'])['objective'].first().rename('reference objective')
+benchmark = benchmark.join(reference, on=['case', 'blend'])
+benchmark['relative difference'] = (benchmark['objective'] - benchmark['reference objective']).abs()/benchmark['reference objective'].abs()
+benchmark.to_csv(results_dir + "/solver_benchmark.csv")
+
+#Summarize each solver, the fastest solver whose objectives agree within the MIP gap is the one to use on this machine
+summary = benchmark.groupby('solver').agg(
+    total_time=('time', 'sum'),
+    mean_time=('time', 'mean'),
+    total_nodes=('nodes', 'sum'),
+    max_relative_difference=('relative difference', 'max'),
+    not_optimal=('termination', lambda t: (t != 'optimal').sum()),
+)
+summary['agrees'] = summary['max_relative_difference'] <= 2*gap
+summary = summary.sort_values('total_time')
+summary.to_csv(results_dir + "/solver_benchmark_summary.csv")
+print(summary)
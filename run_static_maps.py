@@ -0,0 +1,32 @@
+from static_maps import *
+import os
+
+this_file_path = os.path.dirname(os.path.realpath(__file__))
+
+# create a directory to save the figures
+figures_dir = os.path.join(this_file_path, "Results_Figures")
+if not os.path.isdir(figures_dir):
+    os.mkdir(figures_dir)
+
+#Figure settings
+blends = [10, 20, 30, 40, 50] #Blend requirements of the four-case design panels
+zoom_blend = 50 #Blend requirement of the zoomed design maps
+dpi = 500 #Resolution of the saved figures
+
+#State geometries and facility points in latitude/longitude for the panels (cached in static_map_cache after the first run)
+states = load_states(4326)
+facilities = load_facilities(4326)
+
+#Input data panel by state
+plot_input_panel(states, facilities, output=figures_dir + '/fourpanelinputdata.png', dpi=dpi)
+plot_legend('input', output=figures_dir + '/fourpanelinputdata_legend.png', dpi=dpi)
+
+#Optimal design panels of the four case studies
+for b in blends:
+    plot_design_panel(states, facilities, b, output=figures_dir + '/optimaldesignmap' + str(b) + '.png', dpi=dpi)
+plot_legend('design', output=figures_dir + '/optimaldesign_legend.png', dpi=dpi)
+
+#Zoomed design maps in the projected coordinate reference system (metric scale bars)
+states = load_states(PROJECTED_CRS)
+facilities = load_facilities(PROJECTED_CRS)
+plot_zoom_panel(states, facilities, zoom_blend, output=figures_dir + '/optimalsclocationszoom.png', dpi=dpi)
@@ -0,0 +1,78 @@
+from create_sc_model_full import *
+from solver_backends import default_solver, get_solver, solve_model
+from stochastic_prices import FIRST_STAGE, sample_price_scenarios, scenario_table, solve_progressive_hedging, evaluate_design
+import os
+import pandas as pd
+import numpy as np
+
+this_file_path = os.path.dirname(os.path.realpath(__file__))
+
+# create a directory to save results
+results_dir = os.path.join(this_file_path, "stochastic_prices")
+if not os.path.isdir(results_dir):
+    os.mkdir(results_dir)
+
+#Specify Input Data and Parameters
+data = 'base_case_data_with_demands.xlsx'
+saf_prem = 0 #No SAF premium
+eth_prem = 0 #No ethanol premium
+max_saf_capacity = 700000
+blend = 0.1 #SAF blend requirement of the stochastic design
+#Select the solver, set the SC_SOLVER environment variable to gurobi, appsi_highs or cbc to override the default
+solver_name = default_solver()
+
+#Price scenario settings
+n_scenarios = 100 #Number of sampled price vectors
+price_cv = 0.1 #Coefficient of variation of each price, large values sample prices below the production costs (infeasible mill profits)
+seed = 0 #Seed of the price sampling, keep it fixed to compare runs
+
+#Progressive hedging settings
+gap = 0.0001 #MIP gap of the scenario subproblems
+max_iter = 50 #Maximum number of progressive hedging iterations
+workers = 4 #Processes solving scenario subproblems in parallel
+compare_deterministic = True #Also evaluate the optimal design of the mean prices in every scenario (value of the stochastic solution)
+
+#Create supply chain model for Case 1 with mutable prices, set profit_obj = True for Case 3
+m = create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity, profit_obj = False, grass_roots_factor=0.5, breakpoints=10, ref_blend=True, mutable_params=['price'])
+
+#Fix to no saf capacity at all airports
+for i in m.AIRPORTS:
+    m.z[i].fix(0)
+
+#Fix investments at refineries to 0 for Cases 1 and 3
+for i in m.REFINERIES:
+   m.y_ref[i].fix(0)
+
+#Set mill specific incetives to 0, not used for this analysis
+for i in m.MILLS:
+    m.s[i].fix(0)
+
+#Sample the price scenarios
+scenarios = sample_price_scenarios(m, n_scenarios, cv=price_cv, seed=seed)
+scenario_table(scenarios).to_csv(results_dir + "/scenarios.csv")
+
+#Solve the stochastic model with progressive hedging
+design, report, evaluation = solve_progressive_hedging(m, scenarios, solver=solver_name, gap=gap, max_iter=max_iter, workers=workers,
+                                                       report_file=results_dir + "/progressive_hedging_report.csv", tee=True)
+evaluation.to_csv(results_dir + "/stochastic_design_evaluation.csv")
+summary = {'expected objective': report['design_objective'].iloc[-1], 'bound': report['best_bound'].iloc[-1]}
+
+#Save the SAF investments of the stochastic design
+design_results = {}
+design_results['mills'] = list(m.MILLS)
+design_results['investment'] = [pyo.value(m.y[i]) for i in m.MILLS]
+design_results['capacity segments'] = [sum(pyo.value(m.aux[i,b]) for b in m.INDEX_SET2) for i in m.MILLS]
+pd.DataFrame.from_dict(design_results).to_csv(results_dir + "/stochastic_design.csv")
+
+#Value of the stochastic solution: expected cost increase (or profit loss) of the mean price design over the stochastic design
+if compare_deterministic:
+    sense = 1 if m.objective.sense == pyo.minimize else -1
+    solve_model(m, get_solver(solver_name, gap=gap))
+    deterministic = {x.name: int(round(x.value)) for name in FIRST_STAGE for x in getattr(m, name).values() if not x.fixed}
+    deterministic_evaluation = evaluate_design(m, deterministic, scenarios, solver=solver_name, gap=gap, workers=workers)
+    deterministic_evaluation.to_csv(results_dir + "/deterministic_design_evaluation.csv")
+    summary['deterministic expected objective'] = float(np.dot(deterministic_evaluation['probability'], deterministic_evaluation['objective']))
+    summary['value of the stochastic solution'] = sense*(summary['deterministic expected objective'] - summary['expected objective'])
+
+pd.DataFrame([summary]).to_csv(results_dir + "/summary.csv")
+print(pd.Series(summary))
@@ -1,5 +1,10 @@
 # from create_sc_model_with_demand import *
 from create_sc_model_full import *
+from solver_backends import default_solver
+from checkpointing import atomic_to_csv, solve_with_checkpoints
+from solver_telemetry import record_solver_telemetry
+from profiling import RunProfiler
+from symmetry_breaking import add_symmetry_breaking
 import os
 import pandas as pd
 import numpy as np
@@ -22,9 +27,29 @@ saf_prem = 0 #Initialize SAF incentive to 0
 eth_prem = 0 #No ethanol premium
 max_saf_capacity = 700000
 blend = 0 #Set to zero to relax the SAF blend requirement constraint
+#Select the solver, set the SC_SOLVER environment variable to gurobi, appsi_highs or cbc to override the default
+solver_name = default_solver()
+
+#Solve settings
+default_gap = 0.0005 #Increase the MIP gap since not worried about the exact location of SAF investments to improve solve time
+gap_schedule = {} #MIP gap for specific premiums, e.g. {2.0: 0.0001} to only tighten the 2 R$/l premium case
+time_limit = None #Total time limit per premium in seconds (None for no limit)
+segment_time = None #Save the incumbent every segment_time seconds so a killed run resumes from it (None for a single solve)
+
+#Symmetry breaking settings
+symmetry_breaking = False #Add symmetry breaking constraints between interchangeable mills to prove optimality faster, only for duplicated or extended mill sets (the base case data has no interchangeable mills, so it adds no constraints)
+symmetry_tolerance = 0 #Distance tolerance in km, above 0 near-identical mills are also ordered but the optimum may be cut off
+
+#Profiling settings, the timing and peak memory breakdown of the run is saved to profile.json
+profile_functions = False #Set to True to profile the Python functions with cProfile
+profile_memory = False #Set to True to trace the peak memory of each phase with tracemalloc (slows the run down)
+profiler = RunProfiler(os.path.basename(__file__), cprofile=profile_functions, memory=profile_memory)
+profiler.enable()
 
 #Create supply chain model - Scenario 1, upgrading at mills only, blend at refinery or airport, maximize profit, only meet SAF demand
-m = create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity, profit_obj = True, grass_roots_factor=0.5, breakpoints=10, ref_blend=True)
+profiler.start('build')
+m = create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity, profit_obj = True, grass_roots_factor=0.5, breakpoints=10, ref_blend=True, mutable_params=['saf_premium'])
+profiler.stop('build')
 
 #Fix to no SAF capacity at all airports
 for i in m.AIRPORTS:
@@ -38,6 +63,11 @@ for i in m.REFINERIES:
 for i in m.MILLS:
     m.s[i].fix(0)
 
+#Add symmetry breaking constraints on the investment decisions of interchangeable mills
+if symmetry_breaking:
+    dominance = add_symmetry_breaking(m, symmetry_tolerance)
+    dominance.to_csv(results_dir + "/symmetry_breaking.csv")
+
 
 prem_range = np.linspace(0,4,41)
 result = {}
@@ -47,18 +77,31 @@ result['Total Cost'] = []
 result['Total Profit'] = []
 result['premium'] = []
 
+#Resume from the premiums saved by a previous run
+production_file = results_dir + '/production.csv'
+checkpoint_file = results_dir + '/incumbent.json'
+if os.path.isfile(production_file):
+    previous = pd.read_csv(production_file, index_col=0)
+    for key in result:
+        result[key] = list(previous[key])
+
 #loop through the premium range
 for j in prem_range:
+    #Skip the premiums already solved
+    if np.isclose(result['premium'], j).any():
+        continue
 
     #Specify SAF Premium Parameter
     m.saf_premium = j*1000 #Convert from $R/l to $R/m3
 
-    solver = pyo.SolverFactory('gurobi')
+    #Solve the model in checkpointed segments, resuming from the saved incumbent after a restart
+    results = solve_with_checkpoints(m, solver_name, gap=gap_schedule.get(round(j, 1), default_gap), time_limit=time_limit, segment_time=segment_time, checkpoint_file=checkpoint_file, tee=True, log_file=results_dir + "/solver.log")
 
-    solver.options['MIPGap'] = 0.0005 #Increase the MIP gap since not worried about the exact location of SAF investments to improve solve time
-    results = solver.solve(m, tee=True)
+    #Record the solver telemetry of the premium in the metrics table of the run
+    record_solver_telemetry(results_dir + "/solver.log", solver_name, results_dir + "/solver_metrics.csv", scenario={'premium': j})
 
     #Sum the total SAF production
+    profiler.start('export')
     saf = 0
     eth = 0
     for i in m.MILLS:
@@ -72,10 +115,18 @@ for j in prem_range:
     result['Total Cost'].append(pyo.value(m.sc_cost_expression))
     result['Total Profit'].append(pyo.value(m.profit_expression))
     result['premium'].append(j)
+
+    #Save the results after every premium so a killed run only loses the current solve
+    atomic_to_csv(pd.DataFrame.from_dict(result), production_file)
+    if os.path.isfile(checkpoint_file):
+        os.remove(checkpoint_file)
+    profiler.stop('export')
     
 
 
 results_df = pd.DataFrame.from_dict(result)
 results_df.to_csv(results_dir + '/production.csv')
 
-
+#Save the timing and peak memory breakdown of the run
+profiler.disable()
+profiler.save(results_dir + '/profile.json')
@@ -0,0 +1,14 @@
+from validate_results import validate_all
+import os
+
+this_file_path = os.path.dirname(os.path.realpath(__file__))
+
+#Specify Input Data and Parameters
+data = 'base_case_data_with_demands.xlsx' #Workbook with the airport SAF demands of the stored results
+tol = 1e-5 #Relative violation tolerance of each constraint
+
+#Validate every results folder (cases, blends, integer cuts and mill-specific incentives)
+summary = validate_all(this_file_path, data, tol=tol, report_file=os.path.join(this_file_path, "results_validation.csv"))
+summary.to_csv(os.path.join(this_file_path, "results_validation_summary.csv"))
+print('%d of %d results folders passed in %.1f s' % (summary['passed'].sum(), len(summary), summary['time'].sum()))
+print(summary.loc[~summary['passed']].set_index('folder').T)
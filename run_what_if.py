@@ -0,0 +1,64 @@
+from create_sc_model_full import *
+from stochastic_prices import sample_price_scenarios, scenario_table
+from validate_results import load_snapshot
+from what_if import design_from_snapshot, evaluate_flows, create_what_if_lp, solve_what_if
+import os
+import pandas as pd
+import numpy as np
+
+this_file_path = os.path.dirname(os.path.realpath(__file__))
+
+# create a directory to save results
+results_dir = os.path.join(this_file_path, "what_if")
+if not os.path.isdir(results_dir):
+    os.mkdir(results_dir)
+
+#Specify Input Data and Parameters of the stored results
+stored_results = os.path.join(this_file_path, "Case1", "interest_mid_blend_10") #Stored results with the design to evaluate
+data = 'base_case_data_with_demands.xlsx'
+saf_prem = 0 #No SAF premium
+eth_prem = 0 #No ethanol premium
+max_saf_capacity = 700000
+blend = 0.1 #SAF blend requirement of the stored results
+
+#What-if settings
+n_scenarios = 10000 #Number of sampled price vectors evaluated with the flows of the stored results
+price_cv = 0.1 #Coefficient of variation of each price
+seed = 0 #Seed of the price sampling
+logistic_factors = np.linspace(0.5, 2, 16) #Logistic cost factors of the fixed design LP re-solves
+saf_demand_factors = [0.9, 1.1] #SAF demand factors of the fixed design LP re-solves
+lp_params = ['logistic_cost', 'fixed_logistic_cost', 'individual_saf_demand'] #Parameters varied in the fixed design LP
+
+#Create supply chain model for Case 1 with the varied parameters mutable, set profit_obj = True for Case 3
+m = create_supply_chain_model(data, saf_prem, eth_prem, blend, max_saf_capacity, profit_obj = False, grass_roots_factor=0.5, breakpoints=10, ref_blend=True, mutable_params=lp_params)
+
+#Fix to no saf capacity at all airports
+for i in m.AIRPORTS:
+    m.z[i].fix(0)
+
+#Fix investments at refineries to 0 for Cases 1 and 3
+for i in m.REFINERIES:
+   m.y_ref[i].fix(0)
+
+#Set mill specific incetives to 0, not used for this analysis
+for i in m.MILLS:
+    m.s[i].fix(0)
+
+#Evaluate the stored flows at sampled prices
+snapshot = load_snapshot(stored_results)
+scenarios = sample_price_scenarios(m, n_scenarios, cv=price_cv, seed=seed)
+flow_results = pd.concat([scenario_table(scenarios), evaluate_flows(m, snapshot, scenarios)], axis=1)
+flow_results.to_csv(results_dir + "/flow_what_if.csv")
+
+#Re-solve the flows of the stored design at other logistic costs and SAF demands
+design = design_from_snapshot(m, snapshot)
+what_if = create_what_if_lp(m, design, lp_params, results_dir + "/what_if_lp.mps.gz")
+lp_scenarios = [{'logistic_cost': pyo.value(m.logistic_cost)*k, 'fixed_logistic_cost': pyo.value(m.fixed_logistic_cost)*k} for k in logistic_factors]
+lp_scenarios += [{'individual_saf_demand': {a: pyo.value(m.individual_saf_demand[a])*k for a in m.AIRPORTS}} for k in saf_demand_factors]
+lp_results = solve_what_if(what_if, lp_scenarios, tee=True)
+lp_results['logistic factor'] = list(logistic_factors) + [1.0]*len(saf_demand_factors)
+lp_results['SAF demand factor'] = [1.0]*len(logistic_factors) + list(saf_demand_factors)
+lp_results.to_csv(results_dir + "/lp_what_if.csv")
+
+print(flow_results[['objective', 'min individual profit', 'negative profit mills']].describe())
+print(lp_results)
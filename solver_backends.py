@@ -0,0 +1,119 @@
+'''
+This file contains functions to create and run the MILP solvers supported for the supply chain model (Gurobi, HiGHS through
+appsi_highs and CBC) with the same common options, so the run scripts do not depend on a single solver.
+'''
+
+#Import the necessary packages
+import os
+import sys
+
+import pyomo.environ as pyo
+from pyomo.common.tee import capture_output
+
+from profiling import phase
+
+#Solvers in order of preference when none is requested
+SOLVERS = ['gurobi', 'appsi_highs', 'cbc']
+
+#Names of the common options for each solver
+SOLVER_OPTIONS = {
+    'gurobi': {'gap': 'MIPGap', 'threads': 'Threads', 'time_limit': 'TimeLimit'},
+    'gurobi_persistent': {'gap': 'MIPGap', 'threads': 'Threads', 'time_limit': 'TimeLimit'},
+    'appsi_highs': {'gap': 'mip_rel_gap', 'threads': 'threads', 'time_limit': 'time_limit'},
+    'highs': {'gap': 'mip_rel_gap', 'threads': 'threads', 'time_limit': 'time_limit'},
+    'cbc': {'gap': 'ratioGap', 'threads': 'threads', 'time_limit': 'seconds'},
+}
+
+
+def available_solvers(candidates=None):
+    '''
+    This function lists the supported solvers that can be run on this machine.
+
+    Inputs:
+
+            candidates: list of solver names to check (defaults to SOLVERS)
+
+    Returns: list of the available solver names, in the order of candidates
+    '''
+    available = []
+    for name in candidates or SOLVERS:
+        try:
+            if pyo.SolverFactory(name).available(exception_flag=False):
+                available.append(name)
+        except Exception:
+            #Solver plugins that cannot even be queried (missing executables or licences) are not available
+            continue
+    return available
+
+
+def default_solver():
+    '''
+    This function selects the solver used by the run scripts: the SC_SOLVER environment variable if it is set, otherwise
+    the first available solver of SOLVERS.
+
+    Returns: solver name
+    '''
+    name = os.environ.get('SC_SOLVER')
+    if name:
+        return name
+    available = available_solvers()
+    if not available:
+        raise RuntimeError('None of the supported solvers %s is available' % SOLVERS)
+    return available[0]
+
+
+def get_solver(name=None, gap=None, threads=None, time_limit=None, options=None):
+    '''
+    This function creates a solver with the common options translated to its own option names.
+
+    Inputs:
+
+            name: solver name, one of SOLVER_OPTIONS (defaults to default_solver())
+            gap: relative MIP gap
+            threads: number of threads
+            time_limit: time limit in seconds
+            options: dictionary of additional solver specific options
+
+    Returns: Pyomo solver
+    '''
+    name = name or default_solver()
+    if name not in SOLVER_OPTIONS:
+        raise ValueError('Unsupported solver %s, choose one of %s' % (name, list(SOLVER_OPTIONS)))
+    solver = pyo.SolverFactory(name)
+    for key, val in (('gap', gap), ('threads', threads), ('time_limit', time_limit)):
+        if val is not None:
+            solver.options[SOLVER_OPTIONS[name][key]] = val
+    for key, val in (options or {}).items():
+        solver.options[key] = val
+    return solver
+
+
+def solve_model(m, solver, warmstart=False, tee=False, log_file=None):
+    '''
+    This function solves a model and loads the best solution found, also when the solver stops at its time limit.
+
+    Inputs:
+
+            m: Pyomo model
+            solver: Pyomo solver, typically from get_solver
+            warmstart: True to start from the current variable values (MIP start) when the solver supports it
+            tee: True to print the solver log
+            log_file: path of a file the solver log is appended to, e.g. for solver_telemetry (None to not capture it)
+
+    Returns: Pyomo results object
+    '''
+    kwargs = {'tee': tee, 'load_solutions': False}
+    if warmstart and solver.warm_start_capable():
+        kwargs['warmstart'] = True
+    with phase('solve'):
+        if log_file is None:
+            results = solver.solve(m, **kwargs)
+        else:
+            #Capture the solver log, still printing it when tee is True
+            kwargs['tee'] = True
+            with open(log_file, 'a') as f:
+                with capture_output([f, sys.stdout] if tee else f):
+                    results = solver.solve(m, **kwargs)
+    if len(results.solution) > 0 and results.solver.termination_condition not in (pyo.TerminationCondition.infeasible, pyo.TerminationCondition.infeasibleOrUnbounded):
+        m.solutions.load_from(results)
+    return results
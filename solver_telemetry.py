@@ -0,0 +1,244 @@
+'''
+This file contains functions to parse the logs of the MILP solvers supported in solver_backends (HiGHS, Gurobi and CBC)
+into structured telemetry (problem sizes before and after presolve, root LP time and gap, incumbent and bound trajectory,
+node count and wall time) and to record it in a per-run metrics table next to the scenario results.
+'''
+
+#Import the necessary packages
+import os
+import re
+import time
+
+import pandas as pd
+
+NUMBER = r'[-+]?(?:\d+\.?\d*(?:[eE][-+]?\d+)?|inf|Infinity)'
+
+#Marker at the start of each solver run, a log captured over several (segmented) solves holds several runs
+RUN_START = {
+    'highs': re.compile(r'^Running HiGHS', re.M),
+    'gurobi': re.compile(r'^Gurobi Optimizer version', re.M),
+    'cbc': re.compile(r'^Welcome to the CBC MILP Solver', re.M),
+}
+
+
+def _solver_family(solver_name):
+    '''
+    Returns the log format (highs, gurobi or cbc) of a solver name from solver_backends.SOLVER_OPTIONS
+    '''
+    for family in RUN_START:
+        if family in solver_name:
+            return family
+    raise ValueError('No log parser for solver %s' % solver_name)
+
+
+def _number(text):
+    '''
+    Converts a number printed in a solver log to float (None for missing values such as - or inf)
+    '''
+    if text is None or text in ('-', ''):
+        return None
+    value = float(text.replace('Infinity', 'inf'))
+    return None if abs(value) == float('inf') else value
+
+
+def _gap(incumbent, bound):
+    '''
+    Relative gap between an incumbent and a bound, as reported by the solvers
+    '''
+    if incumbent is None or bound is None:
+        return None
+    return abs(incumbent - bound)/max(abs(incumbent), 1e-10)
+
+
+def _parse_highs(log):
+    '''
+    Parses one HiGHS MIP run
+    '''
+    metrics = {}
+    trajectory = []
+    match = re.search(r'MIP has (\d+) rows; (\d+) cols; (\d+) nonzeros', log)
+    if match:
+        metrics['rows'], metrics['columns'], metrics['nonzeros'] = map(int, match.groups())
+    match = re.search(r'Presolve reductions: rows (\d+)\(.*?\); columns (\d+)\(.*?\); nonzeros (\d+)', log)
+    if match:
+        metrics['presolved_rows'], metrics['presolved_columns'], metrics['presolved_nonzeros'] = map(int, match.groups())
+    else:
+        match = re.search(r'Solving MIP model with:\s+(\d+) rows\s+(\d+) cols.*?\s+(\d+) nonzeros', log, re.S)
+        if match:
+            metrics['presolved_rows'], metrics['presolved_columns'], metrics['presolved_nonzeros'] = map(int, match.groups())
+
+    #Node log: Src Proc. InQueue | Leaves Expl. | BestBound BestSol Gap | Cuts InLp Confl. | LpIters Time
+    node_line = re.compile(r'^\s*([A-Za-z]?)\s+(\d+)\s+(\d+)\s+(\d+)\s+([\d.]+)%%\s+(%s)\s+(%s)\s+(\S+)\s+\d+\s+\d+\s+\d+\s+\d+\s+([\d.]+)s\s*$' % (NUMBER, NUMBER), re.M)
+    for source, nodes, queue, leaves, explored, bound, incumbent, gap, seconds in node_line.findall(log):
+        trajectory.append({'time': float(seconds), 'nodes': int(nodes), 'bound': _number(bound), 'incumbent': _number(incumbent)})
+    root = [point for point in trajectory if point['nodes'] == 0]
+    if root:
+        metrics['root_lp_time'] = root[0]['time']
+        metrics['root_bound'] = root[-1]['bound']
+        metrics['root_incumbent'] = root[-1]['incumbent']
+        metrics['root_gap'] = _gap(root[-1]['incumbent'], root[-1]['bound'])
+
+    for key, pattern in (('status', r'^\s*Status\s+(.+?)\s*$'), ('incumbent', r'^\s*Primal bound\s+(%s)' % NUMBER),
+                         ('bound', r'^\s*Dual bound\s+(%s)' % NUMBER), ('nodes', r'^\s*Nodes\s+(\d+)'),
+                         ('wall_time', r'^\s*Timing\s+([\d.]+)'), ('lp_iterations', r'^\s*LP iterations\s+(\d+)')):
+        match = re.search(pattern, log, re.M)
+        if match:
+            metrics[key] = match.group(1) if key == 'status' else _number(match.group(1))
+    return metrics, trajectory
+
+
+def _parse_gurobi(log):
+    '''
+    Parses one Gurobi MIP run
+    '''
+    metrics = {}
+    trajectory = []
+    match = re.search(r'Optimize a model with (\d+) rows, (\d+) columns and (\d+) nonzeros', log)
+    if match:
+        metrics['rows'], metrics['columns'], metrics['nonzeros'] = map(int, match.groups())
+    match = re.search(r'Presolved: (\d+) rows, (\d+) columns, (\d+) nonzeros', log)
+    if match:
+        metrics['presolved_rows'], metrics['presolved_columns'], metrics['presolved_nonzeros'] = map(int, match.groups())
+    match = re.search(r'Root relaxation: objective (%s), (\d+) iterations, ([\d.]+) seconds' % NUMBER, log)
+    if match:
+        metrics['root_lp_time'] = float(match.group(3))
+
+    #Node log: Expl Unexpl | Obj Depth IntInf | Incumbent BestBd Gap | It/Node Time
+    node_line = re.compile(r'^\s*[H*]?\s*(\d+)\s+(\d+)\s+.*?(%s|-)\s+(%s)\s+([\d.]+%%|-)\s+\S+\s+(\d+)s\s*$' % (NUMBER, NUMBER), re.M)
+    for explored, unexplored, incumbent, bound, gap, seconds in node_line.findall(log):
+        trajectory.append({'time': float(seconds), 'nodes': int(explored), 'bound': _number(bound), 'incumbent': _number(incumbent)})
+    root = [point for point in trajectory if point['nodes'] == 0]
+    if root:
+        metrics['root_bound'] = root[-1]['bound']
+        metrics['root_incumbent'] = root[-1]['incumbent']
+        metrics['root_gap'] = _gap(root[-1]['incumbent'], root[-1]['bound'])
+
+    match = re.search(r'Explored (\d+) nodes \((\d+) simplex iterations\) in ([\d.]+) seconds', log)
+    if match:
+        metrics['nodes'], metrics['lp_iterations'], metrics['wall_time'] = int(match.group(1)), int(match.group(2)), float(match.group(3))
+    match = re.search(r'Best objective (%s), best bound (%s), gap' % (NUMBER, NUMBER), log)
+    if match:
+        metrics['incumbent'], metrics['bound'] = _number(match.group(1)), _number(match.group(2))
+    match = re.search(r'^(Optimal solution found|Time limit reached|Model is infeasible.*|Solution limit reached|Interrupt request received)', log, re.M)
+    if match:
+        metrics['status'] = match.group(1)
+    return metrics, trajectory
+
+
+def _parse_cbc(log):
+    '''
+    Parses one CBC MIP run
+    '''
+    metrics = {}
+    trajectory = []
+    match = re.search(r'Problem .*?has (\d+) rows, (\d+) columns \(\d+ with objective\) and (\d+) elements', log)
+    if match:
+        metrics['rows'], metrics['columns'], metrics['nonzeros'] = map(int, match.groups())
+    match = re.search(r'processed model has (\d+) rows, (\d+) columns \(\d+ integer.*?\) and (\d+) elements', log)
+    if match:
+        metrics['presolved_rows'], metrics['presolved_columns'], metrics['presolved_nonzeros'] = map(int, match.groups())
+    match = re.search(r'Continuous objective value is (%s) - ([\d.]+) seconds' % NUMBER, log)
+    if match:
+        metrics['root_lp_time'] = float(match.group(2))
+        metrics['root_bound'] = _number(match.group(1))
+    match = re.search(r'At root node, .*? changed objective from %s to (%s)' % (NUMBER, NUMBER), log)
+    if match:
+        metrics['root_bound'] = _number(match.group(1))
+
+    #Progress lines with the bound and the incumbents found
+    incumbent = None
+    for line in log.splitlines():
+        match = re.search(r'Integer solution of (%s) found .*?(\d+) nodes \(([\d.]+) seconds\)' % NUMBER, line)
+        if match:
+            incumbent = _number(match.group(1))
+            trajectory.append({'time': float(match.group(3)), 'nodes': int(match.group(2)), 'bound': None, 'incumbent': incumbent})
+            continue
+        match = re.search(r'After (\d+) nodes, \d+ on tree, (%s) best solution, best possible (%s) \(([\d.]+) seconds\)' % (NUMBER, NUMBER), line)
+        if match:
+            trajectory.append({'time': float(match.group(4)), 'nodes': int(match.group(1)), 'bound': _number(match.group(3)), 'incumbent': _number(match.group(2))})
+    root = [point for point in trajectory if point['nodes'] == 0 and point['incumbent'] is not None]
+    if root and 'root_bound' in metrics:
+        metrics['root_incumbent'] = root[-1]['incumbent']
+        metrics['root_gap'] = _gap(root[-1]['incumbent'], metrics['root_bound'])
+
+    for key, pattern in (('status', r'^Result - (.+?)\s*$'), ('incumbent', r'^Objective value:\s+(%s)' % NUMBER),
+                         ('bound', r'^Lower bound:\s+(%s)' % NUMBER), ('nodes', r'^Enumerated nodes:\s+(\d+)'),
+                         ('lp_iterations', r'^Total iterations:\s+(\d+)'), ('wall_time', r'\(Wallclock seconds\):\s+([\d.]+)')):
+        match = re.search(pattern, log, re.M)
+        if match:
+            metrics[key] = match.group(1) if key == 'status' else _number(match.group(1))
+    return metrics, trajectory
+
+
+PARSERS = {'highs': _parse_highs, 'gurobi': _parse_gurobi, 'cbc': _parse_cbc}
+
+
+def parse_solver_log(log, solver_name):
+    '''
+    This function parses a captured solver log into telemetry. Logs holding several runs (segmented solves) are combined:
+    sizes and root statistics come from the first run, final statistics from the last one, and times and node counts are
+    summed.
+
+    Inputs:
+
+            log: text of the solver log
+            solver_name: solver name, one of solver_backends.SOLVER_OPTIONS
+
+    Returns: metrics: dictionary of scalar metrics (missing entries were not found in the log)
+             trajectory: pandas DataFrame with the time, nodes, bound and incumbent at each logged point
+    '''
+    family = _solver_family(solver_name)
+    starts = [match.start() for match in RUN_START[family].finditer(log)] or [0]
+    runs = [log[start:end] for start, end in zip(starts, starts[1:] + [len(log)])]
+
+    metrics = {'solver': solver_name, 'runs': len(runs)}
+    trajectory = []
+    offset = 0
+    for r, run in enumerate(runs):
+        run_metrics, run_trajectory = PARSERS[family](run)
+        for point in run_trajectory:
+            point['time'] += offset
+            point['run'] = r
+        trajectory.extend(run_trajectory)
+        for key, val in run_metrics.items():
+            if key in ('nodes', 'lp_iterations', 'wall_time'):
+                metrics[key] = metrics.get(key, 0) + val
+            elif r == 0 or not key.startswith(('rows', 'columns', 'nonzeros', 'presolved', 'root')):
+                metrics[key] = val
+        offset += run_metrics.get('wall_time') or (run_trajectory[-1]['time'] if run_trajectory else 0)
+    metrics['gap'] = _gap(metrics.get('incumbent'), metrics.get('bound'))
+
+    trajectory = pd.DataFrame(trajectory, columns=['run', 'time', 'nodes', 'bound', 'incumbent'])
+    if len(trajectory):
+        found = trajectory[trajectory['incumbent'].notna()]
+        metrics['time_to_first_incumbent'] = float(found['time'].iloc[0]) if len(found) else None
+    return metrics, trajectory
+
+
+def record_solver_telemetry(log_file, solver_name, metrics_file, results_dir=None, scenario=None):
+    '''
+    This function parses the log of a scenario solve and appends its metrics to the metrics table of the run.
+
+    Inputs:
+
+            log_file: path of the captured solver log (see solver_backends.solve_model)
+            solver_name: solver name, one of solver_backends.SOLVER_OPTIONS
+            metrics_file: path of the CSV metrics table, created when it does not exist yet
+            results_dir: directory of the scenario results, where the trajectory is saved as solver_trajectory.csv
+                         (None to skip)
+            scenario: dictionary of columns identifying the scenario, e.g. {'case': 'Case1', 'blend': 0.5}
+
+    Returns: dictionary of the metrics recorded
+    '''
+    with open(log_file) as f:
+        metrics, trajectory = parse_solver_log(f.read(), solver_name)
+    metrics = dict(scenario or {}, **metrics)
+    metrics['recorded'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    if results_dir is not None:
+        trajectory.to_csv(os.path.join(results_dir, 'solver_trajectory.csv'))
+
+    table = pd.DataFrame([metrics])
+    if os.path.isfile(metrics_file):
+        table = pd.concat([pd.read_csv(metrics_file), table], ignore_index=True)
+    table.to_csv(metrics_file, index=False)
+    return metrics
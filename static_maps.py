@@ -0,0 +1,333 @@
+'''
+This file contains a static map pipeline for the figures of SupplyChainMaps.ipynb: the input data panel by Brazilian state,
+the four-case optimal design panel and the zoomed design maps.
+
+The state geometries and the facility point layers are reprojected once per coordinate reference system and cached as
+GeoParquet files, facilities are assigned to states with a spatial join, and the designs are selected from the cached
+facility layers with the key results of each case. The figures are drawn on matplotlib Figure objects without pyplot, so
+they can be generated headless in batch.
+'''
+
+#Import the necessary packages
+import os
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import matplotlib as mpl
+from matplotlib.figure import Figure
+
+#Brazilian states shapefile, projected coordinate reference system of the zoomed maps (SIRGAS 2000 / Brazil Polyconic)
+#and directory of the cached layers
+STATES_SHAPEFILE = 'gadm41_BRA_1.shp'
+PROJECTED_CRS = 5880
+CACHE_DIR = 'static_map_cache'
+
+#Facility layers: workbook, sheet and the columns kept besides the location
+FACILITIES = {'mills': ('335MillsLatitudesLongitudes.xlsx', 0, ['Mills', 'Sugarcane Capacity (ton)']),
+              'ethanol mills': ('335MillsLatitudesLongitudes.xlsx', 'ethanol', ['Mills', 'Sugarcane Capacity (ton)']),
+              'annexed mills': ('335MillsLatitudesLongitudes.xlsx', 'annexed', ['Mills', 'Sugarcane Capacity (ton)']),
+              'refineries': ('OilRefineriesLatLong.xlsx', 0, ['name', 'refinery', 'Capacity m3 year']),
+              'airports': ('AirportsLatitudeLongitude.xlsx', 0, ['NOME', 'DEMANDA (M^3)'])}
+
+#Case studies: panel position, title and the key results column of the ethanol supply of the design
+CASES = {'Case1': ((0, 0), 'a) Case 1', 'etref'),
+         'Case2': ((0, 1), 'b) Case 2', 'etr'),
+         'Case3': ((1, 0), 'c) Case 3', 'etref'),
+         'Case4': ((1, 1), 'd) Case 4', 'etr')}
+
+#Zoomed maps: case, title, states to zoom on and location of the scale bar
+ZOOMS = [('Case1', 'Case 1 (SP Zoom)', ['São Paulo'], 'lower left'),
+         ('Case1', 'Case 1 (NE Coast Zoom)', ['Rio Grande do Norte', 'Paraíba', 'Pernambuco', 'Alagoas', 'Sergipe'], 'lower right'),
+         ('Case3', 'Case 3 (SP Zoom)', ['São Paulo'], 'lower left'),
+         ('Case2', 'Case 2 (SP Zoom)', ['Rio de Janeiro', 'Minas Gerais', 'São Paulo'], 'lower left'),
+         ('Case2', 'Case 2 (NE Zoom)', ['Rio Grande do Norte', 'Paraíba', 'Pernambuco'], 'lower right'),
+         ('Case4', 'Case 4 (NE Zoom)', ['Rio Grande do Norte', 'Paraíba', 'Pernambuco'], 'lower right'),
+         ('Case4', 'Case 4 (SP Zoom)', ['Rio de Janeiro', 'Minas Gerais', 'São Paulo', 'Paraná'], 'lower left')]
+
+
+def _fix_name(name):
+    '''
+    Repairs a name read from UTF-8 bytes as Latin-1 (e.g. SÃ£o Paulo)
+    '''
+    try:
+        return name.encode('latin-1').decode('utf-8')
+    except (UnicodeEncodeError, UnicodeDecodeError, AttributeError):
+        return name
+
+
+def _cached(name, sources, build, cache_dir=CACHE_DIR):
+    '''
+    Returns the layer cached in cache_dir/name.parquet when it is newer than its source files (or they are missing),
+    otherwise builds it with build() and caches it. Without pyarrow the layer is built every time.
+    '''
+    path = os.path.join(cache_dir, name + '.parquet')
+    if os.path.isfile(path) and all(not os.path.isfile(source) or os.path.getmtime(path) >= os.path.getmtime(source) for source in sources):
+        try:
+            return gpd.read_parquet(path)
+        except ImportError:
+            pass
+    layer = build()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        layer.to_parquet(path)
+    except (ImportError, OSError):
+        pass
+    return layer
+
+
+def load_states(crs=PROJECTED_CRS, shapefile_path=STATES_SHAPEFILE, cache_dir=CACHE_DIR):
+    '''
+    This function loads the Brazilian state geometries in a coordinate reference system, from the cache when it is
+    newer than the shapefile.
+
+    Inputs:
+
+            crs: EPSG code of the coordinate reference system (4326 for latitude/longitude)
+            shapefile_path: path of the GADM level 1 shapefile of Brazil
+            cache_dir: directory of the cached layers
+
+    Returns: GeoDataFrame with the state names ('NAME_1') and geometries
+    '''
+    def build():
+        states = gpd.read_file(shapefile_path)
+        if states.crs is None:
+            states = states.set_crs(epsg=4326)
+        states = states[['NAME_1', 'geometry']].to_crs(epsg=crs)
+        states['NAME_1'] = states['NAME_1'].map(_fix_name)
+        return states
+    return _cached('states_%d' % crs, [shapefile_path], build, cache_dir)
+
+
+def load_facilities(crs=PROJECTED_CRS, shapefile_path=STATES_SHAPEFILE, cache_dir=CACHE_DIR):
+    '''
+    This function loads the mill, refinery and airport locations as point layers in a coordinate reference system, with
+    the state each facility is located in, from the cache when it is newer than the workbooks and the shapefile.
+
+    Inputs:
+
+            crs: EPSG code of the coordinate reference system (4326 for latitude/longitude)
+            shapefile_path: path of the GADM level 1 shapefile of Brazil
+            cache_dir: directory of the cached layers
+
+    Returns: dictionary of GeoDataFrames by layer (the keys of FACILITIES) with the columns of FACILITIES and 'State'
+    '''
+    states = None
+    facilities = {}
+    for layer, (workbook, sheet, columns) in FACILITIES.items():
+        def build():
+            nonlocal states
+            if states is None:
+                states = load_states(crs, shapefile_path, cache_dir)
+            data = pd.read_excel(workbook, sheet_name=sheet)
+            points = gpd.GeoDataFrame(data[columns], geometry=gpd.points_from_xy(data['Longitude'], data['Latitude']), crs='EPSG:4326').to_crs(epsg=crs)
+            located = gpd.sjoin(points, states, how='left', predicate='within')
+            points['State'] = located.loc[~located.index.duplicated(), 'NAME_1']
+            return points
+        facilities[layer] = _cached('%s_%d' % (layer.replace(' ', '_'), crs), [workbook, shapefile_path], build, cache_dir)
+    return facilities
+
+
+def state_totals(states, facilities):
+    '''
+    This function sums the sugarcane capacity, refining capacity and jet fuel demand of the facilities in each state.
+
+    Inputs:
+
+            states: GeoDataFrame from load_states
+            facilities: dictionary of GeoDataFrames from load_facilities
+
+    Returns: copy of states with the log10 of each total ('Capacity', 'Ref Capacity' and 'demand', NaN for totals up to 1)
+    '''
+    states = states.copy()
+    for column, (layer, value) in {'Capacity': ('mills', 'Sugarcane Capacity (ton)'),
+                                   'Ref Capacity': ('refineries', 'Capacity m3 year'),
+                                   'demand': ('airports', 'DEMANDA (M^3)')}.items():
+        total = states['NAME_1'].map(facilities[layer].groupby('State')[value].sum()).fillna(0)
+        states[column] = np.log10(total.where(total > 1))
+    return states
+
+
+def design_layers(results_dir, facilities, ethanol_column='etref'):
+    '''
+    This function selects the SAF producing mills, ethanol supplying mills and SAF blending refineries of an optimal
+    design from the facility layers.
+
+    Inputs:
+
+            results_dir: results folder with key_results_mills.csv and key_results_ref.csv
+            facilities: dictionary of GeoDataFrames from load_facilities
+            ethanol_column: key results column of the ethanol supply of the case ('etref' or 'etr', see CASES)
+
+    Returns: dictionary of GeoDataFrames ('saf mills', 'ethanol mills' and 'refineries')
+    '''
+    mills = pd.read_csv(results_dir + '/key_results_mills.csv')
+    refs = pd.read_csv(results_dir + '/key_results_ref.csv')
+    return {'saf mills': facilities['mills'][facilities['mills']['Mills'].isin(mills.loc[mills['SAF'] > 10, 'mills'])],
+            'ethanol mills': facilities['mills'][facilities['mills']['Mills'].isin(mills.loc[mills[ethanol_column] > 1, 'mills'])],
+            'refineries': facilities['refineries'][facilities['refineries']['name'].isin(refs.loc[refs['blended SAF'] > 10, 'refinery'])]}
+
+
+def _plot_design(ax, layers):
+    '''
+    Plots the layers of design_layers on an axis
+    '''
+    if len(layers['ethanol mills']) > 0:
+        layers['ethanol mills'].plot(ax=ax, color='blue', markersize=50, alpha=1, marker='^')
+    if len(layers['refineries']) > 0:
+        layers['refineries'].plot(ax=ax, color='black', markersize=100, alpha=1, marker='s')
+    if len(layers['saf mills']) > 0:
+        layers['saf mills'].plot(ax=ax, color='green', markersize=50, alpha=1, edgecolor='black')
+
+
+def _save(fig, output, dpi):
+    '''
+    Saves a figure when an output path is given
+    '''
+    if output is not None:
+        fig.savefig(output, bbox_inches='tight', dpi=dpi)
+
+
+def plot_input_panel(states, facilities, output=None, dpi=500):
+    '''
+    This function draws the input data panel: sugarcane capacity, refining capacity and jet fuel demand by state and the
+    locations of the mills, airports and refineries.
+
+    Inputs:
+
+            states: GeoDataFrame from load_states
+            facilities: dictionary of GeoDataFrames from load_facilities, in the coordinate reference system of states
+            output: path of the image file to save the figure to (None to skip)
+            dpi: resolution of the saved image
+
+    Returns: matplotlib Figure
+    '''
+    states = state_totals(states, facilities)
+    fig = Figure(figsize=(12, 14))
+    ax = fig.subplots(2, 2)
+    fig.subplots_adjust(hspace=0)
+
+    #State totals, hatched where there is none
+    for position, column, cmap, label, location in [((0, 0), 'Capacity', mpl.cm.Blues, 'Sugarcane Capacity by\nState log$_{10}$(tonne year$^{-1}$)', 'top'),
+                                                    ((0, 1), 'Ref Capacity', mpl.cm.Greys, 'Refining Capacity by\nState log$_{10}$(m$^3$ year$^{-1}$)', 'top'),
+                                                    ((1, 0), 'demand', mpl.cm.Greens, 'Jet Fuel Demand by\nState log$_{10}$(m$^3$ year$^{-1}$)', 'bottom')]:
+        states.plot(ax=ax[position], facecolor='none', edgecolor='black', hatch='///')
+        states.plot(column=column, cmap=cmap, linewidth=0.8, ax=ax[position], edgecolor='black')
+        sm = mpl.cm.ScalarMappable(cmap=cmap, norm=mpl.colors.Normalize(vmin=states[column].min(), vmax=states[column].max()))
+        sm.set_array([])
+        cbar = fig.colorbar(sm, ax=ax[position], orientation='horizontal', fraction=0.046, pad=0.07, location=location)
+        cbar.set_label(label, fontweight='bold', fontsize=14)
+
+    #Facility locations
+    states.plot(ax=ax[1, 1], color='white', edgecolor='black')
+    facilities['annexed mills'].plot(ax=ax[1, 1], color='brown', markersize=10, alpha=1, marker='o')
+    facilities['ethanol mills'].plot(ax=ax[1, 1], color='blue', markersize=10, alpha=1, marker='o')
+    facilities['airports'].plot(ax=ax[1, 1], color='green', markersize=60, alpha=1, marker='D')
+    facilities['refineries'].plot(ax=ax[1, 1], color='black', markersize=60, alpha=1, marker='s')
+
+    for a in ax.flat:
+        a.axis('off')
+    _save(fig, output, dpi)
+    return fig
+
+
+def plot_design_panel(states, facilities, blend=50, root=None, output=None, dpi=500):
+    '''
+    This function draws the optimal supply chain designs of the four case studies at a blend requirement.
+
+    Inputs:
+
+            states: GeoDataFrame from load_states
+            facilities: dictionary of GeoDataFrames from load_facilities, in the coordinate reference system of states
+            blend: blend requirement of the results folders (interest_mid_blend_<blend>), units: %
+            root: directory of the case results folders (None for the directory of this file)
+            output: path of the image file to save the figure to (None to skip)
+            dpi: resolution of the saved image
+
+    Returns: matplotlib Figure
+    '''
+    if root is None:
+        root = os.path.dirname(os.path.realpath(__file__))
+    fig = Figure(figsize=(10, 10))
+    ax = fig.subplots(2, 2)
+    fig.subplots_adjust(hspace=0, wspace=0)
+    for case, (position, title, ethanol_column) in CASES.items():
+        layers = design_layers(os.path.join(root, case, 'interest_mid_blend_%d' % blend), facilities, ethanol_column)
+        states.plot(ax=ax[position], color='white', edgecolor='gray')
+        _plot_design(ax[position], layers)
+        ax[position].axis('off')
+        ax[position].set_title(title, fontweight='bold')
+    _save(fig, output, dpi)
+    return fig
+
+
+def plot_zoom_panel(states, facilities, blend=50, root=None, zooms=ZOOMS, output=None, dpi=500):
+    '''
+    This function draws the optimal designs zoomed on groups of states, with a 100 km scale bar when the coordinate
+    reference system is projected and matplotlib-scalebar is installed.
+
+    Inputs:
+
+            states: GeoDataFrame from load_states, preferably in PROJECTED_CRS
+            facilities: dictionary of GeoDataFrames from load_facilities, in the coordinate reference system of states
+            blend: blend requirement of the results folders (interest_mid_blend_<blend>), units: %
+            root: directory of the case results folders (None for the directory of this file)
+            zooms: list of (case, title, state names, scale bar location) of the maps, see ZOOMS
+            output: path of the image file to save the figure to (None to skip)
+            dpi: resolution of the saved image
+
+    Returns: matplotlib Figure
+    '''
+    try:
+        from matplotlib_scalebar.scalebar import ScaleBar
+    except ImportError:
+        ScaleBar = None
+    if root is None:
+        root = os.path.dirname(os.path.realpath(__file__))
+    layers = {case: design_layers(os.path.join(root, case, 'interest_mid_blend_%d' % blend), facilities, CASES[case][2]) for case in {zoom[0] for zoom in zooms}}
+
+    fig = Figure(figsize=(4, 20*len(zooms)/7))
+    ax = np.atleast_1d(fig.subplots(len(zooms), 1))
+    fig.subplots_adjust(hspace=0.5)
+    for a, (case, title, names, location) in zip(ax, zooms):
+        subset = states[states['NAME_1'].isin(names)]
+        if subset.empty:
+            raise ValueError('None of the states %s are in the states layer' % names)
+        minx, miny, maxx, maxy = subset.total_bounds
+
+        #All states in light gray for context and the zoomed states highlighted
+        states.plot(ax=a, facecolor='lightgray', edgecolor='black', linewidth=0.5)
+        subset.plot(ax=a, facecolor='white', edgecolor='black', linewidth=2)
+        _plot_design(a, layers[case])
+        if ScaleBar is not None and states.crs is not None and states.crs.is_projected:
+            a.add_artist(ScaleBar(dx=1, units='m', dimension='si-length', fixed_value=100, fixed_units='km', location=location))
+        a.set_xlim(minx, maxx)
+        a.set_ylim(miny, maxy)
+        a.set_title(title, fontweight='bold')
+        a.axis('off')
+    _save(fig, output, dpi)
+    return fig
+
+
+def plot_legend(kind='design', output=None, dpi=500):
+    '''
+    This function draws the legend of the design figures ('design') or of the facility map of the input data panel
+    ('input') as a separate figure, which avoids spacing issues in the panels.
+
+    Inputs:
+
+            kind: 'design' or 'input'
+            output: path of the image file to save the figure to (None to skip)
+            dpi: resolution of the saved image
+
+    Returns: matplotlib Figure
+    '''
+    entries = {'design': [('black', 100, 's', 'Refinery', None), ('green', 50, 'o', 'SAF-Producing Mill', 'black'), ('blue', 50, '^', 'Ethanol-Supplying Mill', None)],
+               'input': [('green', 100, 'o', 'Sugarcane Mill', None), ('black', 100, 's', 'Refinery', None), ('brown', 30, 'o', 'Annexed Sugarcane Mill', None), ('blue', 30, 'o', 'Ethanol Distillery', None)]}[kind]
+    fig = Figure()
+    ax = fig.subplots()
+    for color, size, marker, label, edgecolor in entries:
+        ax.scatter(1, 1, color=color, s=size, alpha=1, marker=marker, label=label, edgecolor=edgecolor)
+    ax.legend(fontsize=14)
+    _save(fig, output, dpi)
+    return fig
@@ -0,0 +1,347 @@
+'''
+This file contains a two-stage stochastic extension of the supply chain model for uncertain prices and a progressive
+hedging solver for it.
+
+The first-stage decisions are the SAF investment design: the investment binaries (y, y_ref, z) and the binaries selecting
+the CAPEX segment of each plant (aux, aux_ref, aux_air). Production and flows are second-stage decisions taken for each
+price scenario. Every scenario subproblem is the deterministic model of create_supply_chain_model with the prices of the
+scenario, plus the progressive hedging multiplier and proximal terms on the design in its objective. The proximal term of
+a binary variable is linear ((x - xbar)^2 = x*(1 - 2*xbar) + xbar^2), so the subproblems stay MILPs. The subproblems are
+solved in a process pool, and every worker holds one copy of the scenario model, so the number of scenarios is only
+limited by the solve time.
+'''
+
+#Import the necessary packages
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pyo
+
+from solver_backends import get_solver
+
+#Design variables shared by all scenarios
+FIRST_STAGE = ['y', 'aux', 'y_ref', 'aux_ref', 'z', 'aux_air']
+
+#Scenario model and solver settings held by each worker process (set before the pool is forked)
+_SCENARIO_MODEL = None
+
+
+def sample_price_scenarios(m, n, cv=0.2, products=None, seed=0):
+    '''
+    This function samples equally likely price scenarios around the prices of a model, with independent lognormal price
+    factors of mean 1.
+
+    Inputs:
+
+            m: Pyomo model created by create_supply_chain_model
+            n: number of scenarios
+            cv: coefficient of variation of each price, a number or a dictionary by product
+            products: products with uncertain prices (defaults to all products of the prices sheet)
+            seed: seed of the random number generator
+
+    Returns: list of scenario dictionaries with the scenario probability ('probability') and the prices ('price', by product)
+    '''
+    rng = np.random.default_rng(seed)
+    products = list(products or m.SELLING_PRODUCTS)
+    scenarios = [{'probability': 1/n, 'price': {}} for s in range(n)]
+    for product in products:
+        sigma = np.sqrt(np.log(1 + (cv[product] if isinstance(cv, dict) else cv)**2))
+        factors = rng.lognormal(-sigma**2/2, sigma, n)
+        for s in range(n):
+            scenarios[s]['price'][product] = pyo.value(m.price[product])*factors[s]
+    return scenarios
+
+
+def scenario_table(scenarios):
+    '''
+    This function converts a list of scenarios into a table.
+
+    Inputs:
+
+            scenarios: list of scenario dictionaries, e.g. from sample_price_scenarios
+
+    Returns: pandas DataFrame with one row per scenario and one column per parameter value
+    '''
+    rows = []
+    for scenario in scenarios:
+        row = {'probability': scenario.get('probability', 1/len(scenarios))}
+        for name, val in scenario.items():
+            if isinstance(val, dict):
+                row.update({'%s[%s]' % (name, index): v for index, v in val.items()})
+            elif name != 'probability':
+                row[name] = val
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def _first_stage_positions(m, first_stage):
+    '''
+    Returns the positions in m.component_data_objects(Var), which m.clone() preserves, of the free first-stage variables
+    '''
+    names = {id(v) for name in first_stage for v in getattr(m, name).values() if not v.fixed}
+    return [k for k, v in enumerate(m.component_data_objects(pyo.Var)) if id(v) in names]
+
+
+def _apply_scenario(sm, scenario):
+    '''
+    Sets the mutable parameters of the scenario model to the values of a scenario, after restoring the base values of
+    every parameter changed by an earlier scenario
+    '''
+    for (name, index), val in sm.ph_base_values.items():
+        getattr(sm, name)[index] = val
+    for name, val in scenario.items():
+        if name == 'probability':
+            continue
+        param = getattr(sm, name)
+        if not param.mutable:
+            raise ValueError('Parameter %s changes between scenarios, build the model with it in mutable_params' % name)
+        for index, v in (val.items() if isinstance(val, dict) else [(None, val)]):
+            if (name, index) not in sm.ph_base_values:
+                sm.ph_base_values[name, index] = pyo.value(param[index])
+            param[index] = v
+
+
+def create_scenario_model(m, first_stage=FIRST_STAGE):
+    '''
+    This function builds the scenario subproblem of progressive hedging: a copy of m with the multiplier (ph_w) and
+    proximal (ph_rho, ph_xbar) terms on the first-stage variables in its minimized objective ph_objective.
+
+    Inputs:
+
+            m: Pyomo model from create_supply_chain_model with the parameters varied by the scenarios mutable and the
+               fixes of the case applied
+            first_stage: names of the binary variables shared by all scenarios
+
+    Returns: Pyomo model sm, with the first-stage variables in sm.first_stage_list
+    '''
+    sm = m.clone()
+    variables = list(sm.component_data_objects(pyo.Var))
+    sm.first_stage_list = [variables[k] for k in _first_stage_positions(sm, first_stage)]
+    sm.sense = 1 if sm.objective.sense == pyo.minimize else -1
+    sm.ph_base_values = {}
+
+    sm.FIRST_STAGE = pyo.RangeSet(0, len(sm.first_stage_list) - 1)
+    sm.ph_w = pyo.Param(sm.FIRST_STAGE, initialize=0, mutable=True)
+    sm.ph_xbar = pyo.Param(sm.FIRST_STAGE, initialize=0, mutable=True)
+    sm.ph_rho = pyo.Param(sm.FIRST_STAGE, initialize=0, mutable=True)
+
+    sm.objective.deactivate()
+    def ph_objective(sm):
+        x = sm.first_stage_list
+        return (sm.sense*sm.objective.expr + sum(sm.ph_w[k]*x[k] for k in sm.FIRST_STAGE)
+                + sum(sm.ph_rho[k]/2*(x[k]*(1 - 2*sm.ph_xbar[k]) + sm.ph_xbar[k]**2) for k in sm.FIRST_STAGE))
+    sm.ph_objective = pyo.Objective(rule=ph_objective, sense=pyo.minimize)
+    return sm
+
+
+def _solve_scenario(task):
+    '''
+    Solves the scenario model of _SCENARIO_MODEL for one scenario with the given multipliers, proximal terms (None to leave
+    them out) or fixed design (None to optimize it) and returns its minimized objective without the hedging terms, the
+    dual bound of the solve and the first-stage values (None when no solution was found).
+    '''
+    scenario, w, xbar, rho, design = task
+    sm, solver_name, gap, solver_options = _SCENARIO_MODEL
+    _apply_scenario(sm, scenario)
+    for k in sm.FIRST_STAGE:
+        sm.ph_w[k] = w[k] if w is not None else 0
+        sm.ph_xbar[k] = xbar[k] if xbar is not None else 0
+        sm.ph_rho[k] = rho[k] if xbar is not None else 0
+        if design is not None:
+            sm.first_stage_list[k].fix(design[k])
+
+    solver = get_solver(solver_name, gap=gap, options=solver_options)
+    results = solver.solve(sm, load_solutions=False)
+    result = {'objective': None, 'bound': -np.inf, 'values': None, 'status': str(results.solver.termination_condition)}
+    if len(results.solution) > 0 and results.solver.termination_condition in (pyo.TerminationCondition.optimal, pyo.TerminationCondition.maxTimeLimit):
+        sm.solutions.load_from(results)
+        result['objective'] = sm.sense*pyo.value(sm.objective)
+        result['values'] = [int(round(x.value)) for x in sm.first_stage_list]
+        result['bound'] = results.problem.lower_bound if np.isfinite(results.problem.lower_bound) else pyo.value(sm.ph_objective)
+
+    if design is not None:
+        for x in sm.first_stage_list:
+            x.unfix()
+    return result
+
+
+def create_extensive_form(m, scenarios, first_stage=FIRST_STAGE):
+    '''
+    This function builds the deterministic equivalent of the stochastic model: one copy of m per scenario in the blocks
+    ef.scenario, with equal first-stage decisions and the expected objective. Use it to check progressive hedging on a few
+    scenarios, as its size grows with the number of scenarios.
+
+    Inputs:
+
+            m: Pyomo model from create_supply_chain_model with the parameters varied by the scenarios mutable
+            scenarios: list of scenario dictionaries, e.g. from sample_price_scenarios
+            first_stage: names of the binary variables shared by all scenarios
+
+    Returns: Pyomo model ef with the expected objective in the sense of m
+    '''
+    ef = pyo.ConcreteModel()
+    ef.SCENARIOS = pyo.RangeSet(0, len(scenarios) - 1)
+    ef.scenario = pyo.Block(ef.SCENARIOS)
+    positions = _first_stage_positions(m, first_stage)
+    for s, scenario in enumerate(scenarios):
+        block = ef.scenario[s]
+        block.transfer_attributes_from(m.clone())
+        block.ph_base_values = {}
+        _apply_scenario(block, scenario)
+        block.objective.deactivate()
+    first = [list(ef.scenario[s].component_data_objects(pyo.Var)) for s in ef.SCENARIOS]
+
+    ef.NONANTICIPATIVITY = pyo.Set(initialize=[(s, k) for s in ef.SCENARIOS if s > 0 for k in positions], dimen=2)
+    def nonanticipativity(ef, s, k):
+        return first[s][k] == first[0][k]
+    ef.nonanticipativity = pyo.Constraint(ef.NONANTICIPATIVITY, rule=nonanticipativity)
+
+    def expected_objective(ef):
+        return sum(scenario.get('probability', 1/len(scenarios))*ef.scenario[s].objective.expr for s, scenario in enumerate(scenarios))
+    ef.objective = pyo.Objective(rule=expected_objective, sense=m.objective.sense)
+    return ef
+
+
+def solve_progressive_hedging(m, scenarios, solver='gurobi', gap=None, solver_options=None, first_stage=FIRST_STAGE, rho=None,
+                              max_iter=50, tol=0, time_limit=None, workers=1, report_file=None, tee=False):
+    '''
+    This function solves the two-stage stochastic model with progressive hedging and evaluates the resulting design in
+    every scenario. The first pass (no hedging terms) gives the wait-and-see bound, the last one (final multipliers
+    without the proximal terms) a Lagrangian bound, and the expected objective of the design is the incumbent.
+
+    Inputs:
+
+            m: Pyomo model from create_supply_chain_model with the parameters varied by the scenarios mutable and the
+               fixes of the case applied
+            scenarios: list of scenario dictionaries, e.g. from sample_price_scenarios
+            solver: name of the MILP solver of the scenario subproblems, one of solver_backends.SOLVER_OPTIONS
+            gap: relative MIP gap of the scenario solves
+            solver_options: dictionary of solver specific options passed to the solver
+            first_stage: names of the binary variables shared by all scenarios
+            rho: proximal penalty per first-stage variable, units of the objective (None for 10% of the mean wait-and-see
+                 objective divided by the number of first-stage variables)
+            max_iter: maximum number of progressive hedging iterations
+            tol: expected number of first-stage variables differing from their mean at which to stop
+            time_limit: time in seconds after which no new iteration is started (None for no limit)
+            workers: number of processes solving scenarios in parallel (requires the fork start method)
+            report_file: path of a CSV file to save the iteration report to (None to skip)
+            tee: True to print the progress of each iteration
+
+    Returns: design: dictionary with the value of each first-stage variable by name
+             report: pandas DataFrame with the convergence, expected objective and bounds at each iteration
+             evaluation: pandas DataFrame with the objective of the design in every scenario
+    '''
+    global _SCENARIO_MODEL
+    start = time.time()
+    sm = create_scenario_model(m, first_stage)
+    names = [x.name for x in sm.first_stage_list]
+    n = len(names)
+    p = np.array([scenario.get('probability', 1/len(scenarios)) for scenario in scenarios])
+    _SCENARIO_MODEL = (sm, solver, gap, solver_options or {})
+
+    if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+        evaluate = lambda tasks: list(pool.map(_solve_scenario, tasks))
+    else:
+        pool = None
+        evaluate = lambda tasks: [_solve_scenario(task) for task in tasks]
+
+    def check(results, step):
+        failed = [s for s, result in enumerate(results) if result['values'] is None]
+        if failed:
+            raise RuntimeError('%s: scenarios %s terminated with %s (prices below the production costs violate the mill profit constraints)' % (step, failed[:10], results[failed[0]]['status']))
+
+    report = []
+    try:
+        #Wait-and-see pass, every scenario with its own design
+        results = evaluate([(scenario, None, None, None, None) for scenario in scenarios])
+        check(results, 'Progressive hedging iteration 0')
+        bound = float(np.dot(p, [result['bound'] for result in results]))
+        if rho is None:
+            rho = 0.1*abs(float(np.dot(p, [result['objective'] for result in results])))/max(n, 1)
+        rho = np.full(n, rho, dtype=float) if np.isscalar(rho) else np.asarray(rho, dtype=float)
+        w = np.zeros((len(scenarios), n))
+
+        for iteration in range(max_iter + 1):
+            x = np.array([result['values'] for result in results], dtype=float).reshape(len(scenarios), n)
+            xbar = p @ x
+            w += rho*(x - xbar)
+            convergence = float(p @ np.abs(x - xbar).sum(axis=1))
+            expected = float(np.dot(p, [result['objective'] for result in results]))
+            report.append({'iteration': iteration, 'time': time.time() - start, 'convergence': convergence, 'expected_objective': sm.sense*expected,
+                           'wait_and_see_bound': sm.sense*bound, 'designs': len({tuple(v) for v in x})})
+            if tee:
+                print('Progressive hedging iteration %d: convergence %.4f expected objective %.8e designs %d' % (iteration, convergence, sm.sense*expected, report[-1]['designs']))
+            if convergence <= tol or iteration == max_iter or (time_limit is not None and time.time() - start > time_limit):
+                break
+            results = evaluate([(scenario, list(w[s]), list(xbar), list(rho), None) for s, scenario in enumerate(scenarios)])
+            check(results, 'Progressive hedging iteration %d' % (iteration + 1))
+
+        #Design: the scenario solution closest to the mean, which is consistent (segments of invested plants only)
+        design = x[np.argmin(np.abs(x - xbar).sum(axis=1))]
+
+        #Lagrangian bound with the final multipliers, valid because their probability weighted sum is zero
+        results = evaluate([(scenario, list(w[s] - p @ w), None, None, None) for s, scenario in enumerate(scenarios)])
+        lagrangian_bound = float(np.dot(p, [result['bound'] for result in results]))
+
+        #Evaluate the design in every scenario
+        evaluation = evaluate([(scenario, None, None, None, list(design)) for scenario in scenarios])
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        _SCENARIO_MODEL = None
+
+    evaluation = pd.DataFrame({'scenario': range(len(scenarios)), 'probability': p, 'status': [result['status'] for result in evaluation],
+                               'objective': [sm.sense*result['objective'] if result['objective'] is not None else np.nan for result in evaluation]})
+    report = pd.DataFrame(report)
+    report['lagrangian_bound'] = sm.sense*lagrangian_bound
+    report['best_bound'] = sm.sense*max(bound, lagrangian_bound)
+    report['design_objective'] = float(np.dot(p, evaluation['objective'])) if evaluation['objective'].notna().all() else np.nan
+    if report_file is not None:
+        report.to_csv(report_file)
+
+    #Load the design into m
+    design = [int(val) for val in design]
+    variables = list(m.component_data_objects(pyo.Var))
+    for k, val in zip(_first_stage_positions(m, first_stage), design):
+        variables[k].set_value(val)
+    return dict(zip(names, design)), report, evaluation
+
+
+def evaluate_design(m, design, scenarios, solver='gurobi', gap=None, solver_options=None, workers=1):
+    '''
+    This function evaluates a fixed design in every scenario, e.g. the optimal design of the mean prices to compute the
+    value of the stochastic solution.
+
+    Inputs:
+
+            m: Pyomo model from create_supply_chain_model with the parameters varied by the scenarios mutable and the
+               fixes of the case applied
+            design: dictionary with the value of each first-stage variable by name, e.g. from solve_progressive_hedging
+            scenarios: list of scenario dictionaries, e.g. from sample_price_scenarios
+            solver: name of the MILP solver, one of solver_backends.SOLVER_OPTIONS
+            gap: relative MIP gap of the scenario solves
+            solver_options: dictionary of solver specific options passed to the solver
+            workers: number of processes solving scenarios in parallel (requires the fork start method)
+
+    Returns: pandas DataFrame with the objective of the design in every scenario
+    '''
+    global _SCENARIO_MODEL
+    sm = create_scenario_model(m, list({name.split('[')[0] for name in design}))
+    values = [design[x.name] for x in sm.first_stage_list]
+    _SCENARIO_MODEL = (sm, solver, gap, solver_options or {})
+    tasks = [(scenario, None, None, None, values) for scenario in scenarios]
+    try:
+        if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+                results = list(pool.map(_solve_scenario, tasks))
+        else:
+            results = [_solve_scenario(task) for task in tasks]
+    finally:
+        _SCENARIO_MODEL = None
+    return pd.DataFrame({'scenario': range(len(scenarios)), 'probability': [scenario.get('probability', 1/len(scenarios)) for scenario in scenarios],
+                         'status': [result['status'] for result in results],
+                         'objective': [sm.sense*result['objective'] if result['objective'] is not None else np.nan for result in results]})
@@ -0,0 +1,120 @@
+'''
+This file contains functions to load the results CSV files saved by the run scripts back into a supply chain model, and
+to check that the model still reproduces the objective of stored results (regression check after changes to
+create_sc_model_full).
+'''
+
+#Import the necessary packages
+import os
+
+import pandas as pd
+import pyomo.environ as pyo
+
+#Results files with the transported volumes, each column holds the volumes from the location in its header to the
+#locations in the row labels
+VOLUME_FILES = {
+    'vol_eth_sold': 'mill_to_mill_volumes.csv',
+    'vol_saf_sold_mills_air': 'mill_to_airport_volumes.csv',
+    'vol_eth_sold_air': 'mill_to_airport_volumes_eth.csv',
+    'vol_eth_sold_ref': 'mill_to_ref_vol_eth.csv',
+    'vol_saf_sold_mills_ref': 'mill_to_ref_vol_saf.csv',
+    'vol_saf_sold_ref_air': 'ref_to_air_vol_saf.csv',
+}
+
+#Columns of the key results files holding production variables, with the product they refer to
+MILL_PRODUCTS = {'et': 'et', 'etmk': 'etmk', 'etsaf': 'etsaf', 'etpc': 'etpc', 'etref': 'etref', 'eta': 'eta', 'etr': 'etr', 'j1': 'j1',
+                 'j2': 'j2', 'sug': 'sug', 'el': 'el', 'SAF': 'saf', 'SAF ref': 'saf ref', 'SAF air': 'saf air', 'g': 'g', 'd': 'd'}
+AIRPORT_PRODUCTS = {'et': 'et', 'SAF': 'saf', 'g': 'g', 'd': 'd'}
+REFINERY_PRODUCTS = {'blended SAF': 'blended saf', 'SAF': 'saf', 'g': 'g', 'd': 'd'}
+MARKET_PRODUCTS = {'jet fuel': 'f', 'gasoline': 'g', 'ethanol': 'et', 'sugar': 'sug'}
+
+
+def load_results_into_model(m, results_dir):
+    '''
+    This function sets the variables saved in the results files of a scenario to their saved values: all transported
+    volumes, the production at mills, airports and refineries and the global market purchases. Investment and CAPEX
+    surrogate variables are not saved and keep their values.
+
+    Inputs:
+
+            m: Pyomo model created by create_supply_chain_model with the data of the scenario
+            results_dir: directory of the scenario results
+
+    Returns: None
+    '''
+    for name, file in VOLUME_FILES.items():
+        volumes = pd.read_csv(os.path.join(results_dir, file), index_col=0).set_index('volumes')
+        var = getattr(m, name)
+        for origin in volumes.columns:
+            for destination, val in volumes[origin].items():
+                if (origin, destination) in var:
+                    var[origin, destination].set_value(float(val), skip_validation=True)
+
+    for file, label, var, products in (('key_results_mills.csv', 'mills', m.x, MILL_PRODUCTS),
+                                       ('key_results_air.csv', 'airports', m.v, AIRPORT_PRODUCTS),
+                                       ('key_results_ref.csv', 'refinery', m.x_ref, REFINERY_PRODUCTS)):
+        key_results = pd.read_csv(os.path.join(results_dir, file), index_col=0).set_index(label)
+        for column, product in products.items():
+            for location, val in key_results[column].items():
+                var[location, product].set_value(float(val), skip_validation=True)
+
+    key_results = pd.read_csv(os.path.join(results_dir, 'key_results_air.csv'), index_col=0)
+    for column, product in MARKET_PRODUCTS.items():
+        m.p[product].set_value(float(key_results[column].iloc[0]), skip_validation=True)
+
+
+def _reference_logistic_cost(m, distance, volumes):
+    '''
+    Evaluates sum((logistic_cost*distance + fixed_logistic_cost)*volume) term by term from the variable values, the
+    formulation of the logistic costs independent of their Pyomo expressions
+    '''
+    total = 0
+    for (i, j), volume in volumes.items():
+        if volume.value is not None:
+            total += (pyo.value(m.logistic_cost)*pyo.value(distance(i, j)) + pyo.value(m.fixed_logistic_cost))*volume.value
+    return total
+
+
+def objective_regression_check(m, results_dir, rtol=1e-9):
+    '''
+    This function checks that the model reproduces the objective of stored minimum supply chain cost results (Cases 1 and
+    2): it loads the results into the model and compares each aggregate logistic cost expression with the sum of its
+    indexed expressions and with a term by term evaluation, and the supply chain cost with the saved objective (the
+    CAPEX, whose surrogate variables are not saved, is taken from the results).
+
+    Inputs:
+
+            m: Pyomo model created by create_supply_chain_model with the data and blend of the scenario
+            results_dir: directory of the scenario results
+            rtol: relative tolerance of the comparisons
+
+    Returns: pandas DataFrame with the expected and model value, their relative difference and whether the check passed
+    '''
+    load_results_into_model(m, results_dir)
+    key_mills = pd.read_csv(os.path.join(results_dir, 'key_results_mills.csv'), index_col=0)
+    key_air = pd.read_csv(os.path.join(results_dir, 'key_results_air.csv'), index_col=0)
+    key_ref = pd.read_csv(os.path.join(results_dir, 'key_results_ref.csv'), index_col=0)
+
+    checks = []
+    def check(name, expected, value):
+        difference = abs(value - expected)/max(abs(expected), 1)
+        checks.append({'check': name, 'expected': expected, 'value': value, 'relative difference': difference, 'passed': difference <= rtol})
+
+    #Aggregate logistic costs against their indexed expressions and the term by term formulation
+    mill_pairs = {(i, j): m.vol_eth_sold[i, j] for i in m.MILLS for j in m.MILLS if i != j}
+    mill_airports = {(a, i): m.vol_saf_sold_mills_air[i, a] for i in m.MILLS for a in m.AIRPORTS}
+    mill_airports_eth = {(a, i): m.vol_eth_sold_air[i, a] for i in m.MILLS for a in m.AIRPORTS}
+    check('mill to mill logistic cost', _reference_logistic_cost(m, lambda i, j: m.mill_distance[i, j], mill_pairs), pyo.value(m.mill_to_mill_logistic_cost))
+    check('mill to mill logistic cost (indexed)', sum(pyo.value(m.individual_mill_to_mill_log_cost[j]) for j in m.MILLS), pyo.value(m.mill_to_mill_logistic_cost))
+    check('mill to airport logistic cost', _reference_logistic_cost(m, lambda a, i: m.airport_distance[a, i], mill_airports)
+          + _reference_logistic_cost(m, lambda a, i: m.airport_distance[a, i], mill_airports_eth), pyo.value(m.mill_to_airport_logistic_cost))
+    check('mill to airport logistic cost (indexed)', sum(pyo.value(m.individual_mill_to_airport_log_cost[j]) for j in m.MILLS), pyo.value(m.mill_to_airport_logistic_cost))
+
+    #Total logistic cost and objective against the saved results
+    logistic = (pyo.value(m.mill_to_mill_logistic_cost) + pyo.value(m.mill_to_airport_logistic_cost) + pyo.value(m.mill_to_ref_logistic_cost)
+                + pyo.value(m.ref_to_air_logistic_cost))
+    check('total logistic cost', float(key_ref['total logistic'].iloc[0]), logistic)
+    capex = key_mills['CAPEX'].sum() + key_air['CAPEX'].sum() + key_ref['CAPEX'].sum()
+    objective = pyo.value(m.opex_sum) + logistic + capex + pyo.value(m.additional_costs) + sum(pyo.value(m.s[i]) for i in m.MILLS)
+    check('objective', float(key_ref['objective'].iloc[0]), objective)
+    return pd.DataFrame(checks)
@@ -0,0 +1,132 @@
+'''
+This file contains functions to detect dominated and interchangeable mills in a supply chain model and to add symmetry
+breaking constraints on the SAF investment decisions (m.y) of interchangeable mills, which remove the equivalent designs
+a MILP solver otherwise has to branch through before it can prove optimality.
+
+Mill a dominates mill b when both are ethanol (or annexed) mills with the same sugarcane capacity and a is no further than
+b from every other mill, airport and refinery. Dominance alone does not order the investments: swapping a and b moves the
+ethanol shipments of the mill that does not invest (to investing mills, refineries and airports) to the longer distances
+of b, which can increase the logistic cost and break the profit floor of b. Mills that dominate each other (identical
+data and distances) are interchangeable: swapping them maps every design to one with the same cost, so y[b] <= y[a] keeps
+an optimal design and is the only constraint added. The base case data has no interchangeable mills, so the
+constraints only speed up mill sets with duplicated mills.
+'''
+
+#Import the necessary packages
+import numpy as np
+import pandas as pd
+import pyomo.environ as pyo
+
+
+def _mill_profiles(m):
+    '''
+    Returns the mill names and an array with one row per mill holding its distances to the other mills (in both
+    directions), the airports and the refineries, units: km
+    '''
+    mills = list(m.MILLS)
+    distances = m.mill_distance.extract_values()
+    mill_distances = np.array([[distances[i, j] for j in mills] for i in mills], dtype=float)
+    airport_distances = np.array([[pyo.value(m.airport_distance[a, i]) for a in m.AIRPORTS] for i in mills], dtype=float).reshape(len(mills), -1)
+    ref_distances = np.array([[pyo.value(m.mill_ref_distance[r, i]) for r in m.REFINERIES] for i in mills], dtype=float).reshape(len(mills), -1)
+    return mills, np.hstack([mill_distances, mill_distances.T, airport_distances, ref_distances])
+
+
+def _mill_class(m, i):
+    '''
+    Returns the data a mill must share with the mills it is compared to: its type, capacity, reference profits and the
+    fixed values of its investment and incentive variables
+    '''
+    fixed = tuple(var[i].value if var[i].fixed else None for var in (m.y, m.s))
+    return (i in m.ETHANOL_MILLS, pyo.value(m.Sugarcane_Capacity[i]), pyo.value(m.reference_profit1a[i]), pyo.value(m.reference_profit1b[i])) + fixed
+
+
+def dominance_pairs(m, tol=0.0, interchangeable_only=False):
+    '''
+    This function finds the pairs of mills where one dominates the other. With tol > 0 mills up to tol km further from
+    some location still count as dominated, and mills up to tol km apart from every location as interchangeable.
+
+    Inputs:
+
+            m: Pyomo model created by create_supply_chain_model, after fixing the investment and incentive variables of the case
+            tol: distance tolerance of the comparisons, units: km
+            interchangeable_only: only return the pairs of interchangeable mills
+
+    Returns: pandas DataFrame with the dominant and dominated mill of each pair and whether they are interchangeable,
+             without the pairs implied by two others
+    '''
+    mills, profiles = _mill_profiles(m)
+    n = len(mills)
+
+    #Order the mills so that a dominant mill always comes first (fewer total km, then name)
+    order = sorted(range(n), key=lambda k: (profiles[k].sum(), str(mills[k])))
+    position = {k: p for p, k in enumerate(order)}
+
+    classes = {}
+    for k in range(n):
+        classes.setdefault(_mill_class(m, mills[k]), []).append(k)
+
+    dominated = {}
+    for members in classes.values():
+        if len(members) < 2:
+            continue
+        members = np.array(members)
+        for a in members:
+            #Distances of a against every other mill of its class, ignoring the distances between a and b
+            comparison = profiles[a][None, :] <= profiles[members] + tol
+            for column in (a, n + a):
+                comparison[:, column] = True
+            comparison[np.arange(len(members)), members] = True
+            comparison[np.arange(len(members)), n + members] = True
+            for b in members[comparison.all(axis=1)]:
+                if b != a and position[a] < position[b]:
+                    dominated.setdefault(a, set()).add(b)
+
+    #Interchangeable mills have the same distances to every other location and in both directions between them
+    def interchangeable(a, b):
+        return bool(np.all(np.abs(np.delete(profiles[a] - profiles[b], [a, b, n + a, n + b])) <= tol) and abs(profiles[a][b] - profiles[b][a]) <= tol)
+    if interchangeable_only:
+        dominated = {a: {b for b in members if interchangeable(a, b)} for a, members in dominated.items()}
+
+    #Drop the pairs implied by a chain of two others
+    pairs = []
+    for a in sorted(dominated, key=position.get):
+        implied = set().union(*(dominated.get(b, set()) for b in dominated[a]))
+        for b in sorted(dominated[a] - implied, key=position.get):
+            pairs.append({'dominant': mills[a], 'dominated': mills[b], 'interchangeable': interchangeable(a, b)})
+    return pd.DataFrame(pairs, columns=['dominant', 'dominated', 'interchangeable'])
+
+
+def add_symmetry_breaking(m, tol=0.0):
+    '''
+    This function adds the constraint y[dominated] <= y[dominant] for every pair of interchangeable mills of
+    dominance_pairs to the ConstraintList m.symmetry_breaking. Leave it out of diversity analyses such as the integer cuts,
+    which should also find the designs that only differ by interchangeable mills.
+
+    Inputs:
+
+            m: Pyomo model created by create_supply_chain_model, after fixing the investment and incentive variables of the case
+            tol: distance tolerance of the comparisons, units: km (0 only pairs mills with identical data, which keeps the
+                 optimal objective value; above 0 near-identical mills are also paired and the optimum may be cut off)
+
+    Returns: pandas DataFrame of the interchangeable pairs
+    '''
+    remove_symmetry_breaking(m)
+    pairs = dominance_pairs(m, tol, interchangeable_only=True)
+    m.symmetry_breaking = pyo.ConstraintList()
+    for dominant, dominated in zip(pairs['dominant'], pairs['dominated']):
+        m.symmetry_breaking.add(m.y[dominated] <= m.y[dominant])
+    return pairs
+
+
+def remove_symmetry_breaking(m):
+    '''
+    This function removes the constraints added by add_symmetry_breaking, if any.
+
+    Inputs:
+
+            m: Pyomo model
+
+    Returns: None
+    '''
+    if hasattr(m, 'symmetry_breaking'):
+        m.del_component(m.symmetry_breaking)
@@ -0,0 +1,132 @@
+'''
+This file contains functions to generate synthetic data workbooks of any size for create_supply_chain_model, to study how
+the build time, memory and solve time scale with the supply chain network. The synthetic mills, airports and refineries are
+copies of the Brazilian ones (capacity, mill type, reference profits, SAF demand) at randomly displaced locations, and all
+distances are great circle distances between the new locations, like in the base case data.
+'''
+
+#Import the necessary packages
+import numpy as np
+import pandas as pd
+
+#Mean radius of the Earth used for the great circle distances, units: km
+EARTH_RADIUS = 6371.0088
+
+
+def haversine_distances(lat1, lon1, lat2, lon2):
+    '''
+    This function calculates the great circle distances between two sets of locations.
+
+    Inputs:
+
+            lat1, lon1: arrays of the latitudes and longitudes of the first set of locations, units: degrees
+            lat2, lon2: arrays of the latitudes and longitudes of the second set of locations, units: degrees
+
+    Returns: array of distances with one row per location of the first set and one column per location of the second set,
+             units: km
+    '''
+    lat1, lon1 = np.radians(np.asarray(lat1, dtype=float))[:, None], np.radians(np.asarray(lon1, dtype=float))[:, None]
+    lat2, lon2 = np.radians(np.asarray(lat2, dtype=float))[None, :], np.radians(np.asarray(lon2, dtype=float))[None, :]
+    h = np.sin((lat2 - lat1)/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((lon2 - lon1)/2)**2
+    return 2*EARTH_RADIUS*np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+
+def _sample(rng, n, size, spread):
+    '''
+    Picks n template rows out of size (without repeats while possible) and random location offsets in degrees, the first
+    copy of each template keeps its location when n <= size
+    '''
+    if n <= size:
+        rows = np.sort(rng.choice(size, n, replace=False))
+        return rows, np.zeros(n), np.zeros(n)
+    rows = np.concatenate([np.arange(size), rng.choice(size, n - size, replace=True)])
+    offsets = rng.normal(0, spread, (2, n))
+    offsets[:, :size] = 0
+    return rows, offsets[0], offsets[1]
+
+
+def generate_synthetic_data(path, n_mills, n_airports=29, n_refineries=9, seed=0, spread=0.5, template='base_case_data_with_demands.xlsx',
+                            mills_file='335MillsLatitudesLongitudes.xlsx', airports_file='AirportsLatitudeLongitude.xlsx',
+                            refineries_file='OilRefineriesLatLong.xlsx'):
+    '''
+    This function writes a synthetic data workbook with the sheets create_supply_chain_model reads.
+
+    Inputs:
+
+            path: path of the excel workbook to write
+            n_mills: number of sugarcane mills
+            n_airports: number of airports with a SAF demand
+            n_refineries: number of oil refineries
+            seed: seed of the random number generator, the same seed always gives the same workbook
+            spread: standard deviation of the location of the added copies around their template, units: degrees
+            template: base case data workbook the mill, airport and refinery data and the conversions and prices are taken from
+            mills_file: workbook with the mill latitudes and longitudes (same mill order as template)
+            airports_file: workbook with the airport names (NOME), latitudes and longitudes
+            refineries_file: workbook with the refinery names, latitudes and longitudes
+
+    Returns: pandas DataFrame with the name, type, latitude and longitude of every location, also saved in the locations sheet
+    '''
+    rng = np.random.default_rng(seed)
+    data = pd.read_excel(template, sheet_name=None)
+
+    #Template Mills, Airports and Refineries with their Locations
+    mills = data['mill_capacities'].copy()
+    mills['ethanol'] = mills['mill'].isin(data['eth_mills']['Ethanol Mills'])
+    mills['reference1a'] = data['reference1a']['Reference Mill Profs 1a']
+    mills['reference1b'] = data['reference1b']['Reference Mill Profs 1b']
+    mill_locations = pd.read_excel(mills_file)
+    mills['Latitude'] = mill_locations['Latitude']
+    mills['Longitude'] = mill_locations['Longitude']
+
+    airport_locations = pd.read_excel(airports_file)
+    airport_locations.index = airport_locations['NOME'].str.strip()
+    airports = data['airport_demand'].copy()
+    airports['Latitude'] = airport_locations.loc[airports['airport'].str.strip(), 'Latitude'].values
+    airports['Longitude'] = airport_locations.loc[airports['airport'].str.strip(), 'Longitude'].values
+
+    refinery_locations = pd.read_excel(refineries_file)
+    refinery_locations.index = refinery_locations['name'].str.strip()
+    refineries = data['refineries'].copy()
+    refineries['Latitude'] = refinery_locations.loc[refineries['ref'].str.strip(), 'Latitude'].values
+    refineries['Longitude'] = refinery_locations.loc[refineries['ref'].str.strip(), 'Longitude'].values
+
+    #Synthetic Copies
+    synthetic = {}
+    for key, df, n, prefix in (('mills', mills, n_mills, 'Mill'), ('airports', airports, n_airports, 'Airport'), ('refineries', refineries, n_refineries, 'Refinery')):
+        rows, dlat, dlon = _sample(rng, n, len(df), spread)
+        copy = df.iloc[rows].reset_index(drop=True)
+        copy['Latitude'] = copy['Latitude'] + dlat
+        copy['Longitude'] = copy['Longitude'] + dlon
+        copy['name'] = ['%s %0*d' % (prefix, len(str(n)), k + 1) for k in range(n)]
+        synthetic[key] = copy
+    mills, airports, refineries = synthetic['mills'], synthetic['airports'], synthetic['refineries']
+
+    #Distances
+    def distance_sheet(rows, columns):
+        distances = haversine_distances(rows['Latitude'], rows['Longitude'], columns['Latitude'], columns['Longitude'])
+        return pd.DataFrame(distances, index=rows['name'].values, columns=columns['name'].values)
+
+    sheets = {
+        'mill_distances': distance_sheet(mills, mills),
+        'eth_mills': pd.DataFrame({'Ethanol Mills': mills.loc[mills['ethanol'], 'name']}),
+        'annexed_mills': pd.DataFrame({'Annexed Mills': mills.loc[~mills['ethanol'], 'name']}),
+        'reference1a': pd.DataFrame({'Reference Mill Profs 1a': mills['reference1a']}),
+        'reference1b': pd.DataFrame({'Reference Mill Profs 1b': mills['reference1b']}),
+        'airport_distances': distance_sheet(mills, airports),
+        'mill_capacities': pd.DataFrame({'mill': mills['name'], 'capacity': mills['capacity']}),
+        'conversions': data['conversions'],
+        'airport_demand': pd.DataFrame({'airport': airports['name'], 'demand': airports['demand']}),
+        'prices': data['prices'],
+        'mill_ref_distances': distance_sheet(mills, refineries),
+        'refineries': pd.DataFrame({'ref': refineries['name']}),
+        'ref_air_distances': distance_sheet(airports, refineries),
+    }
+    locations = pd.concat([pd.DataFrame({'name': df['name'], 'type': key, 'Latitude': df['Latitude'], 'Longitude': df['Longitude']})
+                           for key, df in synthetic.items()], ignore_index=True)
+
+    with pd.ExcelWriter(path) as writer:
+        for sheet, df in sheets.items():
+            #Distance sheets keep the row names in an unnamed first column like the base case data
+            df.to_excel(writer, sheet_name=sheet, index=sheet.endswith('distances'))
+        locations.to_excel(writer, sheet_name='locations', index=False)
+    return locations
@@ -0,0 +1,252 @@
+'''
+This file contains a post-solve validation of the supply chain results: the mass balances, shipment balances, demand
+satisfaction and mill profit floors of create_sc_model_full are re-checked with array arithmetic on a snapshot of the
+results, and the largest violation of each constraint family is reported.
+
+A snapshot is a dictionary of numpy arrays extracted once, either from the results CSV files of a scenario or from a
+solved model, so the checks take time linear in the size of the results and can be run on every scenario of a sweep and
+on every stored results folder.
+'''
+
+#Import the necessary packages
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pyo
+
+from stored_results import VOLUME_FILES
+
+#Columns of key_results_mills.csv in the snapshot, with the model product they hold
+MILL_COLUMNS = {'et': 'et', 'etmk': 'etmk', 'etref': 'etref', 'etsaf': 'etsaf', 'eta': 'eta', 'etr': 'etr', 'etpc': 'etpc',
+                'SAF': 'saf', 'SAF ref': 'saf ref', 'SAF air': 'saf air', 'sug': 'sug', 'el': 'el'}
+
+#Columns of key_results_air.csv with the global market purchases, by product
+MARKET_COLUMNS = {'jet fuel': 'f', 'gasoline': 'g', 'ethanol': 'et', 'sugar': 'sug'}
+
+#Volume variables by kind of origin and destination
+VOLUME_KINDS = {'vol_eth_sold': ('mills', 'mills'),
+                'vol_saf_sold_mills_air': ('mills', 'airports'),
+                'vol_eth_sold_air': ('mills', 'airports'),
+                'vol_eth_sold_ref': ('mills', 'refineries'),
+                'vol_saf_sold_mills_ref': ('mills', 'refineries'),
+                'vol_saf_sold_ref_air': ('refineries', 'airports')}
+
+
+def _numeric(df):
+    '''
+    Returns the values of a DataFrame as a float array, non-numeric cells as 0
+    '''
+    values = pd.to_numeric(df.to_numpy().ravel(), errors='coerce').astype(float).reshape(df.shape)
+    return np.nan_to_num(values)
+
+
+def load_snapshot(results_dir):
+    '''
+    This function reads the results CSV files of a scenario into a snapshot.
+
+    Inputs:
+
+            results_dir: directory of the scenario results
+
+    Returns: dictionary with the facility names ('mills', 'airports', 'refineries'), the mill production by column of
+             key_results_mills.csv ('x'), the volumes of each variable as origin by destination arrays, the airport SAF
+             production ('v_saf'), the refinery SAF and blended SAF ('ref_saf', 'blended_saf'), the conventional jet fuel
+             purchased ('p_f') and all global market purchases ('p', by product), the individual mill profits ('profit')
+             and their cost scale ('profit_scale'), the CAPEX of the plants ('capex', by kind of facility) and the mill
+             incentives ('s')
+    '''
+    key_mills = pd.read_csv(os.path.join(results_dir, 'key_results_mills.csv'), index_col=0)
+    key_air = pd.read_csv(os.path.join(results_dir, 'key_results_air.csv'), index_col=0)
+    key_ref = pd.read_csv(os.path.join(results_dir, 'key_results_ref.csv'), index_col=0)
+    snapshot = {'mills': key_mills['mills'].tolist(), 'airports': key_air['airports'].tolist(), 'refineries': key_ref['refinery'].tolist()}
+    snapshot['x'] = {column: key_mills[column].to_numpy(dtype=float) for column in MILL_COLUMNS}
+    snapshot['profit'] = key_mills['individual profit'].to_numpy(dtype=float)
+    snapshot['profit_scale'] = (key_mills['OPEX'].abs() + key_mills['CAPEX'].abs() + key_mills['logistic'].abs()).to_numpy(dtype=float)
+    snapshot['v_saf'] = key_air['SAF'].to_numpy(dtype=float)
+    snapshot['p_f'] = float(key_air['jet fuel'].iloc[0])
+    snapshot['p'] = {product: float(key_air[column].iloc[0]) for column, product in MARKET_COLUMNS.items()}
+    snapshot['capex'] = {kind: key[column].to_numpy(dtype=float) for kind, key, column in (('mills', key_mills, 'CAPEX'), ('airports', key_air, 'CAPEX'), ('refineries', key_ref, 'CAPEX'))}
+    snapshot['s'] = key_mills['incentives'].to_numpy(dtype=float) if 'incentives' in key_mills else np.zeros(len(key_mills))
+    snapshot['ref_saf'] = key_ref['SAF'].to_numpy(dtype=float)
+    snapshot['blended_saf'] = key_ref['blended SAF'].to_numpy(dtype=float)
+
+    #Each column of the volume files holds the volumes from the location in its header to the locations in the row labels
+    for name, file in VOLUME_FILES.items():
+        origins, destinations = VOLUME_KINDS[name]
+        volumes = pd.read_csv(os.path.join(results_dir, file), index_col=0).set_index('volumes')
+        volumes = volumes.reindex(index=snapshot[destinations], columns=snapshot[origins])
+        snapshot[name] = _numeric(volumes).T
+    return snapshot
+
+
+def model_snapshot(m):
+    '''
+    This function extracts the snapshot of a solved model, with the SAF demands and blend requirement of the model.
+
+    Inputs:
+
+            m: Pyomo model created by create_supply_chain_model with a loaded solution
+
+    Returns: dictionary with the items of load_snapshot and the airport SAF demands ('demand') and the blend ('blend')
+    '''
+    def values(var, index):
+        return np.fromiter((var[k].value or 0.0 for k in index), dtype=float, count=len(index))
+
+    snapshot = {'mills': list(m.MILLS), 'airports': list(m.AIRPORTS), 'refineries': list(m.REFINERIES)}
+    snapshot['x'] = {column: values(m.x, [(i, product) for i in m.MILLS]) for column, product in MILL_COLUMNS.items()}
+    snapshot['profit'] = np.array([pyo.value(m.ind_profs[i]) for i in m.MILLS])
+    snapshot['profit_scale'] = np.array([abs(pyo.value(m.individual_opex_mill[i])) + abs(pyo.value(m.CAPEX[i])) + abs(pyo.value(m.individual_mill_to_mill_log_cost[i]))
+                                         + abs(pyo.value(m.individual_mill_to_airport_log_cost[i])) + abs(pyo.value(m.individual_mill_to_ref_log_cost[i])) for i in m.MILLS])
+    snapshot['v_saf'] = values(m.v, [(a, 'saf') for a in m.AIRPORTS])
+    snapshot['p_f'] = float(m.p['f'].value or 0.0)
+    snapshot['p'] = {product: float(m.p[product].value or 0.0) for product in m.GLOBAL_MARKET}
+    snapshot['capex'] = {'mills': np.array([pyo.value(m.CAPEX[i]) for i in m.MILLS]), 'airports': np.array([pyo.value(m.CAPEX_air[a]) for a in m.AIRPORTS]),
+                         'refineries': np.array([pyo.value(m.CAPEX_ref[r]) for r in m.REFINERIES])}
+    snapshot['s'] = values(m.s, list(m.MILLS))
+    snapshot['ref_saf'] = values(m.x_ref, [(r, 'saf') for r in m.REFINERIES])
+    snapshot['blended_saf'] = values(m.x_ref, [(r, 'blended saf') for r in m.REFINERIES])
+    for name, (origins, destinations) in VOLUME_KINDS.items():
+        index = [(i, j) for i in snapshot[origins] for j in snapshot[destinations]]
+        snapshot[name] = values(getattr(m, name), index).reshape(len(snapshot[origins]), len(snapshot[destinations]))
+    #Shipments of a mill to itself are not part of the model
+    np.fill_diagonal(snapshot['vol_eth_sold'], 0.0)
+    snapshot['demand'] = np.array([pyo.value(m.individual_saf_demand[a]) for a in m.AIRPORTS])
+    snapshot['blend'] = pyo.value(m.blend_requirement)
+    return snapshot
+
+
+def validate_snapshot(snapshot, demand=None, blend=None, tol=1e-5):
+    '''
+    This function checks the constraint families of a snapshot. Equality violations are the absolute residuals, the profit
+    floor violation is the amount below 0. Each violation is also given relative to the largest term of its constraint
+    (at least 1), which is compared with tol.
+
+    Inputs:
+
+            snapshot: dictionary from load_snapshot or model_snapshot
+            demand: dictionary or Series of the SAF demand of each airport (None for the demands of the snapshot)
+            blend: SAF blend requirement (None for the blend of the snapshot, or inferred from the jet fuel purchased)
+            tol: relative violation tolerance
+
+    Returns: pandas DataFrame with the number of constraints, the largest absolute and relative violation, the location
+             of the largest violation and whether it passed for each constraint family
+    '''
+    x = snapshot['x']
+    mills, airports, refineries = snapshot['mills'], snapshot['airports'], snapshot['refineries']
+    checks = []
+
+    def check(family, residual, scale, names):
+        residual, scale = np.abs(np.atleast_1d(residual)), np.maximum(np.abs(np.atleast_1d(scale)), 1)
+        relative = residual/scale
+        worst = int(np.argmax(relative)) if len(relative) else 0
+        checks.append({'constraint': family, 'count': len(residual), 'max violation': residual.max() if len(residual) else 0.0,
+                       'max relative violation': relative.max() if len(relative) else 0.0,
+                       'location': names[worst] if len(residual) else None, 'passed': bool((relative <= tol).all())})
+
+    #Mill mass balances
+    destinations = x['etmk'] + x['etref'] + x['etsaf'] + x['eta'] + x['etr']
+    check('ethanol_destinations', x['et'] - destinations, np.maximum(x['et'], destinations), mills)
+    check('saf_split', x['SAF'] - x['SAF air'] - x['SAF ref'], x['SAF'], mills)
+
+    #Shipment balances of the mills and refineries
+    check('ethanol_sold', x['etref'] - snapshot['vol_eth_sold'].sum(axis=1), x['etref'], mills)
+    check('ethanol_purchased', x['etpc'] - snapshot['vol_eth_sold'].sum(axis=0), x['etpc'], mills)
+    check('eth_sold_air', x['eta'] - snapshot['vol_eth_sold_air'].sum(axis=1), x['eta'], mills)
+    check('eth_sold_ref', x['etr'] - snapshot['vol_eth_sold_ref'].sum(axis=1), x['etr'], mills)
+    check('saf_sold_ref', x['SAF ref'] - snapshot['vol_saf_sold_mills_ref'].sum(axis=1), x['SAF ref'], mills)
+    check('saf_sold_mills', x['SAF air'] - snapshot['vol_saf_sold_mills_air'].sum(axis=1), x['SAF air'], mills)
+    saf_ref = snapshot['vol_saf_sold_mills_ref'].sum(axis=0)
+    check('blended_saf', snapshot['blended_saf'] - snapshot['ref_saf'] - saf_ref, snapshot['blended_saf'], refineries)
+    check('saf_sold_refs', snapshot['blended_saf'] - snapshot['vol_saf_sold_ref_air'].sum(axis=1), snapshot['blended_saf'], refineries)
+
+    #Demand satisfaction, the SAF delivered to an airport from refineries, mills and its own plant
+    if demand is None:
+        demand = snapshot.get('demand')
+    elif not isinstance(demand, np.ndarray):
+        demand = pd.Series(demand).reindex(airports).to_numpy(dtype=float)
+    if demand is not None:
+        total = demand.sum()
+        if blend is None:
+            blend = snapshot.get('blend')
+        if blend is None:
+            #Blend implied by the jet fuel purchased, which leaves jet_demand unchecked
+            blend = 1 - snapshot['p_f']/total
+        else:
+            check('jet_demand', snapshot['p_f'] - total*(1 - blend), total*(1 - blend), ['total'])
+        delivered = snapshot['vol_saf_sold_ref_air'].sum(axis=0) + snapshot['vol_saf_sold_mills_air'].sum(axis=0) + snapshot['v_saf']
+        check('saf_demand', delivered - demand*blend, demand*blend, airports)
+
+    #Profit floors of the mills and nonnegative volumes
+    check('pos_profs', np.minimum(snapshot['profit'], 0), snapshot['profit_scale'], mills)
+    negative = [(name, np.minimum(snapshot[name], 0).min()) for name in VOLUME_KINDS]
+    check('nonnegative volumes', np.array([value for name, value in negative]), 1, [name for name, value in negative])
+    return pd.DataFrame(checks)
+
+
+def _folder_blend(results_dir):
+    '''
+    Returns the blend requirement in the name of a results folder (blend_10 or an integer cut folder under 10), None if
+    there is none
+    '''
+    match = re.search(r'blend_(\d+)', os.path.basename(results_dir))
+    if match is None and os.path.basename(os.path.dirname(results_dir)).isdigit():
+        return int(os.path.basename(os.path.dirname(results_dir)))/100
+    return int(match.group(1))/100 if match else None
+
+
+def find_results_folders(root):
+    '''
+    This function finds the scenario results folders (with a key_results_mills.csv file) under a directory.
+
+    Inputs:
+
+            root: directory to search
+
+    Returns: sorted list of the paths of the results folders
+    '''
+    folders = []
+    for path, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if not d.startswith('.') and d != '__pycache__']
+        if 'key_results_mills.csv' in files:
+            folders.append(path)
+    return sorted(folders)
+
+
+def validate_all(root=None, data='base_case_data_with_demands.xlsx', tol=1e-5, report_file=None):
+    '''
+    This function validates every results folder under a directory against the SAF demands of a data workbook, with the
+    blend requirement in the folder names (inferred from the jet fuel purchased when a name has none).
+
+    Inputs:
+
+            root: directory to search (None for the directory of this file)
+            data: data workbook with the airport_demand sheet
+            tol: relative violation tolerance
+            report_file: path of a CSV file to save the checks of all folders to (None to skip)
+
+    Returns: pandas DataFrame with one row per folder: the largest relative violation of each constraint family, whether
+             all checks passed and the validation time
+    '''
+    if root is None:
+        root = os.path.dirname(os.path.realpath(__file__))
+    demand = pd.read_excel(data, sheet_name='airport_demand').set_index('airport')['demand']
+    checks, summary = [], []
+    for folder in find_results_folders(root):
+        begin = time.time()
+        try:
+            result = validate_snapshot(load_snapshot(folder), demand, _folder_blend(folder), tol)
+        except (OSError, KeyError, ValueError) as e:
+            summary.append({'folder': os.path.relpath(folder, root), 'passed': False, 'error': str(e), 'time': time.time() - begin})
+            continue
+        result.insert(0, 'folder', os.path.relpath(folder, root))
+        checks.append(result)
+        row = {'folder': os.path.relpath(folder, root), 'blend': _folder_blend(folder)}
+        row.update(result.set_index('constraint')['max relative violation'].to_dict())
+        row.update({'passed': bool(result['passed'].all()), 'time': time.time() - begin})
+        summary.append(row)
+    if report_file is not None and checks:
+        pd.concat(checks, ignore_index=True).to_csv(report_file)
+    return pd.DataFrame(summary)
@@ -0,0 +1,327 @@
+'''
+This file contains a fast what-if evaluator for a fixed SAF investment design, e.g. the optimal design of a stored
+scenario, over batches of parameter vectors.
+
+The design is the value of the investment binaries (y, y_ref, z) and of the binaries selecting the CAPEX segment of each
+plant (aux, aux_ref, aux_air). Two evaluations are available:
+    - evaluate_flows keeps the production and flows of a solution and recomputes the costs, revenues, objective and mill
+      profits of every parameter vector with array arithmetic. It covers the parameters that only enter the objective and
+      the profits (prices, costs, logistic costs, premiums and greenfield OPEX), and thousands of vectors take well under
+      a second.
+    - create_what_if_lp and solve_what_if fix the design, export the remaining flow LP once with model_export and re-solve
+      it for every parameter vector from the basis of the previous solve, so the flows adapt to the parameters (e.g. the
+      logistic costs, the conversions or the SAF demands). The patch of each vector is computed from the linear terms of
+      model_export instead of Pyomo expressions, batches of vectors are split across a process pool, and the shadow
+      prices of the demand constraints are reported for every vector as local sensitivities.
+'''
+
+#Import the necessary packages
+import itertools
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pyo
+
+from model_export import (export_base_model, parameter_terms, linear_parameter_terms, parameter_vector, read_base_model,
+                          linear_indices, apply_linear_patch, solve_base_model)
+from stochastic_prices import FIRST_STAGE
+
+#Parameters that only enter the objective and the mill profits, which evaluate_flows can change
+FLOW_PARAMETERS = ('price', 'cost', 'logistic_cost', 'fixed_logistic_cost', 'saf_premium', 'eth_prem', 'greenfield_opex_air', 'greenfield_opex_ref')
+
+#Investment binary, CAPEX segment binaries and CAPEX segment fractions by kind of facility
+INVESTMENTS = {'mills': ('y', 'aux', 'csi'), 'airports': ('z', 'aux_air', 'csi_air'), 'refineries': ('y_ref', 'aux_ref', 'csi_ref')}
+
+#Demand constraints whose shadow prices are reported by default in sensitivity studies
+DUAL_CONSTRAINTS = ('saf_demand', 'sugar_demand', 'ground_transport_demand')
+
+#LP of the fixed design and solve settings held by each worker process (set before the pool is forked), and the solver
+#of the worker with the LP read
+_WHAT_IF = None
+_WORKER_SOLVER = None
+
+
+def design_from_snapshot(m, snapshot, tol=1e-3):
+    '''
+    This function finds the design of a results snapshot from the SAF capacity of every plant: a plant is built when its
+    capacity is positive, and the CAPEX segment binary aux[i,b] is 1 when the capacity is above the breakpoint b+1 of
+    Saf_CAPEX_Inputs.
+
+    Inputs:
+
+            m: Pyomo model created by create_supply_chain_model with the breakpoints of the snapshot
+            snapshot: dictionary from validate_results.load_snapshot or validate_results.model_snapshot
+            tol: capacity tolerance (m3)
+
+    Returns: dictionary with the value of each first-stage variable by name, in the format of stochastic_prices
+    '''
+    inputs = [pyo.value(m.Saf_CAPEX_Inputs[k]) for k in m.INDEX_SET3]
+    capacities = {'mills': dict(zip(snapshot['mills'], snapshot['x']['SAF'])), 'airports': dict(zip(snapshot['airports'], snapshot['v_saf'])),
+                  'refineries': dict(zip(snapshot['refineries'], snapshot['ref_saf']))}
+    facilities = {'mills': m.MILLS, 'airports': m.AIRPORTS, 'refineries': m.REFINERIES}
+    design = {}
+    for kind, (build, segment, fraction) in INVESTMENTS.items():
+        for i in facilities[kind]:
+            capacity = capacities[kind].get(i, 0.0)
+            design[getattr(m, build)[i].name] = int(capacity > tol)
+            for b in m.INDEX_SET2:
+                design[getattr(m, segment)[i, b].name] = int(capacity > inputs[int(b) + 1] + tol)
+    return design
+
+
+def design_from_model(m):
+    '''
+    This function reads the design of a solved model.
+
+    Inputs:
+
+            m: Pyomo model created by create_supply_chain_model with a loaded solution
+
+    Returns: dictionary with the value of each first-stage variable by name
+    '''
+    return {x.name: int(round(x.value)) for name in FIRST_STAGE for x in getattr(m, name).values()}
+
+
+def fix_design(m, design):
+    '''
+    This function fixes the first-stage variables of a model to a design. The CAPEX segment fractions determined by the
+    design are fixed as well: all fractions of a plant that is not built are 0, and the fractions of a built plant are 1
+    below its last selected segment and 0 above the segment after it.
+
+    Inputs:
+
+            m: Pyomo model created by create_supply_chain_model
+            design: dictionary with the value of each first-stage variable by name, e.g. from design_from_snapshot
+
+    Returns: None
+    '''
+    variables = {x.name: x for name in FIRST_STAGE for x in getattr(m, name).values()}
+    for name, val in design.items():
+        variables[name].fix(val)
+
+    facilities = {'mills': m.MILLS, 'airports': m.AIRPORTS, 'refineries': m.REFINERIES}
+    for kind, (build, segment, fraction) in INVESTMENTS.items():
+        for i in facilities[kind]:
+            segments = [getattr(m, segment)[i, b] for b in m.INDEX_SET2]
+            if not getattr(m, build)[i].fixed or not all(x.fixed for x in segments):
+                continue
+            built = round(getattr(m, build)[i].value) == 1
+            selected = sum(round(x.value) for x in segments)
+            for j in m.INDEX_SET1:
+                if not built or int(j) > selected:
+                    getattr(m, fraction)[i, j].fix(0)
+                elif int(j) < selected:
+                    getattr(m, fraction)[i, j].fix(1)
+
+
+def _parameter_arrays(m, scenarios, names):
+    '''
+    Returns the value of every index of the named parameters in each scenario as arrays, by parameter name and index
+    '''
+    for scenario in scenarios:
+        for name in scenario:
+            if name != 'probability' and name not in names:
+                raise ValueError('Parameter %s changes the feasible flows, solve the fixed design LP with solve_what_if instead' % name)
+    arrays = {}
+    for name in names:
+        for index, p in getattr(m, name).items():
+            base = pyo.value(p)
+            arrays[name, index] = np.array([(scenario[name].get(index, base) if isinstance(scenario.get(name), dict) else scenario.get(name, base))
+                                            for scenario in scenarios], dtype=float)
+    return arrays
+
+
+def evaluate_flows(m, snapshot, scenarios):
+    '''
+    This function evaluates the flows of a solution at a batch of parameter vectors. The production, flows, market
+    purchases, CAPEX and incentives of the snapshot are kept, and the costs, revenues and mill profits are recomputed with
+    the formulas of create_supply_chain_model as array products over all scenarios at once.
+
+    Inputs:
+
+            m: Pyomo model created by create_supply_chain_model with the data of the snapshot (its parameter values are
+               the base of the scenarios and its distances are used)
+            snapshot: dictionary from validate_results.load_snapshot or validate_results.model_snapshot
+            scenarios: list of scenario dictionaries with values of FLOW_PARAMETERS, e.g. from
+                       stochastic_prices.sample_price_scenarios; missing parameters keep the values of m
+
+    Returns: pandas DataFrame with the objective, supply chain cost, total mill profit, logistic cost and additional costs
+             of every scenario, its smallest individual mill profit and the number of mills with a negative profit
+    '''
+    x = snapshot['x']
+    mills, airports, refineries = snapshot['mills'], snapshot['airports'], snapshot['refineries']
+
+    def distances(param, rows, columns):
+        return np.array([[pyo.value(param[i, j]) for j in columns] for i in rows], dtype=float)
+
+    #Distance weighted and total volumes shipped, by the mill paying for the shipment
+    mill_volumes = snapshot['vol_eth_sold'].copy()
+    np.fill_diagonal(mill_volumes, 0.0)
+    air_volumes = snapshot['vol_saf_sold_mills_air'] + snapshot['vol_eth_sold_air']
+    ref_volumes = snapshot['vol_saf_sold_mills_ref'] + snapshot['vol_eth_sold_ref']
+    shipped_km = ((distances(m.mill_distance, mills, mills)*mill_volumes).sum(axis=0) + (distances(m.airport_distance, airports, mills).T*air_volumes).sum(axis=1)
+                  + (distances(m.mill_ref_distance, refineries, mills).T*ref_volumes).sum(axis=1))
+    shipped = mill_volumes.sum(axis=0) + air_volumes.sum(axis=1) + ref_volumes.sum(axis=1)
+    ref_air_km = float((distances(m.ref_air_distance, refineries, airports)*snapshot['vol_saf_sold_ref_air']).sum())
+    ref_air = float(snapshot['vol_saf_sold_ref_air'].sum())
+
+    arrays = _parameter_arrays(m, scenarios, FLOW_PARAMETERS)
+    price = {product: arrays['price', product][:, None] for product in m.SELLING_PRODUCTS}
+    cost = {product: arrays['cost', product][:, None] for product in m.SELLING_PRODUCTS}
+    logistic_cost, fixed_logistic_cost = arrays['logistic_cost', None], arrays['fixed_logistic_cost', None]
+
+    #Individual mill terms, one row per scenario
+    opex_mill = cost['sug']*x['sug'] + cost['et']*x['et'] + cost['saf']*x['SAF'] + cost['el']*x['el']
+    logistic_mill = logistic_cost[:, None]*shipped_km + fixed_logistic_cost[:, None]*shipped
+    revenue = (price['sug']*x['sug'] + price['et']*x['etmk'] + (price['et'] + arrays['eth_prem', None][:, None])*(x['etr'] + x['etref'])
+               + price['el']*x['el'] + (price['saf'] + arrays['saf_premium', None][:, None])*x['SAF'])
+    individual_profit = revenue + snapshot['s'] - (opex_mill + price['et']*x['etpc'] + snapshot['capex']['mills'] + logistic_mill)
+
+    opex = opex_mill.sum(axis=1) + arrays['greenfield_opex_air', None]*snapshot['v_saf'].sum() + arrays['greenfield_opex_ref', None]*snapshot['ref_saf'].sum()
+    logistic = logistic_mill.sum(axis=1) + logistic_cost*ref_air_km + fixed_logistic_cost*ref_air
+    p = snapshot['p']
+    additional = arrays['price', 'sug']*p['sug'] + arrays['price', 'saf']*p['f'] + arrays['price', 'et']*p['et'] + arrays['price', 'g']*p['g']
+    capex = sum(values.sum() for values in snapshot['capex'].values())
+    sc_cost = opex + logistic + capex + additional + snapshot['s'].sum()
+    profit = individual_profit.sum(axis=1) - snapshot['s'].sum()
+
+    floor = 1e-6*np.maximum(snapshot['profit_scale'], 1.0)
+    return pd.DataFrame({'scenario': range(len(scenarios)), 'objective': sc_cost if m.objective.sense == pyo.minimize else profit,
+                         'sc cost': sc_cost, 'profit': profit, 'logistic': logistic, 'additional costs': additional,
+                         'min individual profit': individual_profit.min(axis=1), 'negative profit mills': (individual_profit < -floor).sum(axis=1)})
+
+
+def create_what_if_lp(m, design, params, path, duals=()):
+    '''
+    This function fixes a design in a model and exports the remaining flow LP once, with the terms of the varied
+    parameters as affine functions of the parameter values.
+
+    Inputs:
+
+            m: Pyomo model created by create_supply_chain_model with params mutable and the fixes of the case applied (its
+               first-stage variables stay fixed to the design)
+            design: dictionary with the value of each first-stage variable by name, e.g. from design_from_snapshot
+            params: names of the mutable parameters varied by the scenarios, e.g. ['logistic_cost', 'price']
+            path: path of the MPS file of the LP, e.g. what_if/case1_blend_10.mps.gz
+            duals: names of the constraints whose shadow prices are reported by solve_what_if, e.g. DUAL_CONSTRAINTS
+
+    Returns: dictionary with the export of model_export.export_base_model ('base'), the linear terms of
+             model_export.linear_parameter_terms ('linear'), the file path ('file') and the rows of each reported
+             constraint by name ('duals')
+    '''
+    fix_design(m, design)
+    base = export_base_model(m, path)
+    linear = linear_parameter_terms(m, parameter_terms(m, base, params), params)
+    dual_rows = {con.name: base['rows'].get(id(con), []) for name in duals for con in getattr(m, name).values()}
+    return {'base': base, 'linear': linear, 'file': path, 'duals': dual_rows}
+
+
+def sensitivity_grid(m, values, one_at_a_time=True):
+    '''
+    This function builds the scenarios of a parameter sensitivity study.
+
+    Inputs:
+
+            m: Pyomo model created by create_supply_chain_model
+            values: dictionary of the values of each parameter, by parameter name for scalar parameters or name[index]
+                    for an index of an indexed parameter, e.g. {'logistic_cost': [0.12, 0.16, 0.2],
+                    'Conversion[et_to_saf]': [0.5, 0.6]}
+            one_at_a_time: vary one parameter at a time from the values of m (True) or take every combination (False)
+
+    Returns: list of scenario dictionaries for solve_what_if
+    '''
+    keys = []
+    for key in values:
+        name, _, index = key.partition('[')
+        if index:
+            index = next(k for k in getattr(m, name) if str(k) == index[:-1])
+        keys.append((name, index if index != '' else None))
+
+    def scenario(pairs):
+        result = {}
+        for (name, index), val in pairs:
+            if index is None:
+                result[name] = val
+            else:
+                result.setdefault(name, {})[index] = val
+        return result
+
+    if one_at_a_time:
+        return [scenario([(key, val)]) for key, vals in zip(keys, values.values()) for val in vals]
+    return [scenario(zip(keys, vals)) for vals in itertools.product(*values.values())]
+
+
+def _solve_batch(batch):
+    '''
+    Solves the flow LP for a batch of (scenario position, parameter vector) pairs in a worker, which reads the LP file on
+    its first batch
+    '''
+    global _WORKER_SOLVER
+    what_if, solver_name, time_limit = _WHAT_IF
+    linear = what_if['linear']
+    if _WORKER_SOLVER is None:
+        solver = read_base_model(what_if['file'], solver_name)
+        _WORKER_SOLVER = (solver, linear_indices(solver, linear) if solver_name == 'highs' else None)
+    solver, indices = _WORKER_SOLVER
+    if solver_name == 'highs' and what_if['duals']:
+        positions = {name: k for k, name in enumerate(solver.getLp().row_names_)}
+
+    rows = []
+    for s, theta in batch:
+        start = time.time()
+        apply_linear_patch(solver, linear, theta, indices)
+        result = solve_base_model(solver, time_limit=time_limit, values=False)
+        row = {'scenario': s, 'status': result['status'], 'objective': result['objective'] if result['objective'] is not None else np.nan,
+               'iterations': solver.getInfo().simplex_iteration_count if solver_name == 'highs' else solver.IterCount}
+        #Shadow prices: change of the objective per unit of the right-hand side of each constraint (the sum over its rows),
+        #NaN without an optimal LP solution
+        row.update({name: np.nan for name in what_if['duals']})
+        if what_if['duals'] and result['objective'] is not None:
+            if solver_name == 'highs' and solver.getInfo().dual_solution_status == 2:
+                row_duals = solver.getSolution().row_dual
+                row.update({name: sum(row_duals[positions[label]] for label in labels) for name, labels in what_if['duals'].items() if labels})
+            elif solver_name != 'highs' and solver.Status == 2:
+                row.update({name: sum(solver.getConstrByName(label).Pi for label in labels) for name, labels in what_if['duals'].items() if labels})
+        row['time'] = time.time() - start
+        rows.append(row)
+    return rows
+
+
+def solve_what_if(what_if, scenarios, solver_name='highs', time_limit=None, workers=1, tee=False):
+    '''
+    This function re-solves the flow LP of a fixed design for every scenario. The scenarios are split into contiguous
+    batches solved in a process pool, each solve starting from the basis of the previous solve of its worker, and the
+    shadow prices of the constraints given to create_what_if_lp are reported for every scenario.
+
+    Inputs:
+
+            what_if: dictionary returned by create_what_if_lp
+            scenarios: list of scenario dictionaries with values of the parameters of create_what_if_lp, e.g. from
+                       sensitivity_grid
+            solver_name: 'highs' (highspy) or 'gurobi' (gurobipy)
+            time_limit: time limit of each solve in seconds
+            workers: number of processes solving batches in parallel (requires the fork start method)
+            tee: print the result of every scenario
+
+    Returns: pandas DataFrame with the solver status, objective, simplex iterations, time and shadow prices (one column
+             per reported constraint) of every scenario
+    '''
+    global _WHAT_IF, _WORKER_SOLVER
+    thetas = [parameter_vector(what_if['linear'], scenario) for scenario in scenarios]
+    _WHAT_IF = (what_if, solver_name, time_limit)
+    try:
+        if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            batches = [[(s, thetas[s]) for s in positions] for positions in np.array_split(np.arange(len(scenarios)), min(4*workers, len(scenarios)))]
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+                rows = [row for batch in pool.map(_solve_batch, batches) for row in batch]
+        else:
+            rows = _solve_batch(list(enumerate(thetas)))
+    finally:
+        _WHAT_IF, _WORKER_SOLVER = None, None
+    if tee:
+        for row in rows:
+            print('Scenario %d: %s, objective %s, %.2f s' % (row['scenario'], row['status'], row['objective'], row['time']))
+    return pd.DataFrame(rows)